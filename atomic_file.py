@@ -0,0 +1,27 @@
+"""
+Atomic replacement of the bot's JSON files.
+
+Several bot processes (launcher.py workers) save the same cache files.
+Each write goes to its own temporary file in the target's directory and
+is then renamed over the target, so readers always see one complete
+version and concurrent writers never write into each other's temporary
+file. The last rename wins.
+"""
+import os
+import tempfile
+
+
+def replace_file(path, text):
+    """Write `text` to `path` atomically; raises OSError and leaves no temporary file behind."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,95 @@
+"""
+Audio sources for voice playback.
+
+FFmpegPCMAudio decodes a stream to PCM and discord.py then re-encodes every
+20 ms frame to Opus in the bot process. YouTube's usual bestaudio formats
+are already Opus (in WebM), so for those the factory builds an
+FFmpegOpusAudio with codec copy instead: FFmpeg only remuxes the packets
+and nothing is encoded on our side.
+
+Whether a stream is Opus is usually known up front: yt-dlp reports the
+codec of the format it picked (passed to create() as `codec`), and
+YouTube's Opus itags are recognised by URL. Anything else is probed once
+with ffprobe and the answer is cached per format (the itag for googlevideo
+URLs, otherwise host and path), since stream URLs of the same format
+always carry the same codec. A probe that fails or times out falls back
+to the PCM path.
+"""
+import asyncio
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+# YouTube formats that are Opus in WebM
+OPUS_ITAGS = frozenset({'249', '250', '251'})
+OPUS_CODECS = frozenset({'opus', 'libopus'})
+
+
+# FFmpeg reads 5 MB / 5 s of input by default before it starts decoding. The
+# streams played here hold one audio track whose headers come first, so a
+# small probe is enough and the first frame comes out much sooner.
+FAST_PROBE_OPTIONS = '-probesize 65536 -analyzeduration 0'
+
+
+def before_options(url):
+    if not url.startswith(('http://', 'https://')):
+        return FAST_PROBE_OPTIONS  # local files need none of the network options
+    options = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
+    # HLS playlists (e.g. SoundCloud) need the segment protocols whitelisted, and keep
+    # the default probing since the first bytes read are the playlist, not audio
+    if '.m3u8' in url:
+        return options + ' -protocol_whitelist file,http,https,tcp,tls,crypto -allowed_extensions ALL'
+    return f'{options} {FAST_PROBE_OPTIONS}'
+
+
+def probe_key(url):
+    """Streams with the same key share a codec, so one probe answers for all of them."""
+    parsed = urlparse(url)
+    itag = parse_qs(parsed.query).get('itag')
+    if itag and parsed.hostname and parsed.hostname.endswith('googlevideo.com'):
+        return f'itag:{itag[0]}'
+    return f'{parsed.hostname}{parsed.path}'
+
+
+class AudioSourceFactory:
+    def __init__(self, opus_source, pcm_source, probe, probe_timeout=5.0, cache_size=4096):
+        self.opus_source = opus_source  # (url, codec=..., before_options=...) -> AudioSource
+        self.pcm_source = pcm_source  # (url, before_options=...) -> AudioSource
+        self.probe = probe  # async (url) -> (codec, bitrate)
+        self.probe_timeout = probe_timeout
+        self.cache_size = cache_size
+        self.passthrough = 0
+        self.transcoded = 0
+        self.probes = 0
+        self._codecs = OrderedDict()
+
+    async def codec(self, url):
+        """The stream's audio codec, or None if it could not be determined."""
+        key = probe_key(url)
+        if key.startswith('itag:') and key[5:] in OPUS_ITAGS:
+            return 'opus'
+        if key in self._codecs:
+            self._codecs.move_to_end(key)
+            return self._codecs[key]
+        self.probes += 1
+        try:
+            codec, _ = await asyncio.wait_for(self.probe(url), self.probe_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Not cached: the next stream of this format gets another chance
+            print(f'Could not probe audio codec of {key}: {e!r}')
+            return None
+        self._codecs[key] = codec
+        while len(self._codecs) > self.cache_size:
+            self._codecs.popitem(last=False)
+        return codec
+
+    async def create(self, url, codec=None):
+        """An audio source for `url`; pass `codec` when it is already known to skip the lookup."""
+        options = before_options(url)
+        if (codec or await self.codec(url)) in OPUS_CODECS:
+            self.passthrough += 1
+            # discord.py copies the Opus packets as they are for codec 'opus'
+            return self.opus_source(url, codec='opus', before_options=options)
+        self.transcoded += 1
+        return self.pcm_source(url, before_options=options)
@@ -0,0 +1,214 @@
+"""
+On-disk Opus copies of the tracks a bot plays most.
+
+Every play of a track with a page URL is counted. Once a track has been
+played `min_plays` times, a background FFmpeg job stores its audio as an
+Ogg Opus file (copying the packets when the stream already is Opus,
+encoding otherwise). From then on start_playing plays the local file: no
+extraction, no expiring googlevideo URL and no network round trips before
+the first frame.
+
+Files are kept up to `max_bytes` in total and evicted least recently
+played first. The index (stored files and pending play counts) is a JSON
+file next to them, so the cache survives restarts. Without a directory
+(AUDIO_CACHE_DIR unset) the cache is disabled and every method is a no-op.
+
+A cache directory belongs to one process: load() removes files its index
+does not know. Under launcher.py, from_env() gives every worker process
+its own subdirectory and an even share of AUDIO_CACHE_MAX_MB, so the
+workers together stay within the configured size.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import shlex
+import threading
+from collections import OrderedDict
+
+from atomic_file import replace_file
+from audio import OPUS_CODECS, before_options
+from track_cache import normalize_query
+
+STORE_BITRATE = '128k'  # Discord plays at most 128 kbps for boosted servers, 64 kbps by default
+INDEX_FILE = 'index.json'
+
+
+class AudioCache:
+    def __init__(self, directory=None, max_bytes=1024 ** 3, min_plays=3, codec=None, store=None,
+                 max_counted=10000, concurrency=2):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.codec = codec  # async (url) -> codec name or None, to copy Opus streams instead of encoding them
+        self.store = store or self._ffmpeg_store  # async (url, path) -> None
+        self.max_counted = max_counted
+        self.hits = 0
+        self.stored = 0
+        self.evicted = 0
+        self._files = OrderedDict()  # key -> {'file': name, 'size': bytes}, least recently played first
+        self._plays = OrderedDict()  # key -> plays, for tracks not stored yet
+        self._tasks = {}  # key -> running store task
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        directory = os.getenv('AUDIO_CACHE_DIR') or None
+        max_bytes = int(os.getenv('AUDIO_CACHE_MAX_MB', '1024')) * 1024 * 1024
+        worker_id = os.getenv('SHARD_WORKER_ID')
+        if directory is not None and worker_id is not None:
+            directory = os.path.join(directory, f'worker-{worker_id}')
+            max_bytes //= max(1, int(os.getenv('SHARD_WORKERS', '1')))
+        return cls(directory, max_bytes=max_bytes, min_plays=int(os.getenv('AUDIO_CACHE_MIN_PLAYS', '3')), **kwargs)
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def __len__(self):
+        return len(self._files)
+
+    def __contains__(self, page_url):
+        return page_url is not None and normalize_query(page_url) in self._files
+
+    @property
+    def total_bytes(self):
+        return sum(entry['size'] for entry in self._files.values())
+
+    def path_for(self, page_url):
+        """The local file for a track's page URL, or None if it is not stored."""
+        if not self.enabled or page_url is None:
+            return None
+        key = normalize_query(page_url)
+        entry = self._files.get(key)
+        if entry is None:
+            return None
+        path = os.path.join(self.directory, entry['file'])
+        if not os.path.exists(path):
+            del self._files[key]
+            return None
+        self._files.move_to_end(key)
+        self.hits += 1
+        return path
+
+    def record_play(self, page_url, stream_url):
+        """Count a play streamed from `stream_url`; store the track once it is popular enough."""
+        if not self.enabled or page_url is None:
+            return
+        key = normalize_query(page_url)
+        if key in self._files or key in self._tasks:
+            return
+        plays = self._plays.pop(key, 0) + 1
+        self._plays[key] = plays
+        while len(self._plays) > self.max_counted:
+            self._plays.popitem(last=False)
+        if plays >= self.min_plays:
+            task = asyncio.create_task(self._store(key, stream_url))
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._tasks.pop(key, None))
+
+    async def _store(self, key, stream_url):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20] + '.ogg'
+        path = os.path.join(self.directory, name)
+        part_path = f'{path}.part'
+        async with self._semaphore:
+            try:
+                await self.store(stream_url, part_path)
+                os.replace(part_path, path)
+                size = os.path.getsize(path)
+            except asyncio.CancelledError:
+                self._remove(part_path)
+                raise
+            except Exception as e:
+                # Counted again from zero, so a track that cannot be stored is not retried on every play
+                self._plays.pop(key, None)
+                self._remove(part_path)
+                print(f'Could not store {key} in the audio cache: {e}')
+                return
+        self._plays.pop(key, None)
+        self._files[key] = {'file': name, 'size': size}
+        self.stored += 1
+        self._evict()
+        await asyncio.to_thread(self._write_index, self._index())
+
+    def _evict(self):
+        total = self.total_bytes
+        while self._files and total > self.max_bytes:
+            _, entry = self._files.popitem(last=False)
+            total -= entry['size']
+            self._remove(os.path.join(self.directory, entry['file']))
+            self.evicted += 1
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f'Could not remove {path}: {e}')
+
+    async def _ffmpeg_store(self, url, path):
+        codec = await self.codec(url) if self.codec is not None else None
+        audio = ['-c:a', 'copy'] if codec in OPUS_CODECS else ['-c:a', 'libopus', '-b:a', STORE_BITRATE]
+        process = await asyncio.create_subprocess_exec(
+            'ffmpeg', '-nostdin', '-loglevel', 'error', *shlex.split(before_options(url)),
+            '-i', url, '-vn', *audio, '-f', 'ogg', '-y', path,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            _, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode != 0:
+            raise RuntimeError(stderr.decode(errors='replace').strip()[-300:] or f'ffmpeg exited with {process.returncode}')
+
+    def _index(self):
+        return {'files': dict(self._files), 'plays': dict(self._plays)}
+
+    def load(self):
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE), 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            index = {}
+        except (OSError, ValueError) as e:
+            print(f'Could not read audio cache index: {e}')
+            index = {}
+        for key, entry in index.get('files', {}).items():
+            if os.path.exists(os.path.join(self.directory, entry['file'])):
+                self._files[key] = entry
+        for key, plays in index.get('plays', {}).items():
+            self._plays.setdefault(key, plays)
+        # Files of interrupted stores and of entries the index no longer knows
+        known = {entry['file'] for entry in self._files.values()} | {INDEX_FILE}
+        for name in os.listdir(self.directory):
+            if name not in known and (name.endswith('.ogg') or name.endswith('.part')):
+                self._remove(os.path.join(self.directory, name))
+        self._evict()
+
+    def save(self):
+        if self.enabled:
+            self._write_index(self._index())
+
+    def _write_index(self, index):
+        with self._lock:
+            try:
+                replace_file(os.path.join(self.directory, INDEX_FILE), json.dumps(index))
+            except OSError as e:
+                print(f'Could not write audio cache index: {e}')
+
+    async def close(self):
+        """Stop stores in progress and write the index."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.enabled:
+            await asyncio.to_thread(self._write_index, self._index())
@@ -0,0 +1,286 @@
+"""
+Benchmark the voice playback pipeline without connecting to Discord.
+
+    python bench_voice.py --guilds 1,10,50,100 --seconds 20
+
+Every simulated guild gets a local audio file queued and goes through
+bot.start_playing, so sources are built by the same make_source as in
+production (FFmpeg, Opus passthrough or PCM). Playback runs on
+discord.py's own AudioPlayer thread against a FakeVoiceClient. The fake
+does what VoiceClient.send_audio_packet does before the network: it
+Opus-encodes PCM frames and encrypts every packet. Then it records when
+each packet would have gone out.
+
+Reported for each guild count and source kind:
+- CPU per stream: bot process plus FFmpeg children, in % of one core;
+- RSS: the bot process and its largest live FFmpeg child during playback
+  (the child is read from /proc, so it is n/a elsewhere);
+- encode: mean time to encode and encrypt one 20 ms frame;
+- jitter: p50/p99 deviation of packet spacing from 20 ms;
+- drops: share of packets later than --drop-ms behind schedule, which a
+  listener's jitter buffer would skip.
+
+Sample files (an Opus/WebM tone and an AAC tone for the PCM path) are
+generated with ffmpeg unless --file is given.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from state import MemoryState, StateWriter
+from timeline import percentile
+
+FRAME_LENGTH = 0.02  # one Opus frame, as sent by discord.py's AudioPlayer
+
+
+class FrameRecorder:
+    """Packet timings of one simulated voice connection."""
+
+    def __init__(self):
+        self.sent = []  # perf_counter() of every packet
+        self.encode_time = 0.0
+
+    def stats(self, drop_after):
+        if len(self.sent) < 2:
+            return {'frames': len(self.sent), 'drops': 0, 'deviations': []}
+        start = self.sent[0]
+        late = sum(1 for index, sent in enumerate(self.sent) if sent - (start + index * FRAME_LENGTH) > drop_after)
+        deviations = [abs(b - a - FRAME_LENGTH) for a, b in zip(self.sent, self.sent[1:])]
+        return {'frames': len(self.sent), 'drops': late, 'deviations': deviations}
+
+
+class _FakeVoiceWebSocket:
+    async def speak(self, state=True):
+        pass
+
+
+class _FakeConnection:
+    def __init__(self, loop):
+        self.loop = loop
+
+
+class FakeVoiceClient:
+    """The parts of discord.VoiceClient that start_playing and AudioPlayer use, minus the UDP socket."""
+
+    def __init__(self, loop):
+        import nacl.secret
+        import nacl.utils
+        self.client = _FakeConnection(loop)
+        self.ws = _FakeVoiceWebSocket()
+        self._connected = threading.Event()
+        self._connected.set()
+        self._box = nacl.secret.SecretBox(nacl.utils.random(nacl.secret.SecretBox.KEY_SIZE))
+        self.encoder = None
+        self.recorder = FrameRecorder()
+        self._player = None
+
+    def play(self, source, *, after=None):
+        from discord import opus
+        from discord.player import AudioPlayer
+        if not source.is_opus():
+            self.encoder = opus.Encoder()
+        self._player = AudioPlayer(source, self, after=after)
+        self._player.start()
+
+    def send_audio_packet(self, data, *, encode=True):
+        started = time.perf_counter()
+        if encode:
+            data = self.encoder.encode(data, self.encoder.SAMPLES_PER_FRAME)
+        # Stands in for the xsalsa20_poly1305 encryption of every voice packet
+        self._box.encrypt(data)
+        now = time.perf_counter()
+        self.recorder.encode_time += now - started
+        self.recorder.sent.append(now)
+
+    def is_playing(self):
+        return self._player is not None and self._player.is_playing()
+
+    def is_paused(self):
+        return self._player is not None and self._player.is_paused()
+
+    def stop(self):
+        if self._player is not None:
+            self._player.stop()
+
+    def join(self):
+        if self._player is not None:
+            self._player.join()
+
+
+class _FakeFollowup:
+    async def send(self, *args, **kwargs):
+        pass
+
+
+class FakeInteraction:
+    followup = _FakeFollowup()
+
+
+def make_samples(directory, seconds):
+    """Generate an Opus/WebM tone (passthrough path) and an AAC tone (PCM path)."""
+    samples = {}
+    for kind, name, codec in (('opus', 'tone.webm', 'libopus'), ('pcm', 'tone.m4a', 'aac')):
+        path = os.path.join(directory, name)
+        subprocess.run(
+            ['ffmpeg', '-loglevel', 'error', '-y', '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+             '-ac', '2', '-ar', '48000', '-c:a', codec, '-b:a', '128k', path],
+            check=True,
+        )
+        samples[kind] = path
+    return samples
+
+
+def proc_rss_mb(pid='self'):
+    """Current RSS of a process from /proc, or None if it cannot be read."""
+    try:
+        with open(f'/proc/{pid}/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def largest_child_rss_mb():
+    """RSS of the largest live child process (an FFmpeg player), or None without /proc."""
+    try:
+        pids = [name for name in os.listdir('/proc') if name.isdigit()]
+    except OSError:
+        return None
+    largest = 0.0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat', encoding='ascii', errors='replace') as f:
+                stat = f.read()
+        except OSError:
+            continue  # exited since listdir
+        # The command name is in parentheses and may contain spaces; state and ppid follow it
+        if int(stat[stat.rindex(')') + 2:].split()[1]) == os.getpid():
+            largest = max(largest, proc_rss_mb(pid) or 0.0)
+    return largest
+
+
+def current_rss_mb():
+    rss = proc_rss_mb()
+    if rss is not None:
+        return rss
+    # Peak instead of current where /proc is not available (ru_maxrss is bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def cpu_seconds(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def run_level(bot, path, guilds, seconds, drop_after):
+    loop = asyncio.get_running_loop()
+    voice_clients = {}
+    self_cpu = cpu_seconds(resource.RUSAGE_SELF)
+    child_cpu = cpu_seconds(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+
+    for index in range(guilds):
+        guild_id = 900_000 + index
+        bot.queues[guild_id] = bot.new_guild_queue(guild_id)
+        bot.queues[guild_id].append(bot.Track(path, f'bench {index}'))
+        voice_clients[guild_id] = FakeVoiceClient(loop)
+        await bot.start_playing(FakeInteraction(), guild_id, voice_clients[guild_id], 'bench')
+
+    await asyncio.sleep(seconds / 2)
+    rss = current_rss_mb()
+    # Sampled while this level's players run: ru_maxrss of RUSAGE_CHILDREN would be the peak of
+    # every child reaped so far, sample generation and earlier levels included
+    ffmpeg_rss = largest_child_rss_mb()
+    await asyncio.sleep(seconds / 2)
+
+    for voice_client in voice_clients.values():
+        voice_client.stop()
+    # Joining the player threads also waits for FFmpeg to be killed and reaped
+    await asyncio.to_thread(lambda: [voice_client.join() for voice_client in voice_clients.values()])
+    elapsed = time.perf_counter() - started
+    # Let the after callbacks' (empty) next-track transitions finish
+    await asyncio.sleep(0.5)
+    for guild_id in voice_clients:
+        bot.queues.pop(guild_id, None)
+        bot.currently_playing.pop(guild_id, None)
+
+    total_cpu = cpu_seconds(resource.RUSAGE_SELF) - self_cpu + cpu_seconds(resource.RUSAGE_CHILDREN) - child_cpu
+    frames = drops = 0
+    encode_time = 0.0
+    deviations = []
+    for voice_client in voice_clients.values():
+        stats = voice_client.recorder.stats(drop_after)
+        frames += stats['frames']
+        drops += stats['drops']
+        deviations.extend(stats['deviations'])
+        encode_time += voice_client.recorder.encode_time
+    return {
+        'guilds': guilds,
+        'cpu_per_stream': 100 * total_cpu / elapsed / guilds,
+        'rss_mb': rss,
+        'ffmpeg_rss_mb': ffmpeg_rss,
+        'encode_ms': 1000 * encode_time / frames if frames else 0.0,
+        'jitter_p50_ms': 1000 * (percentile(deviations, 0.5) or 0.0),
+        'jitter_p99_ms': 1000 * (percentile(deviations, 0.99) or 0.0),
+        'drop_rate': drops / frames if frames else 0.0,
+        'frames': frames,
+    }
+
+
+def print_row(kind, result):
+    ffmpeg_rss = 'n/a' if result['ffmpeg_rss_mb'] is None else f"{result['ffmpeg_rss_mb']:.0f}MB"
+    print(f"{kind:<5} {result['guilds']:>6} {result['cpu_per_stream']:>9.1f}% {result['rss_mb']:>8.0f}MB "
+          f"{ffmpeg_rss:>11} {result['encode_ms']:>8.3f}ms "
+          f"{result['jitter_p50_ms']:>6.2f}/{result['jitter_p99_ms']:<6.2f}ms {100 * result['drop_rate']:>6.2f}%")
+
+
+async def run(args):
+    # bot reads its configuration at import time; nothing here logs in to Discord
+    import bot
+    bot.client.loop = asyncio.get_running_loop()  # normally set when the client starts
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Queues and settings go to a throwaway state, never to settings.db or STATE_REDIS_URL
+        bot.state_backend = MemoryState(os.path.join(directory, 'settings.db'))
+        bot.settings_storage = bot.state_backend.settings
+        bot.state_writer = StateWriter(bot.state_backend)
+        await bot.settings_storage.start()
+        samples = {'file': args.file} if args.file else make_samples(directory, args.seconds + 10)
+        print(f"{'path':<5} {'guilds':>6} {'cpu/stream':>10} {'bot RSS':>10} {'ffmpeg RSS':>11} "
+              f"{'encode':>10} {'jitter p50/p99':>15} {'drops':>7}")
+        results = []
+        try:
+            for kind, path in samples.items():
+                for guilds in args.guilds:
+                    result = await run_level(bot, path, guilds, args.seconds, args.drop_ms / 1000)
+                    result['path'] = kind
+                    results.append(result)
+                    print_row(kind, result)
+        finally:
+            await bot.state_writer.close()
+            await bot.state_backend.close()
+    print(f'Sources: {bot.audio_sources.passthrough} passed through, {bot.audio_sources.transcoded} transcoded')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--guilds', default='1,10,50,100', type=lambda text: [int(part) for part in text.split(',')],
+                        help='comma-separated numbers of simultaneous guilds')
+    parser.add_argument('--seconds', type=float, default=20.0, help='playback time per level')
+    parser.add_argument('--drop-ms', type=float, default=40.0, help='lateness after which a packet counts as dropped')
+    parser.add_argument('--file', help='play this audio file instead of the generated samples')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
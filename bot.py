@@ -1,11 +1,11 @@
 import asyncio
+import contextlib
 import re
 from urllib.parse import urlparse
 import discord
 from discord import app_commands
 import discord.opus 
-import requests
-import json
+import fetcher
 from dotenv import load_dotenv
 import os
 from typing import Final as fnl
@@ -16,15 +16,38 @@ import yt_dlp
 
 from discord.ext import commands 
 from discord.ext import menus
-import sqlite3
+from state import StateWriter, create_state
+from extraction import ExtractionService
+from track_cache import TrackCache
+from guild_queue import GuildQueue, QueueFull, Track
+from playlists import PlaylistError, iter_playlist, playlist_kind
+from prefetch import Prefetcher, needs_refresh
+from transitions import TransitionScheduler
+from valorant_catalog import SkinCatalog
+from pagination import EMBEDS_PER_MESSAGE, paginate
+from content_pool import ContentPool
+from caching import Fresh, cache_stats, cached, default_backend, utc_today
+from search_engine import search_key
+from shards import ShardConfig
+from log_dispatcher import LogDispatcher
+from audio import AudioSourceFactory
+from audio_cache import AudioCache
+from timeline import PlayTimeline, TimelineStats
+from formats import NoAudioFormat, audio_codec, bitrate_cap, is_flat, select_audio
 import datetime
+import math
+import signal
+import time
+from collections import Counter
 from discord import Embed, Colour
 import platform
 
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
-client = discord.Client(intents=intents)
+# SHARD_IDS/SHARD_COUNT are set by launcher.py; without them this process runs every shard
+shard_config = ShardConfig.from_env()
+client = discord.AutoShardedClient(intents=intents, shard_ids=shard_config.shard_ids, shard_count=shard_config.shard_count)
 tree = app_commands.CommandTree(client)
 
 
@@ -38,80 +61,156 @@ TOKEN: fnl[str] = os.getenv('DISCORD_TOKEN')
 
 
 
-conn = sqlite3.connect('settings.db')
-c = conn.cursor()
-c.execute('''
-    CREATE TABLE IF NOT EXISTS settings (
-        guild_id INTEGER PRIMARY KEY,
-        welcome_channel_id INTEGER
-    )
-''')
-
-def add_log_channel_column():
-    try:
-        c.execute('''
-            ALTER TABLE settings
-            ADD COLUMN log_channel_id INTEGER
-        ''')
-        conn.commit()
-        print('Log channel column added successfully')
-    except Exception as e:
-        print(f'Error adding log channel column: {e}')
-
-add_log_channel_column()
-
-def set_welcome_channel(guild_id, channel_id):
+# Settings, queues and now-playing live in Redis when STATE_REDIS_URL is set (shared by all processes)
+state_backend = create_state('settings.db')
+settings_storage = state_backend.settings  # .errors: sqlite3.Error, or the Redis client's errors
+state_writer = StateWriter(state_backend)
+###Path to your cookies file
+cookies_file_path = os.path.join(os.path.dirname(__file__), 'cookies.txt')
+
+# yt-dlp option sets; the extraction pool keeps ready YoutubeDL instances for each one
+ydl_strategies = {
+    # First attempt for /play
+    'youtube': {
+        'format': 'bestaudio/best',
+        'noplaylist': True,
+        'quiet': False,  # Set to False to see detailed output
+        'geo_bypass': True,
+        'nocheckcertificate': True,
+        'cookiefile': cookies_file_path,  # Add the cookies file here
+        'verbose': True,
+        'extractor_retries': 5,
+        'ignoreerrors': True,
+        'skip_download': True,
+        'source_address': '0.0.0.0',  # Bind to all interfaces
+        'socket_timeout': 30,
+        'extract_flat': True,
+        'default_search': 'ytsearch',
+        'no_warnings': False,
+        'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36',
+        'referer': 'https://www.youtube.com/'
+    },
+    # /play fallback when the first attempt fails
+    'youtube_fallback': {
+        'format': 'bestaudio/best',
+        'quiet': False,
+        'no_warnings': False,
+        'nocheckcertificate': True,
+        'extract_flat': 'in_playlist',
+        'default_search': 'ytsearch',
+        'skip_download': True
+    },
+    # Use invidious as alternative
+    'invidious': {
+        'format': 'bestaudio/best',
+        'quiet': False,
+        'no_warnings': False,
+        'extract_flat': 'in_playlist',
+        'default_search': 'ytsearch',
+        'skip_download': True,
+        'extractor_args': {'youtubedl': {'skip': ['youtube']}}
+    },
+    # Re-resolving just the stream URL of a cached track from its page URL
+    'youtube_stream': {
+        'format': 'bestaudio/best',
+        'noplaylist': True,
+        'quiet': True,
+        'geo_bypass': True,
+        'nocheckcertificate': True,
+        'cookiefile': cookies_file_path,
+        'skip_download': True,
+        'socket_timeout': 30,
+    },
+    # Listing a playlist: titles and page URLs only, streams are resolved later
+    'youtube_playlist': {
+        'extract_flat': 'in_playlist',
+        'noplaylist': False,
+        'quiet': True,
+        'ignoreerrors': True,
+        'nocheckcertificate': True,
+        'cookiefile': cookies_file_path,
+        'skip_download': True,
+        'socket_timeout': 30,
+    },
+    # Use SoundCloud or other alternative sources (/playalt)
+    'soundcloud': {
+        'format': 'bestaudio/best[protocol^=http]',  # Prefer HTTP protocols over HLS
+        'quiet': False,
+        'no_warnings': False,
+        'nocheckcertificate': True,
+        'skip_download': True,
+        'default_search': 'scsearch',  # Use SoundCloud search
+        'extractor_args': {'youtubedl': {'skip': ['youtube']}},  # Skip YouTube
+        'prefer_insecure': True,
+        'legacy_server_connect': True,  # Try legacy connection method
+    },
+    # Jamendo (free music) for /playdirect
+    'jamendo': {
+        'format': 'bestaudio/best',
+        'quiet': False,
+        'default_search': 'jamendosearch',
+        'skip_download': True,
+    },
+}
+
+extractor = ExtractionService(ydl_strategies)
+track_cache = TrackCache('track_cache.json', maxsize=int(os.getenv('TRACK_CACHE_SIZE', '1000')))
+
+# Per-guild copy of the settings table. It is loaded once at startup and
+# written through by the set_* helpers, so event handlers never hit SQLite.
+settings_cache = {}
+
+async def load_settings_cache():
+    await settings_storage.start()
+    # Only the guilds on this process's shards; the other processes load their own
+    all_settings = await settings_storage.load_all()
+    settings_cache.update({guild_id: settings for guild_id, settings in all_settings.items() if shard_config.owns(guild_id)})
+    print(f'Loaded settings for {len(settings_cache)} guild(s)')
+
+def _cached_settings(guild_id):
+    return settings_cache.setdefault(guild_id, {'welcome_channel_id': None, 'log_channel_id': None})
+
+async def set_welcome_channel(guild_id, channel_id):
     print(f'Setting welcome channel: guild_id={guild_id}, channel_id={channel_id}')
     try:
-        c.execute('''
-            INSERT OR REPLACE INTO settings (guild_id, welcome_channel_id)
-            VALUES (?, ?)
-        ''', (guild_id, channel_id))
-        conn.commit()
+        await settings_storage.update_settings(guild_id, welcome_channel_id=channel_id)
+        _cached_settings(guild_id)['welcome_channel_id'] = channel_id
         print('Welcome channel set successfully')
-    except Exception as e:
+    except settings_storage.errors as e:
         print(f'Error setting welcome channel: {e}')
 
 def get_welcome_channel(guild_id):
-    c.execute('''
-        SELECT welcome_channel_id
-        FROM settings
-        WHERE guild_id = ?
-    ''', (guild_id,))
-    result = c.fetchone()
-    return result[0] if result else None
-
-def set_log_channel(guild_id, channel_id):
+    settings = settings_cache.get(guild_id)
+    return settings['welcome_channel_id'] if settings else None
+
+async def set_log_channel(guild_id, channel_id):
     print(f'Setting log channel: guild_id={guild_id}, channel_id={channel_id}')
     try:
-        c.execute('''
-            INSERT OR REPLACE INTO settings (guild_id, log_channel_id)
-            VALUES (?, ?)
-        ''', (guild_id, channel_id))
-        conn.commit()
+        await settings_storage.update_settings(guild_id, log_channel_id=channel_id)
+        _cached_settings(guild_id)['log_channel_id'] = channel_id
         print('Log channel set successfully')
-    except Exception as e:
+    except settings_storage.errors as e:
         print(f'Error setting log channel: {e}')
 
 def get_log_channel(guild_id):
-    c.execute('''
-        SELECT log_channel_id
-        FROM settings
-        WHERE guild_id = ?
-    ''', (guild_id,))
-    result = c.fetchone()
-    return result[0] if result else None
+    settings = settings_cache.get(guild_id)
+    return settings['log_channel_id'] if settings else None
+
+VALORANT_SKINS_URL = 'https://valorant-api.com/v1/weapons/skins'
 
-def search_val_skin(skin_name):
-    response = requests.get('https://valorant-api.com/v1/weapons/skins')
-    data = response.json()
+skin_catalog = SkinCatalog(
+    lambda etag: fetcher.get_json_if_changed(VALORANT_SKINS_URL, etag),
+    'valorant_skins.json',
+    ttl=int(os.getenv('VALORANT_CATALOG_TTL', 24 * 3600)),
+)
 
-    matching_skins = []
-    for skin in data['data']:
-        if skin_name.lower() in skin['displayName'].lower():
-            matching_skins.append(skin)
+# Upstream results are cached in Redis when CACHE_REDIS_URL is set, otherwise in process memory
+nasa_backend = default_backend(maxsize=int(os.getenv('NASA_CACHE_SIZE', 256)))
+apod_backend = default_backend('apod_cache.json')
 
-    return matching_skins
+async def search_val_skin(skin_name):
+    # An in-memory index lookup: a cache in front of it would only cost a round trip and go stale
+    return await skin_catalog.search(skin_name)
 
 class LogChannelMenu(menus.Menu):
     async def send_initial_message(self, ctx, channel):
@@ -119,7 +218,7 @@ class LogChannelMenu(menus.Menu):
 
     @menus.button('📝')
     async def on_set_log_channel(self, payload):
-        set_log_channel(payload.guild_id, payload.channel_id)
+        await set_log_channel(payload.guild_id, payload.channel_id)
         await self.message.edit(content=f'Successfully set the log channel to <#{payload.channel_id}>.')
 
 class WelcomeChannelMenu(menus.Menu):
@@ -128,64 +227,144 @@ class WelcomeChannelMenu(menus.Menu):
 
     @menus.button('📝')
     async def on_set_welcome_channel(self, payload):
-        set_welcome_channel(payload.guild_id, payload.channel_id)
+        await set_welcome_channel(payload.guild_id, payload.channel_id)
         await self.message.edit(content=f'Successfully set the welcome channel to <#{payload.channel_id}>.')
 
-def get_meme():
-    response = requests.get('https://meme-api.com/gimme')
-    json_data = json.loads(response.text)
-    return json_data['url']
-
-def get_insult():
-    response = requests.get('https://evilinsult.com/generate_insult.php?lang=en&type=json')
-    if response.status_code == 200:
-        data = response.json()
-        return data['insult']
-    else:
-        return 'Error: Could not retrieve insult.'
-
-def get_advice():
-    response = requests.get('https://api.adviceslip.com/advice')
-    json_data = json.loads(response.text)
-    return json_data['slip']['advice']
+class EmbedPager(discord.ui.View):
+    """Previous/next buttons that swap a message between pages of embeds."""
+
+    def __init__(self, pages, owner_id, timeout=180):
+        super().__init__(timeout=timeout)
+        self.pages = pages
+        self.owner_id = owner_id
+        self.current = 0
+        self.message = None
+        self.update_buttons()
+
+    def update_buttons(self):
+        self.previous_page.disabled = self.current == 0
+        self.next_page.disabled = self.current == len(self.pages) - 1
+        self.page_label.label = f'{self.current + 1}/{len(self.pages)}'
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("Only the person who ran the command can change pages.", ephemeral=True)
+            return False
+        return True
+
+    async def show_page(self, interaction: discord.Interaction):
+        self.update_buttons()
+        # Editing through the button interaction's own response costs no extra API call
+        await interaction.response.edit_message(embeds=self.pages[self.current], view=self)
+
+    @discord.ui.button(label='◀', style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.current = max(0, self.current - 1)
+        await self.show_page(interaction)
+
+    @discord.ui.button(label='1/1', style=discord.ButtonStyle.secondary, disabled=True)
+    async def page_label(self, interaction: discord.Interaction, button: discord.ui.Button):
+        pass
+
+    @discord.ui.button(label='▶', style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.current = min(len(self.pages) - 1, self.current + 1)
+        await self.show_page(interaction)
+
+    async def on_timeout(self):
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+MEME_BATCH_SIZE = 10
+
+# Random-content fetchers return a list of items for the content pools below
+async def get_memes():
+    json_data = await fetcher.get_json(f'https://meme-api.com/gimme/{MEME_BATCH_SIZE}')
+    return [meme['url'] for meme in json_data['memes']]
+
+async def get_insult():
+    data = await fetcher.get_json('https://evilinsult.com/generate_insult.php?lang=en&type=json')
+    return [data['insult']]
+
+async def get_advice():
+    json_data = await fetcher.get_json('https://api.adviceslip.com/advice')
+    return [json_data['slip']['advice']]
+
+async def get_random_usless_fact():
+    json_data = await fetcher.get_json('https://uselessfacts.jsph.pl/random.json?language=en')
+    return [json_data['text']]
+
+content_pool_size = int(os.getenv('CONTENT_POOL_SIZE', 10))
+content_pool_low_water = int(os.getenv('CONTENT_POOL_LOW_WATER', 3))
+meme_pool = ContentPool('meme', get_memes, content_pool_size, content_pool_low_water,
+                        fallback='Error: Could not retrieve a meme.')
+insult_pool = ContentPool('insult', get_insult, content_pool_size, content_pool_low_water,
+                          fallback='Error: Could not retrieve insult.')
+# adviceslip.com answers with the same slip for 2 seconds, so refills are spaced out
+advice_pool = ContentPool('advice', get_advice, content_pool_size, content_pool_low_water, spacing=2.0,
+                          fallback='Error: Could not retrieve advice.')
+fact_pool = ContentPool('fact', get_random_usless_fact, content_pool_size, content_pool_low_water,
+                        fallback='Error: Could not retrieve a fact.')
+content_pools = (meme_pool, insult_pool, advice_pool, fact_pool)
+
+APOD_RETRY_TTL = 15 * 60
+
+# One upstream call per UTC day; failures are remembered for a minute so an outage is not hammered
+@cached('apod', ttl=24 * 3600, backend=apod_backend, negative_ttl=60, key=str)
+async def fetch_adop(today):
+    params = {'api_key': os.getenv('NASA_API_KEY') }
+    async with fetcher.get('https://api.nasa.gov/planetary/apod', params=params) as response:
+        response.raise_for_status()  # Raises a HTTPError if the response status is 4xx, 5xx
 
-def get_random_usless_fact():
-    response = requests.get('https://uselessfacts.jsph.pl/random.json?language=en')
-    json_data = json.loads(response.text)
-    return json_data['text']
+        json_data = await response.json(content_type=None)
+    if json_data.get('date') != today:
+        # NASA publishes on US Eastern time, so just after midnight UTC it still serves yesterday's
+        # picture; keep that briefly and ask again later rather than pinning it for the whole day
+        return Fresh(json_data['url'], APOD_RETRY_TTL)
+    return json_data['url']
 
-def get_adop():
+async def get_adop():
     try:
-        params = {'api_key': os.getenv('NASA_API_KEY') }
-        response = requests.get('https://api.nasa.gov/planetary/apod', params=params)
-        response.raise_for_status()  # Raises a HTTPError if the response status is 4xx, 5xx
-
-        json_data = response.json()
-        return json_data['url']
-    except requests.exceptions.HTTPError as http_err:
+        return await fetch_adop(utc_today())
+    except fetcher.HTTPError as http_err:
         print(f'HTTP error occurred: {http_err}') 
         return 'an http error' # Python 3.6
-    except requests.exceptions.RequestException as err:
+    except fetcher.RequestException as err:
         print(f'Error occurred: {err}')
         return 'An unknown error occurred.'  # Python 3.6
     except Exception as err:
         print(f'Other error occurred: {err}') 
         return 'An unknown error occurred.'
 
-def get_nasa_images(query):
-    try:
-        params = {'q': query}
-        response = requests.get('https://images-api.nasa.gov/search', params=params)
+NASA_IMAGE_LIMIT = 5
+
+@cached('nasa', ttl=int(os.getenv('NASA_CACHE_TTL', 6 * 3600)), backend=nasa_backend,
+        stale_ttl=24 * 3600, negative_ttl=30, key=search_key)
+async def fetch_nasa_images(query):
+    params = {'q': query, 'media_type': 'image'}
+    urls = []
+    async with fetcher.get('https://images-api.nasa.gov/search', params=params) as response:
         response.raise_for_status()  # Raises a HTTPError if the response status is 4xx, 5xx
 
-        json_data = response.json()
-        items = json_data.get('collection', {}).get('items', [])
-        urls = [item['links'][0]['href'] for item in items if 'links' in item and item['links'] and item['data'][0]['media_type'] == 'image']
-        return '\n'.join(urls[:5])  # Return only the first 5 URLs
-    except requests.exceptions.HTTPError as http_err:
+        # Parse collection.items one item at a time and stop reading once we have enough
+        async with contextlib.aclosing(fetcher.iter_json_items(response, ('collection', 'items'))) as items:
+            async for item in items:
+                if 'links' in item and item['links'] and item['data'][0]['media_type'] == 'image':
+                    urls.append(item['links'][0]['href'])
+                    if len(urls) == NASA_IMAGE_LIMIT:
+                        break
+    return '\n'.join(urls)
+
+async def get_nasa_images(query):
+    try:
+        return await fetch_nasa_images(query)
+    except fetcher.HTTPError as http_err:
         print(f'HTTP error occurred: {http_err}') 
         return 'An HTTP error occurred.'
-    except requests.exceptions.RequestException as err:
+    except fetcher.RequestException as err:
         print(f'Error occurred: {err}')
         return 'A request error occurred.'
     except Exception as err:
@@ -197,13 +376,23 @@ async def on_ready():
     print('Logged in as {0}!'.format(client.user))
     await client.change_presence(activity=discord.Game(name="/help for commands"))
     
-    # Sync commands globally
+    # Sync commands globally, once per deployment rather than once per shard process
+    if not shard_config.runs_first_shard:
+        return
     try:
         synced = await tree.sync()
         print(f"Synced {len(synced)} command(s)")
     except Exception as e:
         print(f"Failed to sync commands: {e}")
 
+@client.event
+async def on_shard_disconnect(shard_id):
+    print(f'Shard {shard_id} disconnected')
+
+@client.event
+async def on_shard_resumed(shard_id):
+    print(f'Shard {shard_id} resumed')
+
 @tree.error
 async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
     """Error handler for application commands."""
@@ -249,19 +438,19 @@ async def greet(interaction: discord.Interaction):
 
 @tree.command(name="meme", description="Sends a random meme")
 async def meme(interaction: discord.Interaction):
-    await interaction.response.send_message(get_meme())
+    await interaction.response.send_message(await meme_pool.take(interaction.guild_id))
 
 @tree.command(name="insult", description="Sends a random insult")
 async def insult(interaction: discord.Interaction):
-    await interaction.response.send_message(get_insult())
+    await interaction.response.send_message(await insult_pool.take(interaction.guild_id))
 
 @tree.command(name="advice", description="Sends a random advice")
 async def advice(interaction: discord.Interaction):
-    await interaction.response.send_message(get_advice())
+    await interaction.response.send_message(await advice_pool.take(interaction.guild_id))
 
 @tree.command(name="fact", description="Sends a random useless fact")
 async def fact(interaction: discord.Interaction):
-    await interaction.response.send_message(get_random_usless_fact())
+    await interaction.response.send_message(await fact_pool.take(interaction.guild_id))
 
 @tree.command(name="ping", description="Returns the latency")
 async def ping(interaction: discord.Interaction):
@@ -286,31 +475,37 @@ async def leave(interaction: discord.Interaction):
 
 @tree.command(name="adop", description="Sends the Astronomy Picture of the Day")
 async def adop(interaction: discord.Interaction):
-    await interaction.response.send_message(get_adop())
+    await interaction.response.send_message(await get_adop())
 
 @tree.command(name="nasa", description="Searches for images on NASA's API")
 async def nasa(interaction: discord.Interaction, query: str):
-    await interaction.response.send_message(get_nasa_images(query))
+    await interaction.response.send_message(await get_nasa_images(query))
+
+MAX_SKIN_RESULTS = int(os.getenv('MAX_SKIN_RESULTS', 50))
+
+def skin_embed(skin):
+    embed = discord.Embed(title=skin['displayName'], color=0x00ff00)
+    embed.set_image(url=skin['displayIcon'])
+    return embed
 
 @tree.command(name="valskin", description="Searches for Valorant skins")
 async def valskin(interaction: discord.Interaction, skin_name: str):
-    skins = search_val_skin(skin_name)
-    if skins:
-        # Send the first response
-        first_skin = skins.pop(0)
-        embed = discord.Embed(title=first_skin['displayName'], color=0x00ff00)
-        embed.set_image(url=first_skin['displayIcon'])
-        await interaction.response.send_message(embed=embed)
-
-        # Send follow-up messages for the remaining skins
-        for skin in skins:
-            embed = discord.Embed(title=skin['displayName'], color=0x00ff00)
-            embed.set_image(url=skin['displayIcon'])
-            await interaction.followup.send(embed=embed)
-    else:
+    skins = await search_val_skin(skin_name)
+    if not skins:
         await interaction.response.send_message(f'No skin found for "{skin_name}".')
+        return
 
-
+    # One message with up to 10 embeds per page; other pages are reached with the buttons
+    pages = [[skin_embed(skin) for skin in page] for page in paginate(skins, EMBEDS_PER_MESSAGE, MAX_SKIN_RESULTS)]
+    content = None
+    if len(skins) > MAX_SKIN_RESULTS:
+        content = f'Showing the first {MAX_SKIN_RESULTS} of {len(skins)} skins for "{skin_name}", try a more specific name.'
+    if len(pages) == 1:
+        await interaction.response.send_message(content, embeds=pages[0])
+    else:
+        view = EmbedPager(pages, interaction.user.id)
+        await interaction.response.send_message(content, embeds=pages[0], view=view)
+        view.message = await interaction.original_response()
 
 @tree.command(name="logchannel", description="Sets the log channel")
 async def logchannel(interaction: discord.Interaction):
@@ -327,7 +522,7 @@ async def logchannel(interaction: discord.Interaction):
 
     try:
         reaction, user = await client.wait_for('reaction_add', timeout=60.0, check=check)
-        set_log_channel(interaction.guild.id, interaction.channel.id)
+        await set_log_channel(interaction.guild.id, interaction.channel.id)
         await interaction.followup.send(f'Successfully set the log channel to <#{interaction.channel.id}>.')
     except asyncio.TimeoutError:
         await interaction.followup.send('You did not react in time.')
@@ -354,10 +549,12 @@ async def help_command(interaction: discord.Interaction):
     
     # Music commands
     embed.add_field(name='Music', value=
-                    '`/play [track]` - Plays a song from YouTube\n'
+                    '`/play [track]` - Plays a song or playlist from YouTube or Spotify\n'
                     '`/playalt [track]` - Tries alternative sources (SoundCloud)\n'
                     '`/playdirect [track]` - Direct MP3 streaming (when others fail)\n'
-                    '`/queue` - Shows the current queue\n'
+                    '`/queue [page]` - Shows the current queue\n'
+                    '`/remove [position]` - Removes a song from the queue\n'
+                    '`/move [position] [new_position]` - Moves a song in the queue\n'
                     '`/skip` - Skips the current song\n'
                     '`/pause` - Pauses playback\n'
                     '`/resume` - Resumes playback\n'
@@ -374,6 +571,12 @@ async def help_command(interaction: discord.Interaction):
                      
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
+# Log and welcome embeds are batched per channel instead of sent one request per event
+log_dispatcher = LogDispatcher(
+    interval=float(os.getenv('LOG_FLUSH_INTERVAL', '2.0')),
+    max_pending=int(os.getenv('LOG_MAX_PENDING', '100')),
+)
+
 @client.event
 async def on_member_join(member):
     channel_id = get_welcome_channel(member.guild.id)
@@ -386,7 +589,7 @@ async def on_member_join(member):
                 color=discord.Color.green()
             )
             embed.set_thumbnail(url=member.avatar.url)
-            await channel.send(embed=embed)
+            log_dispatcher.post(channel, embed)
 
 @client.event
 async def on_member_remove(member):
@@ -400,7 +603,7 @@ async def on_member_remove(member):
                 color=discord.Color.red()
             )
             embed.set_thumbnail(url=member.avatar.url)
-            await channel.send(embed=embed)
+            log_dispatcher.post(channel, embed)
 
 @client.event
 async def on_voice_state_update(member, before, after):
@@ -424,15 +627,15 @@ async def on_voice_state_update(member, before, after):
             if before.channel is None and after.channel is not None:
                 join_embed.title = 'Joined Voice Channel'
                 join_embed.description = f'{member.name} joined voice channel {after.channel.name} at {format_time(timestamp)}'
-                await log_channel.send(embed=join_embed)
+                log_dispatcher.post(log_channel, join_embed, merge_key=('voice', member.id))
             elif before.channel is not None and after.channel is None:
                 left_embed.title = 'Left Voice Channel'
                 left_embed.description = f'{member.name} left voice channel {before.channel.name} at {format_time(timestamp)}'
-                await log_channel.send(embed=left_embed)
+                log_dispatcher.post(log_channel, left_embed, merge_key=('voice', member.id))
             elif before.channel is not None and after.channel is not None:
                 move_embed.title = 'Moved Voice Channels'
                 move_embed.description = f'{member.name} moved from voice channel {before.channel.name} to {after.channel.name} at {format_time(timestamp)}'
-                await log_channel.send(embed=move_embed)
+                log_dispatcher.post(log_channel, move_embed, merge_key=('voice', member.id))
 
 def format_time(timestamp):
     now = datetime.datetime.now()
@@ -451,7 +654,7 @@ async def on_member_update(before, after):
             log_channel = client.get_channel(log_channel_id)
             if log_channel is not None:
                 embed = Embed(title='Nickname Changed', description=f'{before.nick} changed their nickname to {after.nick}', colour=Colour.blue())
-                await log_channel.send(embed=embed)
+                log_dispatcher.post(log_channel, embed)
 
 @client.event
 async def on_member_ban(guild, user):
@@ -460,7 +663,7 @@ async def on_member_ban(guild, user):
         log_channel = client.get_channel(log_channel_id)
         if log_channel is not None:
             embed = Embed(title='Member Banned', description=f'{user.name} was banned from {guild.name}', colour=Colour.blue())
-            await log_channel.send(embed=embed)
+            log_dispatcher.post(log_channel, embed)
 
 @client.event
 async def on_member_unban(guild, user):
@@ -469,7 +672,7 @@ async def on_member_unban(guild, user):
         log_channel = client.get_channel(log_channel_id)
         if log_channel is not None:
             embed = Embed(title='Member Unbanned', description=f'{user.name} was unbanned from {guild.name}', colour=Colour.blue())
-            await log_channel.send(embed=embed)
+            log_dispatcher.post(log_channel, embed)
 
 @client.event
 async def on_member_timeout(member):
@@ -478,7 +681,7 @@ async def on_member_timeout(member):
         log_channel = client.get_channel(log_channel_id)
         if log_channel is not None:
             embed = Embed(title='Member Timed Out', description=f'{member.name} timed out', colour=Colour.blue())
-            await log_channel.send(embed=embed)
+            log_dispatcher.post(log_channel, embed)
 
 @client.event
 async def on_member_kick(member):
@@ -487,12 +690,31 @@ async def on_member_kick(member):
         log_channel = client.get_channel(log_channel_id)
         if log_channel is not None:
             embed = Embed(title='Member Kicked', description=f'{member.name} was kicked', colour=Colour.blue())
-            await log_channel.send(embed=embed)
-
-#TODO: Implement Spotify playlist support
+            log_dispatcher.post(log_channel, embed)
 
 video_titles = {}
 queues = {}
+queue_max_length = int(os.getenv('QUEUE_MAX_LENGTH', '500'))
+
+def new_guild_queue(guild_id):
+    """An empty queue whose changes are saved to the state backend."""
+    return GuildQueue(queue_max_length, on_change=lambda queue: state_writer.queue_changed(guild_id, queue))
+
+async def restore_queues():
+    """Reload saved queues; a song cut off by the restart goes back to the front of its queue."""
+    saved_queues = await state_backend.load_queues()
+    now_playing = await state_backend.load_now_playing()
+    for guild_id in set(saved_queues) | set(now_playing):
+        if not shard_config.owns(guild_id):
+            continue
+        entries = saved_queues.get(guild_id, [])
+        if guild_id in now_playing:
+            entries = [now_playing[guild_id]] + entries
+            state_writer.now_playing_changed(guild_id, None)
+        queues[guild_id] = new_guild_queue(guild_id)
+        queues[guild_id].restore(entries)
+    if queues:
+        print(f'Restored queues for {len(queues)} guild(s)')
 
 def create_fresh_cookies(cookie_path):
     """
@@ -518,8 +740,120 @@ def create_fresh_cookies(cookie_path):
         print(f"Error creating fresh cookies: {e}")
         return False
 
+def remember_track(query, info, audio_format):
+    """Cache a resolved track under the query and its page URL; returns the page URL."""
+    entry = {
+        'title': info.get('title', 'Unknown Title'),
+        'video_id': info.get('id'),
+        'webpage_url': info.get('webpage_url') or info.get('original_url') or info.get('url'),
+        'format_id': audio_format.get('format_id'),
+        'codec': audio_codec(audio_format),
+        'stream_url': audio_format['url'],
+    }
+    track_cache.put(query, entry)
+    if entry['webpage_url']:
+        track_cache.put(entry['webpage_url'], entry)
+    track_cache.schedule_save()
+    return entry['webpage_url']
+
+async def enqueue_playlist(interaction, playlist_url, vc, voice_channel):
+    """Queue every entry of a playlist, starting playback as soon as the first chunk is in."""
+    guild_id = interaction.guild.id
+    if guild_id not in queues:
+        queues[guild_id] = new_guild_queue(guild_id)
+    added = 0
+    try:
+        async for tracks in iter_playlist(extractor, playlist_url):
+            for playlist_track in tracks:
+                queues[guild_id].append(playlist_track)
+                added += 1
+            if not vc.is_playing():
+                await start_playing(interaction, guild_id, vc, voice_channel)
+            else:
+                prefetcher.schedule(guild_id, queues[guild_id])
+    except QueueFull as e:
+        await interaction.followup.send(f'{e} Only the first {added} playlist tracks were added.')
+        return
+    except PlaylistError as e:
+        await interaction.followup.send(f'Error: {e}')
+        return
+    await interaction.followup.send(f'Added {added} tracks from the playlist to the queue.')
+
+async def lookup_cached_track(query):
+    """Return (stream_url, title, webpage_url, codec) for a cached query, refreshing an expired stream URL."""
+    cached = track_cache.get(query, fuzzy=True)
+    if cached is None:
+        return None
+    if track_cache.stream_expired(cached):
+        try:
+            info = await extractor.extract('youtube_stream', cached['webpage_url'])
+            formats = info.get('formats') or []
+            same_format = [f for f in formats if f.get('format_id') == cached.get('format_id')]
+            best_audio = same_format[0] if same_format else select_audio(info)
+            if best_audio is None:
+                raise NoAudioFormat(f"No playable audio format for {cached['title']}")
+            cached = track_cache.update_stream(query, best_audio['url'], best_audio.get('format_id'), fuzzy=True,
+                                               codec=audio_codec(best_audio))
+            track_cache.schedule_save()
+            print(f"Refreshed stream URL for cached track {cached['title']}")
+        except Exception as e:
+            print(f"Could not refresh cached stream for {query}: {e}")
+            return None
+    return cached['stream_url'], cached['title'], cached['webpage_url'], cached.get('codec')
+
+async def playable(info, max_kbps):
+    """The full info and cheapest audio format of a search result; flat entries are extracted first."""
+    if is_flat(info):
+        info = await extractor.extract('youtube_stream', info.get('webpage_url') or info['url'])
+    best_audio = select_audio(info, max_kbps)
+    if best_audio is None:
+        raise NoAudioFormat(f"No playable audio format for {info.get('title', 'Unknown Title')}")
+    return info, best_audio
+
+async def resolve_track(track):
+    """Give a queued track a fresh stream URL from its page URL or search text. Returns False if it can't."""
+    target = track.webpage_url or track.search
+    if target is None:
+        return track.url is not None
+    cached = await lookup_cached_track(target)
+    if cached is not None:
+        track.url, _, track.webpage_url, track.codec = cached
+        return True
+    try:
+        if track.webpage_url is not None:
+            info = await extractor.extract('youtube_stream', track.webpage_url)
+        else:
+            info = (await extractor.extract('youtube_stream', f'ytsearch1:{track.search}'))['entries'][0]
+        best_audio = select_audio(info)
+        if best_audio is None:
+            raise NoAudioFormat(f'No playable audio format for {track.title}')
+        track.url = best_audio['url']
+        track.codec = audio_codec(best_audio)
+        track.webpage_url = remember_track(target, info, best_audio)
+        return True
+    except Exception as e:
+        print(f"Could not resolve {track.title}: {e}")
+        return False
+
+audio_sources = AudioSourceFactory(
+    lambda url, **kwargs: discord.FFmpegOpusAudio(url, executable="ffmpeg", **kwargs),
+    lambda url, **kwargs: discord.FFmpegPCMAudio(url, executable="ffmpeg", **kwargs),
+    lambda url: discord.FFmpegOpusAudio.probe(url, method='native'),
+)
+
+async def make_source(url, codec=None):
+    # Opus streams are passed through as they are; everything else is decoded to PCM
+    return await audio_sources.create(url, codec)
+
+# Opus copies of often played tracks; disabled unless AUDIO_CACHE_DIR is set
+audio_cache = AudioCache.from_env(codec=audio_sources.codec)
+
+prefetcher = Prefetcher(resolve_track, fetcher.is_reachable, make_source, lookahead=int(os.getenv('PREFETCH_TRACKS', '3')),
+                        is_local=lambda track: track.webpage_url in audio_cache)
+
 @tree.command(name="play", description="Plays a song in the user's voice channel")
 async def play(interaction: discord.Interaction, track: str):
+    connecting = None
     try:
         if track is None:
             await interaction.response.send_message("Please specify a song to play.")
@@ -529,164 +863,162 @@ async def play(interaction: discord.Interaction, track: str):
             await interaction.response.send_message("You need to be in a voice channel to use this command.")
             return
 
+        timeline = PlayTimeline('play', interaction.guild.id)
+
         # Defer the response to allow more time for processing
-        await interaction.response.defer(thinking=True)
+        await timeline.measure('defer', interaction.response.defer(thinking=True))
 
+        # Join the channel while the track is looked up instead of before it
         voice_channel = interaction.user.voice.channel
+        max_kbps = bitrate_cap(voice_channel.bitrate)
         if interaction.guild.voice_client is None:
-            vc = await voice_channel.connect()
-        else:
-            vc = interaction.guild.voice_client
+            connecting = asyncio.create_task(timeline.measure('connect', voice_channel.connect()))
+
+        async def voice_client():
+            return await connecting if connecting is not None else interaction.guild.voice_client
+
+        # Playlists and Spotify links are queued in bulk and resolved as they come up
+        if playlist_kind(track):
+            await enqueue_playlist(interaction, track, await voice_client(), voice_channel)
+            return
+
+        # Serve repeated queries from the track cache instead of searching again
+        cache_key = track
+        with timeline.phase('cache'):
+            cached = await lookup_cached_track(cache_key)
+        if cached is not None:
+            url, video_title, webpage_url, codec = cached
+            print(f"Track cache hit for {cache_key}: {video_title}")
+
+            if interaction.guild.id not in queues:
+                queues[interaction.guild.id] = new_guild_queue(interaction.guild.id)
+            queues[interaction.guild.id].append(Track(url, video_title, webpage_url, codec=codec))
+
+            vc = await voice_client()
+            if not vc.is_playing():
+                await start_playing(interaction, interaction.guild.id, vc, voice_channel, timeline)
+            else:
+                prefetcher.schedule(interaction.guild.id, queues[interaction.guild.id])
+            return
 
-        ###Path to your cookies file
-        cookies_file_path = os.path.join(os.path.dirname(__file__), 'cookies.txt')
-        print(cookies_file_path)
-        
         # Try to create fresh cookies if they don't work
         cookie_regenerated = False
-        
-        # First attempt with normal options
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'noplaylist': True,
-            'quiet': False,  # Set to False to see detailed output
-            'geo_bypass': True,
-            'nocheckcertificate': True,
-            'cookiefile': cookies_file_path,  # Add the cookies file here
-            'verbose': True,
-            'extractor_retries': 5,
-            'ignoreerrors': True,
-            'skip_download': True,
-            'source_address': '0.0.0.0',  # Bind to all interfaces
-            'socket_timeout': 30,
-            'extract_flat': True,
-            'no_warnings': False,
-            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36',
-            'referer': 'https://www.youtube.com/'
-        }
+        webpage_url = None
 
         if urlparse(track).scheme and urlparse(track).netloc:
-            ydl_opts['default_search'] = ''
             parsed_url = urlparse(track)
             track = f'{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}'
-        else:
-            ydl_opts['default_search'] = 'ytsearch'
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            try:
-                info = ydl.extract_info(f'{track}', download=False)
+        try:
+            with timeline.phase('extract'):
+                info = await extractor.extract('youtube', f'{track}')
                 
-                if 'entries' in info and len(info['entries']) > 0:  # Check if 'entries' is not empty
-                    video_title = info['entries'][0]['title']
-                    best_audio = max(info['entries'][0]['formats'], key=lambda format: format.get('abr') or 0)
-                    url = best_audio['url'] 
-                    print(url)
-                elif 'formats' in info:  # Direct URL
-                    video_title = info.get('title', 'Unknown Title')
-                    best_audio = max(info['formats'], key=lambda format: format.get('abr') or 0)
-                    url = best_audio['url']
-                    print(url)
-                else:
-                    await interaction.followup.send(f'Error: No formats found for {track} on YouTube.')
-                    return
-            except Exception as e:
-                print(f"First extraction method failed: {e}")
+            if 'entries' in info and len(info['entries']) > 0:  # Check if 'entries' is not empty
+                entry, best_audio = await timeline.measure('resolve', playable(info['entries'][0], max_kbps))
+                video_title = entry.get('title', 'Unknown Title')
+                url = best_audio['url'] 
+                webpage_url = remember_track(cache_key, entry, best_audio)
+                print(url)
+            elif 'formats' in info:  # Direct URL
+                video_title = info.get('title', 'Unknown Title')
+                best_audio = select_audio(info, max_kbps)
+                if best_audio is None:
+                    raise NoAudioFormat(f'No playable audio format for {video_title}')
+                url = best_audio['url']
+                webpage_url = remember_track(cache_key, info, best_audio)
+                print(url)
+            else:
+                await interaction.followup.send(f'Error: No formats found for {track} on YouTube.')
+                return
+        except Exception as e:
+            print(f"First extraction method failed: {e}")
                 
-                # Try regenerating cookies if not already tried
-                if not cookie_regenerated and "Sign in to confirm you're not a bot" in str(e):
-                    await interaction.followup.send("YouTube detected automation. Trying to refresh cookies...")
-                    if create_fresh_cookies(cookies_file_path):
-                        cookie_regenerated = True
-                        # Try again with fresh cookies
-                        try:
-                            with yt_dlp.YoutubeDL(ydl_opts) as retry_ydl:
-                                retry_info = retry_ydl.extract_info(f'{track}', download=False)
+            # Try regenerating cookies if not already tried
+            if not cookie_regenerated and "Sign in to confirm you're not a bot" in str(e):
+                await interaction.followup.send("YouTube detected automation. Trying to refresh cookies...")
+                if await extractor.run(create_fresh_cookies, cookies_file_path):
+                    cookie_regenerated = True
+                    # Every strategy reading the cookie file has to pick up the new one
+                    extractor.pool.reset_cookie_file(cookies_file_path)
+                    # Try again with fresh cookies
+                    try:
+                        retry_info = await extractor.extract('youtube', f'{track}')
                                 
-                                if 'entries' in retry_info and len(retry_info['entries']) > 0:
-                                    video_title = retry_info['entries'][0]['title']
-                                    best_audio = max(retry_info['entries'][0]['formats'], key=lambda format: format.get('abr') or 0)
-                                    url = best_audio['url']
-                                    print(f"Retry successful with fresh cookies: {url}")
+                        if 'entries' in retry_info and len(retry_info['entries']) > 0:
+                            entry, best_audio = await playable(retry_info['entries'][0], max_kbps)
+                            video_title = entry.get('title', 'Unknown Title')
+                            url = best_audio['url']
+                            webpage_url = remember_track(cache_key, entry, best_audio)
+                            print(f"Retry successful with fresh cookies: {url}")
                                     
-                                    if interaction.guild.id not in queues:
-                                        queues[interaction.guild.id] = []
-                                    queues[interaction.guild.id].append((url, video_title))
+                            if interaction.guild.id not in queues:
+                                queues[interaction.guild.id] = new_guild_queue(interaction.guild.id)
+                            queues[interaction.guild.id].append(Track(url, video_title, webpage_url, codec=audio_codec(best_audio)))
                                     
-                                    if not vc.is_playing():
-                                        await start_playing(interaction, interaction.guild.id, vc, voice_channel)
-                                    return
-                                elif 'formats' in retry_info:
-                                    video_title = retry_info.get('title', 'Unknown Title')
-                                    best_audio = max(retry_info['formats'], key=lambda format: format.get('abr') or 0)
-                                    url = best_audio['url']
-                                    print(f"Retry successful with fresh cookies: {url}")
+                            vc = await voice_client()
+                            if not vc.is_playing():
+                                await start_playing(interaction, interaction.guild.id, vc, voice_channel, timeline)
+                            else:
+                                prefetcher.schedule(interaction.guild.id, queues[interaction.guild.id])
+                            return
+                        elif 'formats' in retry_info:
+                            video_title = retry_info.get('title', 'Unknown Title')
+                            _, best_audio = await playable(retry_info, max_kbps)
+                            url = best_audio['url']
+                            webpage_url = remember_track(cache_key, retry_info, best_audio)
+                            print(f"Retry successful with fresh cookies: {url}")
                                     
-                                    if interaction.guild.id not in queues:
-                                        queues[interaction.guild.id] = []
-                                    queues[interaction.guild.id].append((url, video_title))
+                            if interaction.guild.id not in queues:
+                                queues[interaction.guild.id] = new_guild_queue(interaction.guild.id)
+                            queues[interaction.guild.id].append(Track(url, video_title, webpage_url, codec=audio_codec(best_audio)))
                                     
-                                    if not vc.is_playing():
-                                        await start_playing(interaction, interaction.guild.id, vc, voice_channel)
-                                    return
-                        except Exception as retry_e:
-                            print(f"Retry with fresh cookies failed: {retry_e}")
-                
-                # If cookie regeneration failed or wasn't triggered, try alternative approach
-                alt_ydl_opts = {
-                    'format': 'bestaudio/best',
-                    'quiet': False,
-                    'no_warnings': False,
-                    'nocheckcertificate': True,
-                    'extract_flat': 'in_playlist',
-                    'default_search': 'ytsearch' if not (urlparse(track).scheme and urlparse(track).netloc) else '',
-                    'skip_download': True
-                }
+                            vc = await voice_client()
+                            if not vc.is_playing():
+                                await start_playing(interaction, interaction.guild.id, vc, voice_channel, timeline)
+                            else:
+                                prefetcher.schedule(interaction.guild.id, queues[interaction.guild.id])
+                            return
+                    except Exception as retry_e:
+                        print(f"Retry with fresh cookies failed: {retry_e}")
                 
-                try:
-                    with yt_dlp.YoutubeDL(alt_ydl_opts) as alt_ydl:
-                        alt_info = alt_ydl.extract_info(f'{track}', download=False)
+            # If cookie regeneration failed or wasn't triggered, try alternative approach
+            try:
+                alt_info = await extractor.extract('youtube_fallback', f'{track}')
                         
-                        if 'entries' in alt_info and len(alt_info['entries']) > 0:
-                            video_title = alt_info['entries'][0]['title']
-                            # Try a different service as fallback
-                            search_term = alt_info['entries'][0]['title']
-                            await interaction.followup.send(f"YouTube extraction failed. Trying alternative source for: {search_term}")
+                if 'entries' in alt_info and len(alt_info['entries']) > 0:
+                    video_title = alt_info['entries'][0]['title']
+                    # Try a different service as fallback
+                    search_term = alt_info['entries'][0]['title']
+                    await interaction.followup.send(f"YouTube extraction failed. Trying alternative source for: {search_term}")
                             
-                            # Use invidious as alternative
-                            invidious_opts = {
-                                'format': 'bestaudio/best',
-                                'quiet': False,
-                                'no_warnings': False,
-                                'extract_flat': 'in_playlist',
-                                'default_search': 'ytsearch',
-                                'skip_download': True,
-                                'extractor_args': {'youtubedl': {'skip': ['youtube']}}
-                            }
-                            
-                            with yt_dlp.YoutubeDL(invidious_opts) as inv_ydl:
-                                inv_info = inv_ydl.extract_info(f"ytsearch:{search_term}", download=False)
-                                if 'entries' in inv_info and len(inv_info['entries']) > 0:
-                                    video_title = inv_info['entries'][0]['title']
-                                    best_audio = max(inv_info['entries'][0]['formats'], key=lambda format: format.get('abr') or 0)
-                                    url = best_audio['url']
-                                    print(f"Alternative extraction successful: {url}")
-                                else:
-                                    await interaction.followup.send(f'Error: Could not find alternative source for {track}.')
-                                    return
-                        else:
-                            await interaction.followup.send(f'Error: No results found for {track}.')
-                            return
-                except Exception as alt_e:
-                    await interaction.followup.send(f"Failed to play track: {alt_e}")
-                    print(f"Alternative extraction failed: {alt_e}")
+                    # Use invidious as alternative
+                    inv_info = await extractor.extract('invidious', f"ytsearch:{search_term}")
+                    if 'entries' in inv_info and len(inv_info['entries']) > 0:
+                        entry, best_audio = await playable(inv_info['entries'][0], max_kbps)
+                        video_title = entry.get('title', 'Unknown Title')
+                        url = best_audio['url']
+                        webpage_url = remember_track(cache_key, entry, best_audio)
+                        print(f"Alternative extraction successful: {url}")
+                    else:
+                        await interaction.followup.send(f'Error: Could not find alternative source for {track}.')
+                        return
+                else:
+                    await interaction.followup.send(f'Error: No results found for {track}.')
                     return
+            except Exception as alt_e:
+                await interaction.followup.send(f"Failed to play track: {alt_e}")
+                print(f"Alternative extraction failed: {alt_e}")
+                return
 
         if interaction.guild.id not in queues:
-            queues[interaction.guild.id] = []
-        queues[interaction.guild.id].append((url, video_title))   
+            queues[interaction.guild.id] = new_guild_queue(interaction.guild.id)
+        queues[interaction.guild.id].append(Track(url, video_title, webpage_url, codec=audio_codec(best_audio)))   
 
+        vc = await voice_client()
         if not vc.is_playing():
-            await start_playing(interaction, interaction.guild.id, vc, voice_channel)
+            await start_playing(interaction, interaction.guild.id, vc, voice_channel, timeline)
+        else:
+            prefetcher.schedule(interaction.guild.id, queues[interaction.guild.id])
 
     except yt_dlp.utils.DownloadError as e:
         await interaction.followup.send(f"Download error: {e}")
@@ -694,52 +1026,97 @@ async def play(interaction: discord.Interaction, track: str):
     except Exception as e:
         await interaction.followup.send(f"An error occurred: {e}")
         print(f"Error in play command: {e}")
+    finally:
+        # The voice connection runs alongside the lookup; settle it on the early returns too
+        if connecting is not None:
+            for result in await asyncio.gather(connecting, return_exceptions=True):
+                if isinstance(result, Exception):
+                    print(f"Could not join the voice channel: {result}")
 
 currently_playing = {}
+transitions = TransitionScheduler()
+play_timings = TimelineStats()
+
+def timeline_finished(timeline):
+    play_timings.record(timeline)
+    print(timeline)
+
+PLAYBACK_STATS_INTERVAL = float(os.getenv('PLAYBACK_STATS_INTERVAL', '900'))
+
+def print_playback_stats():
+    stats = transitions.stats()
+    if stats['transitions']:
+        print(f"Song transitions: {stats['transitions']} ({stats['failures']} failed), "
+              f"p50 {stats['p50_ms']:.0f}ms, p95 {stats['p95_ms']:.0f}ms, max {stats['max_ms']:.0f}ms")
+    elif stats['failures']:
+        print(f"Song transitions: {stats['failures']} failed")
+    if len(play_timings):
+        timings = ', '.join(f'{name} {p50:.2f}/{p95:.2f}s' for name, (p50, p95) in play_timings.summary().items()
+                            if p50 is not None)
+        print(f'Play timings over the last {len(play_timings)} plays (p50/p95): {timings}')
+
+async def report_playback_stats():
+    """Print transition latencies and play timings every PLAYBACK_STATS_INTERVAL seconds."""
+    while not client.is_closed():
+        await asyncio.sleep(PLAYBACK_STATS_INTERVAL)
+        print_playback_stats()
+
+async def start_playing(interaction, guild_id, vc, voice_channel, timeline=None):
+    # One track change at a time per guild, whether it comes from a command or the player
+    async with transitions.lock(guild_id):
+        if vc.is_playing() or vc.is_paused():
+            return  # Another transition already started the next song
+        track = None
+        local_file = None
+        while queues.get(guild_id):
+            candidate = queues[guild_id].popleft()
+            local_file = audio_cache.path_for(candidate.webpage_url)
+            if local_file is None and candidate.source is None and needs_refresh(candidate) and not await resolve_track(candidate):
+                await interaction.followup.send(f'Skipping {candidate.title}: no playable stream found.')
+                continue
+            track = candidate
+            break
+
+        if track is None:  # If the queue is empty, return
+            state_writer.now_playing_changed(guild_id, None)
+            await client.change_presence(activity=discord.Game(name="/help for commands"))  # Reset status
+            return
 
-async def start_playing(interaction, guild_id, vc, voice_channel):
-    if not queues[guild_id]:  # If the queue is empty, return
-        await client.change_presence(activity=discord.Game(name="/help for commands"))  # Reset status
-        return
+        url, video_title = track.url, track.title
 
-    url, video_title = queues[guild_id].pop(0)
-    
-    # Special handling for SoundCloud HLS streams
-    before_options = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
-    
-    # Add protocol whitelist and other options for HLS streams
-    if 'playlist.m3u8' in url or '.m3u8' in url:
-        before_options += ' -protocol_whitelist file,http,https,tcp,tls,crypto -allowed_extensions ALL'
-    
-    source = discord.FFmpegPCMAudio(
-        executable="ffmpeg", 
-        source=url, 
-        before_options=before_options
-    )
+        with timeline.phase('source') if timeline is not None else contextlib.nullcontext():
+            if local_file is not None:
+                # The stored copy needs no stream URL; drop anything started on the network one
+                track.release()
+                source = await make_source(local_file, codec='opus')
+            else:
+                # Use the source the prefetcher already started, if there is one
+                source = track.source or await make_source(url, track.codec)
+                audio_cache.record_play(track.webpage_url, url)
+        track.source = None
 
-    currently_playing[guild_id] = video_title  # Store the currently playing song
+        currently_playing[guild_id] = video_title  # Store the currently playing song
+        state_writer.now_playing_changed(guild_id, track)
 
-    def after_callback(e):
-        if e:  # If an error occurred, print it out
-            print(f'Error in playback: {e}')
-        coro = start_playing(interaction, guild_id, vc, voice_channel)  # Schedule the next song to play
-        fut = asyncio.run_coroutine_threadsafe(coro, client.loop)
-        try:
-            fut.result()
-        except Exception as ex:
-            print(f"Error scheduling next song: {ex}")
-            # An error was raised during the execution of the coroutine
-            pass
+        def after_callback(e):
+            if e:  # If an error occurred, print it out
+                print(f'Error in playback: {e}')
+            # Runs on the voice player thread, so only hand the next song to the event loop
+            transitions.request(client.loop, guild_id, lambda: start_playing(interaction, guild_id, vc, voice_channel))
 
-    try:
-        vc.play(source, after=after_callback)
-        await interaction.followup.send(f'Playing {video_title} in {voice_channel}')
-        await client.change_presence(activity=discord.Activity(type=discord.ActivityType.listening, name=f"{video_title}"))
-    except discord.opus.OpusNotLoaded:
-        await interaction.followup.send("Opus library is not loaded. Please ensure it is installed and properly configured.")
-    except Exception as e:
-        await interaction.followup.send(f"Error playing audio: {e}")
-        print(f"Error playing audio: {e}")
+        try:
+            if timeline is not None:
+                timeline.watch_first_frame(source, client.loop, timeline_finished)
+            vc.play(source, after=after_callback)
+            transitions.playback_started(guild_id)
+            prefetcher.schedule(guild_id, queues[guild_id])
+            await interaction.followup.send(f'Playing {video_title} in {voice_channel}')
+            await client.change_presence(activity=discord.Activity(type=discord.ActivityType.listening, name=f"{video_title}"))
+        except discord.opus.OpusNotLoaded:
+            await interaction.followup.send("Opus library is not loaded. Please ensure it is installed and properly configured.")
+        except Exception as e:
+            await interaction.followup.send(f"Error playing audio: {e}")
+            print(f"Error playing audio: {e}")
 
 @tree.command(name="skip", description="Skips the current song")
 async def skip(interaction: discord.Interaction):
@@ -747,17 +1124,44 @@ async def skip(interaction: discord.Interaction):
         await interaction.response.send_message("I am not in a voice channel.")
     else:
         current_song = currently_playing.get(interaction.guild.id, "None")  # Get the currently playing song
-        interaction.guild.voice_client.stop()
+        vc = interaction.guild.voice_client
         await interaction.response.send_message(f"Skipped {current_song} in {interaction.user.voice.channel}")
-        await start_playing(interaction, interaction.guild.id, interaction.guild.voice_client, interaction.user.voice.channel)
+        if vc.is_playing() or vc.is_paused():
+            vc.stop()  # The player's after callback moves on to the next song
+        else:
+            await start_playing(interaction, interaction.guild.id, vc, interaction.user.voice.channel)
 
 @tree.command(name="queue", description="Displays the current queue")
-async def queue(interaction: discord.Interaction):
-    if not queues.get(interaction.guild.id):
+async def queue(interaction: discord.Interaction, page: int = 1):
+    guild_queue = queues.get(interaction.guild.id)
+    if not guild_queue:
         await interaction.response.send_message("The queue is empty.")
     else:
-        queue_str = "\n".join([title for url, title in queues[interaction.guild.id]])
-        await interaction.response.send_message(f"Current queue:\n{queue_str}")
+        pages = guild_queue.pages()
+        page = min(max(1, page), pages)
+        queue_str = "\n".join(guild_queue.page(page))
+        await interaction.response.send_message(f"Current queue ({len(guild_queue)} tracks, page {page}/{pages}):\n{queue_str}")
+
+@tree.command(name="remove", description="Removes a song from the queue")
+async def remove(interaction: discord.Interaction, position: int):
+    guild_queue = queues.get(interaction.guild.id)
+    if not guild_queue or not 1 <= position <= len(guild_queue):
+        await interaction.response.send_message("There is no song at that position in the queue.")
+    else:
+        removed = guild_queue.remove(position - 1)
+        removed.release()
+        await interaction.response.send_message(f"Removed {removed.title} from the queue")
+
+@tree.command(name="move", description="Moves a song to another position in the queue")
+async def move(interaction: discord.Interaction, position: int, new_position: int):
+    guild_queue = queues.get(interaction.guild.id)
+    if not guild_queue or not 1 <= position <= len(guild_queue) or not 1 <= new_position <= len(guild_queue):
+        await interaction.response.send_message("There is no song at that position in the queue.")
+    else:
+        moved = guild_queue.move(position - 1, new_position - 1)
+        if interaction.guild.voice_client is not None and interaction.guild.voice_client.is_playing():
+            prefetcher.schedule(interaction.guild.id, guild_queue)  # warm the new next track
+        await interaction.response.send_message(f"Moved {moved.title} to position {new_position}")
 
 @tree.command(name="pause", description="Pauses the song")
 async def pause(interaction: discord.Interaction):
@@ -783,7 +1187,9 @@ async def stop(interaction: discord.Interaction):
         await interaction.response.send_message("I am not in a voice channel.")
     else:
         current_song = currently_playing.get(interaction.guild.id, "None") # Get the currently playing song
-        queues[interaction.guild.id] = [] # Clear the queue
+        if interaction.guild.id in queues:
+            queues[interaction.guild.id].clear() # Clear the queue
+        prefetcher.cancel(interaction.guild.id)
         interaction.guild.voice_client.stop()
         await interaction.response.send_message(f"Stopped {current_song} in {interaction.user.voice.channel}")
         await client.change_presence(activity=discord.Game(name="/help for commands"))
@@ -808,59 +1214,35 @@ async def playalt(interaction: discord.Interaction, track: str):
         else:
             vc = interaction.guild.voice_client
         
-        # Use SoundCloud or other alternative sources
-        alt_ydl_opts = {
-            'format': 'bestaudio/best[protocol^=http]',  # Prefer HTTP protocols over HLS
-            'quiet': False,
-            'no_warnings': False,
-            'nocheckcertificate': True,
-            'skip_download': True,
-            'default_search': 'scsearch',  # Use SoundCloud search
-            'extractor_args': {'youtubedl': {'skip': ['youtube']}},  # Skip YouTube
-            'prefer_insecure': True,
-            'legacy_server_connect': True,  # Try legacy connection method
-        }
-        
         await interaction.followup.send(f"Looking for '{track}' on alternate sources...")
         
         try:
-            with yt_dlp.YoutubeDL(alt_ydl_opts) as alt_ydl:
-                info = alt_ydl.extract_info(f"scsearch:{track}", download=False)
+            info = await extractor.extract('soundcloud', f"scsearch:{track}")
                 
-                if 'entries' in info and len(info['entries']) > 0:  # Check if 'entries' is not empty
-                    entry = info['entries'][0]
-                    video_title = entry['title']
-                    
-                    # Try to get a direct progressive HTTP URL if available
-                    formats = entry.get('formats', [])
-                    best_format = None
-                    
-                    # Try to find a non-HLS format first (direct MP3/HTTP stream)
-                    for fmt in formats:
-                        protocol = fmt.get('protocol', '')
-                        if protocol != 'hls' and protocol != 'm3u8_native' and protocol != 'm3u8':
-                            if best_format is None or fmt.get('abr', 0) > best_format.get('abr', 0):
-                                best_format = fmt
+            if 'entries' in info and len(info['entries']) > 0:  # Check if 'entries' is not empty
+                entry = info['entries'][0]
+                video_title = entry['title']
                     
-                    # If no direct stream found, use the best one available
-                    if best_format is None and formats:
-                        best_format = max(formats, key=lambda fmt: fmt.get('abr', 0))
+                # The cost model ranks progressive HTTP streams above HLS ones, so FFmpeg starts without playlist round trips
+                best_format = select_audio(entry, bitrate_cap(voice_channel.bitrate))
                     
-                    if best_format:
-                        url = best_format['url']
-                        print(f"Found on alternate source: {url}")
-                        print(f"Format details: {best_format.get('protocol', 'unknown')}, {best_format.get('format_id', 'unknown')}")
+                if best_format:
+                    url = best_format['url']
+                    print(f"Found on alternate source: {url}")
+                    print(f"Format details: {best_format.get('protocol', 'unknown')}, {best_format.get('format_id', 'unknown')}")
                         
-                        if interaction.guild.id not in queues:
-                            queues[interaction.guild.id] = []
-                        queues[interaction.guild.id].append((url, video_title))
+                    if interaction.guild.id not in queues:
+                        queues[interaction.guild.id] = new_guild_queue(interaction.guild.id)
+                    queues[interaction.guild.id].append(Track(url, video_title, codec=audio_codec(best_format)))
                         
-                        if not vc.is_playing():
-                            await start_playing(interaction, interaction.guild.id, vc, voice_channel)
+                    if not vc.is_playing():
+                        await start_playing(interaction, interaction.guild.id, vc, voice_channel)
                     else:
-                        await interaction.followup.send(f'Error: Could not find a playable format for "{track}".')
+                        prefetcher.schedule(interaction.guild.id, queues[interaction.guild.id])
                 else:
-                    await interaction.followup.send(f'Error: No results found for "{track}" on alternate sources.')
+                    await interaction.followup.send(f'Error: Could not find a playable format for "{track}".')
+            else:
+                await interaction.followup.send(f'Error: No results found for "{track}" on alternate sources.')
         except Exception as alt_e:
             await interaction.followup.send(f"Alternative source failed: {alt_e}")
             print(f"Error in alternate source search: {alt_e}")
@@ -902,31 +1284,26 @@ async def playdirect(interaction: discord.Interaction, track: str):
         # Try using a more compatible source with direct MP3 links
         try:
             # Try using Jamendo (free music)
-            jamendo_opts = {
-                'format': 'bestaudio/best',
-                'quiet': False,
-                'default_search': 'jamendosearch', 
-                'skip_download': True,
-            }
-            
-            with yt_dlp.YoutubeDL(jamendo_opts) as jdl:
-                info = jdl.extract_info(f"jamendosearch5:{track}", download=False)
+            info = await extractor.extract('jamendo', f"jamendosearch5:{track}")
                 
-                if info and 'entries' in info and len(info['entries']) > 0:
-                    entry = info['entries'][0]
-                    video_title = entry.get('title', 'Unknown Track')
-                    url = entry.get('url')
+            if info and 'entries' in info and len(info['entries']) > 0:
+                entry = info['entries'][0]
+                video_title = entry.get('title', 'Unknown Track')
+                best_format = select_audio(entry, bitrate_cap(voice_channel.bitrate))
+                url = best_format['url'] if best_format else None
                     
-                    if url:
-                        print(f"Found on Jamendo: {url}")
+                if url:
+                    print(f"Found on Jamendo: {url}")
                         
-                        if interaction.guild.id not in queues:
-                            queues[interaction.guild.id] = []
-                        queues[interaction.guild.id].append((url, video_title))
+                    if interaction.guild.id not in queues:
+                        queues[interaction.guild.id] = new_guild_queue(interaction.guild.id)
+                    queues[interaction.guild.id].append(Track(url, video_title, codec=audio_codec(best_format)))
                         
-                        if not vc.is_playing():
-                            await start_playing(interaction, interaction.guild.id, vc, voice_channel)
-                        return
+                    if not vc.is_playing():
+                        await start_playing(interaction, interaction.guild.id, vc, voice_channel)
+                    else:
+                        prefetcher.schedule(interaction.guild.id, queues[interaction.guild.id])
+                    return
         except Exception as e:
             print(f"Jamendo search failed: {e}")
 
@@ -938,16 +1315,86 @@ async def playdirect(interaction: discord.Interaction, track: str):
         # Add to queue
         video_title = f"{track} (direct stream)"
         if interaction.guild.id not in queues:
-            queues[interaction.guild.id] = []
-        queues[interaction.guild.id].append((direct_mp3_url, video_title))
+            queues[interaction.guild.id] = new_guild_queue(interaction.guild.id)
+        queues[interaction.guild.id].append(Track(direct_mp3_url, video_title))
         
         if not vc.is_playing():
             await start_playing(interaction, interaction.guild.id, vc, voice_channel)
+        else:
+            prefetcher.schedule(interaction.guild.id, queues[interaction.guild.id])
             
     except Exception as e:
         await interaction.followup.send(f"Direct playback failed: {e}")
         print(f"Error in playdirect command: {e}")
 
+HEALTH_INTERVAL = float(os.getenv('SHARD_HEALTH_INTERVAL', '30'))
+
+def shard_health():
+    guild_counts = Counter(guild.shard_id for guild in client.guilds)
+    return {
+        'worker_id': int(os.getenv('SHARD_WORKER_ID', '0')),
+        'pid': os.getpid(),
+        'time': time.time(),
+        'ready': client.is_ready(),
+        'shards': [
+            {
+                'shard_id': shard_id,
+                'latency_ms': None if math.isinf(shard.latency) else shard.latency * 1000,
+                'closed': shard.is_closed(),
+                'ratelimited': shard.is_ws_ratelimited(),
+                'guilds': guild_counts[shard_id],
+            }
+            for shard_id, shard in sorted(client.shards.items())
+        ],
+    }
+
+async def report_health(health_queue):
+    """Send shard health to the launcher every HEALTH_INTERVAL seconds, starting before the client is ready."""
+    while not client.is_closed():
+        health_queue.put(shard_health())
+        await asyncio.sleep(HEALTH_INTERVAL)
+
+async def main(health_queue=None):
+    print(f'Starting with {shard_config}')
+    await load_settings_cache()
+    await restore_queues()
+    await asyncio.to_thread(track_cache.load)
+    await asyncio.to_thread(audio_cache.load)
+    await extractor.warm()
+    for pool in content_pools:
+        pool.start()
+    try:
+        await skin_catalog.ensure_loaded()
+    except fetcher.RequestException as e:
+        print(f'Valorant skin catalog unavailable, will retry on /valskin: {e}')
+    async with client:
+        # The launcher stops workers with SIGTERM; closing the client lets the cleanup below run
+        with contextlib.suppress(NotImplementedError):  # no signal handlers on Windows event loops
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(client.close()))
+        if health_queue is not None:
+            health_task = asyncio.create_task(report_health(health_queue))
+        stats_task = asyncio.create_task(report_playback_stats())
+        try:
+            await client.start(TOKEN)
+        finally:
+            if health_queue is not None:
+                health_task.cancel()
+            stats_task.cancel()
+            print_playback_stats()
+            await log_dispatcher.close()
+            for pool in content_pools:
+                await pool.close()
+            await fetcher.close_session()
+            await nasa_backend.close()
+            await apod_backend.close()
+            for name, counters in cache_stats().items():
+                print(f"Cache '{name}': " + ', '.join(f'{counter} {count}' for counter, count in counters.items()))
+            await state_writer.close()
+            await state_backend.close()
+            await audio_cache.close()
+            extractor.shutdown()
+            await track_cache.close()
+
 if __name__ == "__main__":
-    client.run(TOKEN)
+    asyncio.run(main())
        
\ No newline at end of file
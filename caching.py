@@ -0,0 +1,261 @@
+"""
+Caching for upstream API calls.
+
+`@cached(...)` wraps an async fetch function with a TTL cache:
+
+- identical concurrent calls share one upstream request (SingleFlight);
+- an expired value is still served for `stale_ttl` more seconds while a
+  background call refreshes it (stale-while-revalidate);
+- failures can be cached for `negative_ttl` seconds, so an upstream that
+  is down is not asked again on every command; a failed refresh of a
+  stale value keeps serving that value instead;
+- hits, stale hits, misses and errors are counted per cache.
+
+Values live in a pluggable backend: MemoryBackend (in-process LRU),
+FileBackend (a JSON file, survives restarts) or RedisBackend (shared by
+every bot process). default_backend() picks Redis when CACHE_REDIS_URL is
+set. Cached values must be JSON-serializable for the file and Redis
+backends.
+"""
+import asyncio
+import datetime
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from atomic_file import replace_file
+
+REDIS_URL = os.getenv('CACHE_REDIS_URL')
+MEMORY_MAXSIZE = int(os.getenv('CACHE_MAXSIZE', '1024'))
+
+_stats = {}
+
+
+def utc_today():
+    return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+
+
+def cache_stats():
+    """Counters of every @cached function, by cache name."""
+    return {name: dict(counters) for name, counters in _stats.items()}
+
+
+class CachedFailure(Exception):
+    """Raised instead of calling upstream again while a failure is negatively cached."""
+
+
+class Fresh:
+    """Return Fresh(value, ttl) from a @cached function to give that one value its own TTL."""
+
+    def __init__(self, value, ttl):
+        self.value = value
+        self.ttl = ttl
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    async def do(self, key, fn):
+        """Await `fn()`, or the call already in flight for `key`; every caller gets its result."""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        # One caller being cancelled must not cancel the shared call
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+
+# Backends store records: {'value': ..., 'error': str or None, 'fresh_until': t, 'stale_until': t}
+
+class MemoryBackend:
+    def __init__(self, maxsize=MEMORY_MAXSIZE):
+        self.maxsize = maxsize
+        self._records = OrderedDict()
+
+    def __len__(self):
+        return len(self._records)
+
+    async def get(self, key):
+        record = self._records.get(key)
+        if record is None:
+            return None
+        if record['stale_until'] <= time.time():
+            del self._records[key]
+            return None
+        self._records.move_to_end(key)
+        return record
+
+    async def set(self, key, record):
+        self._records[key] = record
+        self._records.move_to_end(key)
+        while len(self._records) > self.maxsize:
+            self._records.popitem(last=False)
+
+    async def close(self):
+        pass
+
+
+class FileBackend(MemoryBackend):
+    """MemoryBackend whose records are also written to a JSON file."""
+
+    def __init__(self, path, maxsize=MEMORY_MAXSIZE):
+        super().__init__(maxsize)
+        self.path = path
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    async def get(self, key):
+        if not self._loaded:
+            await asyncio.to_thread(self._load)
+        return await super().get(key)
+
+    async def set(self, key, record):
+        if not self._loaded:
+            await asyncio.to_thread(self._load)
+        await super().set(key, record)
+        now = time.time()
+        snapshot = {key: record for key, record in self._records.items() if record['stale_until'] > now}
+        await asyncio.to_thread(self._save, snapshot)
+
+    def _load(self):
+        self._loaded = True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f'Could not read cache {self.path}: {e}')
+            return
+        for key, record in stored.items():
+            self._records.setdefault(key, record)
+
+    def _save(self, snapshot):
+        with self._lock:
+            try:
+                replace_file(self.path, json.dumps(snapshot))
+            except OSError as e:
+                print(f'Could not write cache {self.path}: {e}')
+
+
+class RedisBackend:
+    """Records stored as JSON strings in Redis, expiring when they go stale."""
+
+    def __init__(self, url, prefix='discord_bot:cache:'):
+        import redis.asyncio
+        import redis.exceptions
+        self.client = redis.asyncio.from_url(url)
+        self.prefix = prefix
+        self._errors = (redis.exceptions.RedisError, OSError)
+
+    async def get(self, key):
+        try:
+            raw = await self.client.get(self.prefix + key)
+        except self._errors as e:
+            # An unreachable cache behaves like an empty one
+            print(f'Redis cache read failed: {e}')
+            return None
+        return None if raw is None else json.loads(raw)
+
+    async def set(self, key, record):
+        expires_in = max(1, int(record['stale_until'] - time.time()) + 1)
+        try:
+            await self.client.set(self.prefix + key, json.dumps(record), ex=expires_in)
+        except self._errors as e:
+            print(f'Redis cache write failed: {e}')
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def default_backend(path=None, maxsize=MEMORY_MAXSIZE):
+    """Redis if CACHE_REDIS_URL is set, else a JSON file at `path`, else process memory.
+
+    `maxsize` bounds the file and memory backends; Redis entries expire instead.
+    """
+    if REDIS_URL:
+        return RedisBackend(REDIS_URL)
+    if path is not None:
+        return FileBackend(path, maxsize)
+    return MemoryBackend(maxsize)
+
+
+def cached(name, ttl, backend=None, stale_ttl=0, negative_ttl=0, key=None):
+    """Cache an async function's results under `name` and a key built from its arguments.
+
+    `key(*args, **kwargs)` builds the key; by default the repr of the arguments.
+    With `negative_ttl`, an exception is remembered for that many seconds and
+    CachedFailure is raised instead of calling upstream again.
+    """
+    backend = MemoryBackend() if backend is None else backend
+    flight = SingleFlight()
+    stats = _stats[name] = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'negative_hits': 0, 'errors': 0}
+    background = set()
+
+    def decorate(fn):
+        async def refresh(cache_key, args, kwargs, stale=None):
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                stats['errors'] += 1
+                if negative_ttl:
+                    until = time.time() + negative_ttl
+                    if stale is not None:
+                        # Keep serving the stale value, and only retry upstream after negative_ttl
+                        await backend.set(cache_key, dict(stale, fresh_until=until))
+                    else:
+                        await backend.set(cache_key, {'value': None, 'error': f'{type(e).__name__}: {e}',
+                                                      'fresh_until': until, 'stale_until': until})
+                raise
+            value, value_ttl = (result.value, result.ttl) if isinstance(result, Fresh) else (result, ttl)
+            now = time.time()
+            await backend.set(cache_key, {'value': value, 'error': None, 'fresh_until': now + value_ttl,
+                                          'stale_until': now + value_ttl + stale_ttl})
+            return value
+
+        def refreshed(task):
+            background.discard(task)
+            # The stale value was already served, so a failed refresh is only logged
+            if not task.cancelled() and task.exception() is not None:
+                print(f'Refreshing {name} failed: {task.exception()}')
+
+        def revalidate(cache_key, record, args, kwargs):
+            if cache_key in flight:
+                return
+            task = asyncio.create_task(flight.do(cache_key, lambda: refresh(cache_key, args, kwargs, stale=record)))
+            background.add(task)
+            task.add_done_callback(refreshed)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            cache_key = f'{name}:{key(*args, **kwargs) if key else repr((args, kwargs))}'
+            record = await backend.get(cache_key)
+            if record is not None:
+                if record['error'] is not None:
+                    stats['negative_hits'] += 1
+                    raise CachedFailure(record['error'])
+                if record['fresh_until'] > time.time():
+                    stats['hits'] += 1
+                else:
+                    stats['stale_hits'] += 1
+                    revalidate(cache_key, record, args, kwargs)
+                return record['value']
+            stats['misses'] += 1
+            return await flight.do(cache_key, lambda: refresh(cache_key, args, kwargs))
+
+        wrapper.stats = stats
+        wrapper.backend = backend
+        return wrapper
+    return decorate
@@ -0,0 +1,108 @@
+"""
+Prefetched buffers for the random-content commands (/meme, /advice, ...).
+
+Each ContentPool keeps a few items fetched ahead of time, so a command is
+answered from memory instead of waiting on the upstream API. Taking an
+item that drops the buffer below `low_water` starts one background refill,
+which fetches sequentially (spaced by `spacing` seconds) until the buffer
+is full again, so a burst of commands does not turn into a burst of API
+calls. Items recently served in a guild are skipped for that guild and
+left in the buffer for the others.
+"""
+import asyncio
+import time
+from collections import deque
+
+
+class ContentPool:
+    def __init__(self, name, fetch, size=10, low_water=3, recent=50, spacing=0.0, fallback=None):
+        self.name = name
+        self.fetch = fetch  # async () -> list of items
+        self.size = size
+        self.low_water = low_water
+        self.recent = recent
+        self.spacing = spacing
+        self.fallback = fallback
+        self.buffered = 0
+        self.fetched_inline = 0
+        self._buffer = deque()
+        self._served = {}  # guild_id -> deque of recently served items
+        self._refill_task = None
+        self._last_fetch = 0.0
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def start(self):
+        """Fill the buffer in the background."""
+        self._schedule_refill()
+
+    async def take(self, guild_id):
+        served = self._served.get(guild_id)
+        if served is None:
+            served = self._served[guild_id] = deque(maxlen=self.recent)
+        item = self._pop_unserved(served)
+        if item is not None:
+            self.buffered += 1
+        else:
+            item = await self._fetch_inline(served)
+        if len(self._buffer) < self.low_water:
+            self._schedule_refill()
+        if item is None:
+            return self.fallback
+        served.append(item)
+        return item
+
+    def _pop_unserved(self, served):
+        for index, item in enumerate(self._buffer):
+            if item not in served:
+                del self._buffer[index]
+                return item
+        return None
+
+    async def _fetch_inline(self, served):
+        # Buffer empty (cold start or a burst outran the refill): fetch for this request directly
+        try:
+            items = await self._fetch()
+        except Exception as e:
+            print(f'Error fetching {self.name}: {e}')
+            return None
+        self.fetched_inline += 1
+        fresh = [item for item in items if item not in served]
+        if not fresh:
+            return None
+        self._add(fresh[1:])
+        return fresh[0]
+
+    async def _fetch(self):
+        self._last_fetch = time.monotonic()
+        return await self.fetch()
+
+    def _add(self, items):
+        for item in items:
+            if len(self._buffer) < self.size and item not in self._buffer:
+                self._buffer.append(item)
+
+    def _schedule_refill(self):
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill())
+
+    async def _refill(self):
+        # Bounded so an API that keeps returning the same item cannot keep us looping
+        for _ in range(self.size * 2):
+            if len(self._buffer) >= self.size:
+                return
+            wait = self._last_fetch + self.spacing - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                items = await self._fetch()
+            except Exception as e:
+                print(f'Error refilling {self.name}: {e}')
+                return
+            self._add(items)
+
+    async def close(self):
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+            await asyncio.gather(self._refill_task, return_exceptions=True)
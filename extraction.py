@@ -0,0 +1,191 @@
+"""
+yt-dlp extraction off the event loop.
+
+extract_info() does blocking network I/O for seconds at a time, so every
+call goes through ExtractionService: a bounded thread pool plus an asyncio
+semaphore that caps how many extractions are in flight, with a per-request
+timeout. A slot is held until its thread is actually free again: a
+cancelled or timed-out job that has not started yet is dropped from the
+pool at once, one that is already running finishes in the background and
+keeps its slot until then. Later requests therefore wait for a free
+thread instead of queueing behind abandoned jobs and timing out there.
+
+Extractions run against named strategies (youtube, soundcloud, jamendo, ...).
+YoutubeDLPool keeps long-lived YoutubeDL instances per strategy, created
+once at startup, so a request does not pay for extractor initialization
+and cookie-file parsing every time. YoutubeDL.close() writes the instance's
+cookie jar back to its cookie file, so instances leaving the pool are
+dropped without closing them; only shutdown closes the idle ones.
+"""
+import asyncio
+import functools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import yt_dlp
+
+
+class ExtractionTimeout(Exception):
+    """Raised when an extraction takes longer than the service timeout."""
+
+
+class YoutubeDLPool:
+    """Idle YoutubeDL instances per strategy, checked out by one worker thread at a time."""
+
+    def __init__(self, strategies, size=2, factory=yt_dlp.YoutubeDL):
+        self.strategies = strategies
+        self.size = size
+        self.factory = factory
+        self._idle = {name: queue.Queue(maxsize=size) for name in strategies}
+        # Bumped by reset(); instances checked out before it are not taken back
+        self._generation = {name: 0 for name in strategies}
+        self._lock = threading.Lock()
+        self._init_seconds = {name: 0.0 for name in strategies}
+        self._created = {name: 0 for name in strategies}
+        self._reused = {name: 0 for name in strategies}
+
+    def warm(self):
+        """Create `size` instances for every strategy; meant to run once at startup."""
+        for name in self.strategies:
+            while not self._idle[name].full():
+                self._release(name, self._create(name), self._generation[name])
+
+    def _create(self, name):
+        start = time.perf_counter()
+        ydl = self.factory(dict(self.strategies[name]))
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._init_seconds[name] += elapsed
+            self._created[name] += 1
+        return ydl
+
+    def _release(self, name, ydl, generation):
+        with self._lock:
+            if generation != self._generation[name]:
+                return  # Created before a reset, e.g. with the old cookies
+            try:
+                self._idle[name].put_nowait(ydl)
+            except queue.Full:
+                pass  # A temporary instance: dropped, not closed, so it never writes its cookie jar
+
+    def extract(self, name, query):
+        generation = self._generation[name]
+        try:
+            ydl = self._idle[name].get_nowait()
+            with self._lock:
+                self._reused[name] += 1
+        except queue.Empty:
+            # Every instance is busy; build a temporary one rather than wait
+            ydl = self._create(name)
+        try:
+            return ydl.extract_info(query, download=False)
+        finally:
+            self._release(name, ydl, generation)
+
+    def reset(self, name):
+        """Drop the instances of a strategy, e.g. after its cookie file changed.
+
+        Idle instances are dropped without close(), which would save their old
+        cookie jar over the file; instances in use are dropped when they return.
+        """
+        with self._lock:
+            self._generation[name] += 1
+            self._drain(name)
+
+    def reset_cookie_file(self, cookie_path):
+        """Reset every strategy that reads `cookie_path`; returns their names."""
+        names = [name for name, options in self.strategies.items() if options.get('cookiefile') == cookie_path]
+        for name in names:
+            self.reset(name)
+        return names
+
+    def _drain(self, name):
+        drained = []
+        while True:
+            try:
+                drained.append(self._idle[name].get_nowait())
+            except queue.Empty:
+                return drained
+
+    def close(self):
+        """Close the idle instances of every strategy; meant for shutdown."""
+        for name in self.strategies:
+            for ydl in self._drain(name):
+                ydl.close()
+
+    def stats(self):
+        """Per-strategy instance counts and the setup time saved by reuse."""
+        with self._lock:
+            stats = {}
+            for name in self.strategies:
+                created = self._created[name]
+                average_init = self._init_seconds[name] / created if created else 0.0
+                stats[name] = {
+                    'created': created,
+                    'reused': self._reused[name],
+                    'average_init_seconds': average_init,
+                    'saved_seconds': average_init * self._reused[name],
+                }
+            return stats
+
+
+class ExtractionService:
+    def __init__(self, strategies, max_workers=None, max_concurrent=None, timeout=None, pool_size=None):
+        self.max_workers = max_workers or int(os.getenv('EXTRACT_WORKERS', '8'))
+        # More slots than threads would let jobs queue in the executor, where their timeout already runs
+        self.max_concurrent = min(self.max_workers, max_concurrent or int(os.getenv('EXTRACT_MAX_CONCURRENT', str(self.max_workers))))
+        self.timeout = timeout or float(os.getenv('EXTRACT_TIMEOUT', '45'))
+        self.timeouts = 0
+        self.running = 0  # jobs holding a slot, including abandoned ones still running
+        # One instance per thread, so a full pool of workers never has to build temporary ones
+        self.pool = YoutubeDLPool(strategies, size=pool_size or int(os.getenv('YTDL_POOL_SIZE', str(self.max_workers))))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='yt-dlp')
+        self._semaphore = None
+
+    async def warm(self):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.pool.warm)
+        for name, stats in self.pool.stats().items():
+            print(f"YoutubeDL pool '{name}': {stats['created']} instance(s), {stats['average_init_seconds'] * 1000:.1f}ms each")
+
+    async def run(self, fn, *args, timeout=None):
+        """Run a blocking callable in the pool, bounded by the concurrency cap and timeout."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        await self._semaphore.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            job = self._executor.submit(functools.partial(fn, *args))
+        except BaseException:
+            self._semaphore.release()
+            raise
+        self.running += 1
+        # Released when the thread is done with the job, not when the caller stops waiting
+        job.add_done_callback(lambda _: self._release_slot(loop))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(job, loop=loop), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise ExtractionTimeout(f'Timed out after {timeout or self.timeout:.0f}s') from None
+
+    def _release_slot(self, loop):
+        try:
+            loop.call_soon_threadsafe(self._job_done)
+        except RuntimeError:
+            pass  # The event loop is already closed; nobody is waiting for the slot
+
+    def _job_done(self):
+        self.running -= 1
+        self._semaphore.release()
+
+    async def extract(self, strategy, query, timeout=None):
+        """Async `extract_info(query, download=False)` on a pooled instance of `strategy`."""
+        return await self.run(self.pool.extract, strategy, query, timeout=timeout)
+
+    def shutdown(self):
+        saved = sum(stats['saved_seconds'] for stats in self.pool.stats().values())
+        print(f'YoutubeDL pool saved {saved:.1f}s of extractor setup')
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.pool.close()
@@ -0,0 +1,91 @@
+"""
+Shared async HTTP layer for the content commands (/meme, /advice, /nasa, ...).
+
+Every upstream call goes through one pooled aiohttp ClientSession per process,
+so sockets are kept alive between commands and a slow upstream only ever
+awaits instead of blocking the gateway event loop.
+"""
+import asyncio
+import os
+
+import aiohttp
+
+from json_stream import iter_array_items
+
+CONNECTION_LIMIT = int(os.getenv('HTTP_CONNECTION_LIMIT', '100'))
+CONNECTION_LIMIT_PER_HOST = int(os.getenv('HTTP_CONNECTION_LIMIT_PER_HOST', '10'))
+KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '30'))
+TOTAL_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '15'))
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+USER_AGENT = 'discord_bot (+https://github.com/Prince-Rosario/discord_bot)'
+
+# Same shape as requests.exceptions so callers keep their except chains:
+# HTTPError for 4xx/5xx, RequestException for anything on the wire (timeouts included).
+HTTPError = aiohttp.ClientResponseError
+RequestException = (aiohttp.ClientError, asyncio.TimeoutError)
+
+_session = None
+
+
+def get_session():
+    """Return the process-wide session, creating it on first use."""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=CONNECTION_LIMIT,
+            limit_per_host=CONNECTION_LIMIT_PER_HOST,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+        )
+        timeout = aiohttp.ClientTimeout(total=TOTAL_TIMEOUT, connect=CONNECT_TIMEOUT)
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers={'User-Agent': USER_AGENT},
+        )
+    return _session
+
+
+def get(url, **kwargs):
+    """Start a GET on the shared session; use as `async with fetcher.get(...) as response`."""
+    return get_session().get(url, **kwargs)
+
+
+async def get_json(url, **kwargs):
+    """GET `url` and decode the body as JSON, raising HTTPError on 4xx/5xx."""
+    async with get(url, **kwargs) as response:
+        response.raise_for_status()
+        # Several of the APIs we use answer JSON with a text/html content type
+        return await response.json(content_type=None)
+
+
+async def get_json_if_changed(url, etag=None, **kwargs):
+    """Conditional GET: returns (data, etag), where data is None if the server answered 304."""
+    headers = {'If-None-Match': etag} if etag else {}
+    async with get(url, headers=headers, **kwargs) as response:
+        if response.status == 304:
+            return None, etag
+        response.raise_for_status()
+        return await response.json(content_type=None), response.headers.get('ETag')
+
+
+def iter_json_items(response, path, chunk_size=16 * 1024):
+    """Yield the items of the JSON array under `path` in `response`'s body as they are downloaded."""
+    return iter_array_items(response.content.iter_chunked(chunk_size), path)
+
+
+async def is_reachable(url):
+    """HEAD `url`, following redirects, and report whether the resource is still served."""
+    try:
+        async with get_session().head(url, allow_redirects=True) as response:
+            # Some hosts refuse HEAD outright but still serve the GET
+            return response.status < 400 or response.status == 405
+    except RequestException:
+        return False
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
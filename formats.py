@@ -0,0 +1,105 @@
+"""
+Audio format selection for the play commands.
+
+yt-dlp lists every format of a track: audio-only and muxed, Opus, AAC
+and MP3, progressive HTTP, HLS and DASH. The highest `abr` is not the best
+choice for a voice bot. Discord plays 64 kbps by default and at most
+128 kbps in boosted servers, so bits above the channel's bitrate are
+downloaded and thrown away. Opus can be passed to Discord as it is, while
+every other codec has to be transcoded. An HLS stream also costs a
+playlist round trip and segment requests before the first frame.
+
+select_audio() therefore ranks formats by a cost, counted in kbps of
+wasted or missing quality:
+
+- bitrate below the cap costs its shortfall, and bitrate above the cap
+  costs a quarter of the excess (bandwidth we download and discard);
+- a codec that is not Opus costs TRANSCODE_COST;
+- HLS costs HLS_COST; DASH manifests and other segmented protocols are
+  only used when nothing else is left;
+- a format that also carries video costs MUXED_COST.
+
+Search results from `extract_flat` strategies are flat entries without
+formats. is_flat() tells the caller to extract those fully first.
+"""
+from audio import OPUS_CODECS
+
+DEFAULT_MAX_KBPS = 128
+MIN_KBPS, MAX_KBPS = 64, 128  # Discord's voice bitrates: default and boosted
+UNKNOWN_BITRATE_COST = 32
+TRANSCODE_COST = 24
+HLS_COST = 40
+MUXED_COST = 100
+SEGMENTED_COST = 1000
+
+PROGRESSIVE_PROTOCOLS = frozenset({'http', 'https', None})
+HLS_PROTOCOLS = frozenset({'m3u8', 'm3u8_native', 'hls'})
+
+
+class NoAudioFormat(Exception):
+    """Raised when a track has no format the bot can play."""
+
+
+def bitrate_cap(channel_bitrate=None):
+    """The bitrate worth fetching for a voice channel, in kbps (channel bitrates are in bps)."""
+    if not channel_bitrate:
+        return DEFAULT_MAX_KBPS
+    return min(MAX_KBPS, max(MIN_KBPS, channel_bitrate // 1000))
+
+
+def is_flat(info):
+    """True for a search or playlist entry that still has to be extracted to get its formats."""
+    if info.get('formats'):
+        return False
+    return info.get('_type') in ('url', 'url_transparent') or not info.get('url')
+
+
+def audio_formats(info):
+    """The formats of a resolved info dict; a single-format result is its own format."""
+    if info.get('formats'):
+        return info['formats']
+    if info.get('url') and not is_flat(info):
+        return [info]
+    return []
+
+
+def audio_codec(fmt):
+    """The format's audio codec without its profile ('opus', 'mp4a', ...), or None if yt-dlp does not know it."""
+    codec = (fmt.get('acodec') or '').split('.')[0]
+    return codec if codec and codec != 'none' else None
+
+
+def format_cost(fmt, max_kbps=DEFAULT_MAX_KBPS):
+    """Lower is better; None if the format is not playable at all."""
+    if not fmt.get('url') or fmt.get('acodec') == 'none':
+        return None
+    cost = 0.0
+    bitrate = fmt.get('abr') or (fmt.get('tbr') if fmt.get('vcodec') in ('none', None) else None)
+    if bitrate is None:
+        cost += UNKNOWN_BITRATE_COST
+    elif bitrate < max_kbps:
+        cost += max_kbps - bitrate
+    else:
+        cost += (bitrate - max_kbps) / 4
+    if audio_codec(fmt) not in OPUS_CODECS:
+        cost += TRANSCODE_COST
+    protocol = fmt.get('protocol')
+    if protocol in HLS_PROTOCOLS:
+        cost += HLS_COST
+    elif protocol not in PROGRESSIVE_PROTOCOLS:
+        cost += SEGMENTED_COST
+    if fmt.get('vcodec') not in ('none', None):
+        cost += MUXED_COST
+    return cost
+
+
+def select_audio(info, max_kbps=DEFAULT_MAX_KBPS):
+    """The cheapest playable format of `info`, or None if there is none."""
+    best = None
+    best_cost = None
+    for fmt in audio_formats(info):
+        cost = format_cost(fmt, max_kbps)
+        # yt-dlp lists formats worst first, so on a tie the later one wins
+        if cost is not None and (best_cost is None or cost <= best_cost):
+            best, best_cost = fmt, cost
+    return best
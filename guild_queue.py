@@ -0,0 +1,125 @@
+"""
+Per-guild music queue.
+
+A deque of Track entries: O(1) enqueue/dequeue at the ends, a hard length
+cap, indexed remove/move for queue management, and page-at-a-time
+rendering so /queue never has to join every title of a long playlist.
+Every change calls the queue's `on_change(queue)` hook, which is how the
+bot knows to snapshot it to the state backend.
+"""
+from collections import deque
+from itertools import islice
+
+
+class QueueFull(Exception):
+    """Raised when a track is added to a queue that is already at its limit."""
+
+
+class Track:
+    __slots__ = ('url', 'title', 'webpage_url', 'search', 'codec', 'source')
+
+    def __init__(self, url, title, webpage_url=None, search=None, codec=None):
+        self.url = url
+        self.title = title
+        self.webpage_url = webpage_url  # page to re-resolve the stream from, if known
+        self.search = search  # text to search for when there is no page URL yet
+        self.codec = codec  # audio codec of `url` as reported by yt-dlp, so it need not be probed
+        self.source = None  # audio source started ahead of time by the prefetcher
+
+    def release(self):
+        """Stop a pre-started audio source that is not going to be played."""
+        if self.source is not None:
+            self.source.cleanup()
+            self.source = None
+
+    def to_dict(self):
+        """The persistent part of the track (a started audio source is not)."""
+        return {'url': self.url, 'title': self.title, 'webpage_url': self.webpage_url, 'search': self.search,
+                'codec': self.codec}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('url'), data.get('title') or 'Unknown Title', data.get('webpage_url'), data.get('search'),
+                   data.get('codec'))
+
+    def __repr__(self):
+        return f'Track({self.title!r})'
+
+
+class GuildQueue:
+    def __init__(self, maxlen=500, on_change=None):
+        self.maxlen = maxlen
+        self.on_change = on_change
+        self._tracks = deque()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def __bool__(self):
+        return bool(self._tracks)
+
+    def __iter__(self):
+        return iter(self._tracks)
+
+    def __getitem__(self, index):
+        return self._tracks[index]
+
+    def append(self, track):
+        if len(self._tracks) >= self.maxlen:
+            raise QueueFull(f'The queue is full ({self.maxlen} tracks).')
+        self._tracks.append(track)
+        self._changed()
+
+    def popleft(self):
+        track = self._tracks.popleft()
+        self._changed()
+        return track
+
+    def clear(self):
+        for track in self._tracks:
+            track.release()
+        self._tracks.clear()
+        self._changed()
+
+    def remove(self, index):
+        """Remove and return the track at 0-based `index`."""
+        track = self._tracks[index]
+        del self._tracks[index]
+        self._changed()
+        return track
+
+    def move(self, source, destination):
+        """Move the track at 0-based `source` so it ends up at `destination`."""
+        head = self._tracks[0]
+        track = self._tracks[source]
+        del self._tracks[source]
+        self._tracks.insert(destination, track)
+        if self._tracks[0] is not head:
+            # Only the next track keeps a pre-started source; this one may not play for a long time
+            head.release()
+        self._changed()
+        return track
+
+    def snapshot(self):
+        return [track.to_dict() for track in self._tracks]
+
+    def restore(self, entries):
+        """Append tracks saved with snapshot(); entries that do not fit under `maxlen` are dropped."""
+        self._tracks.extend(Track.from_dict(entry) for entry in entries[:self.maxlen - len(self._tracks)])
+        self._changed()
+
+    def pages(self, per_page=10):
+        return max(1, -(-len(self._tracks) // per_page))
+
+    def page(self, number, per_page=10):
+        """Return the lines for 1-based page `number`, clamped to the valid range."""
+        number = min(max(1, number), self.pages(per_page))
+        start = (number - 1) * per_page
+        return [
+            f'{position}. {track.title}'
+            for position, track in enumerate(islice(self._tracks, start, start + per_page), start=start + 1)
+        ]
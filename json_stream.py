@@ -0,0 +1,108 @@
+"""
+Incremental JSON parsing for large API responses.
+
+iter_array_items() walks a JSON document as its bytes arrive and yields
+the elements of one nested array, decoding one element at a time with
+JSONDecoder.raw_decode. Values before the array are skipped and nothing
+after the point where the caller stops iterating is downloaded or parsed,
+so taking the first few results of a big search response needs neither
+the whole body nor a full object tree in memory.
+"""
+import codecs
+import json
+
+WHITESPACE = ' \t\n\r'
+NUMBER_CHARS = set('0123456789.eE+-')
+
+
+class _Stream:
+    def __init__(self, chunks):
+        self._chunks = chunks.__aiter__()
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    async def _fill(self):
+        if self._eof:
+            return False
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self._eof = True
+            chunk = self._text.decode(b'', final=True)
+        else:
+            chunk = self._text.decode(chunk)
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    async def peek(self):
+        """Next non-whitespace character, without consuming it."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not await self._fill():
+                raise ValueError('Unexpected end of JSON document')
+
+    async def take(self):
+        char = await self.peek()
+        self._pos += 1
+        return char
+
+    async def expect(self, expected):
+        char = await self.take()
+        if char != expected:
+            raise ValueError(f'Expected {expected!r} in JSON document, found {char!r}')
+
+    async def value(self):
+        """Decode the next complete JSON value, reading more input until it is whole."""
+        scalar = await self.peek() not in '"{['
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not await self._fill():
+                    raise
+                continue
+            # A number is only complete once something other than a number character follows it:
+            # "1" followed by ".0" in the next chunk must not decode as 1
+            if scalar and not self._eof and NUMBER_CHARS.issuperset(self._buffer[end:]):
+                await self._fill()
+                continue
+            self._pos = end
+            return value
+
+
+async def iter_array_items(chunks, path):
+    """Yield the items of the array found under the object keys in `path`.
+
+    `chunks` is an async iterable of bytes. Yields nothing if a key on the
+    path is missing.
+    """
+    stream = _Stream(chunks)
+    for key in path:
+        await stream.expect('{')
+        if await stream.peek() == '}':
+            return
+        while True:
+            name = await stream.value()
+            await stream.expect(':')
+            if name == key:
+                break
+            await stream.value()
+            if await stream.take() != ',':
+                return
+    await stream.expect('[')
+    if await stream.peek() == ']':
+        return
+    while True:
+        yield await stream.value()
+        separator = await stream.take()
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError(f'Expected \',\' or \']\' in JSON array, found {separator!r}')
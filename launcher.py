@@ -0,0 +1,165 @@
+"""
+Run the bot's shards across several worker processes.
+
+    python launcher.py
+
+The shard count comes from SHARD_COUNT or, if unset, from Discord's
+recommendation for the bot token. Shards are split into contiguous groups
+(SHARD_PROCESSES, default: one per CPU) and every group runs in its own
+process as an AutoShardedClient limited to those SHARD_IDS. Workers report
+per-shard health (latency, connection state, guild count) over a queue,
+from start-up on; the launcher prints it and restarts workers that exit,
+go silent or are not ready within their start-up grace period.
+Running `python bot.py` instead keeps everything in one process.
+"""
+import multiprocessing
+import os
+import queue
+import time
+
+import requests
+from dotenv import load_dotenv
+
+from shards import format_shard_ids, split_shards
+
+HEALTH_INTERVAL = float(os.getenv('SHARD_HEALTH_INTERVAL', '30'))
+STALE_AFTER = 3 * HEALTH_INTERVAL
+# Time for a worker to log in, load state and chunk guilds, plus IDENTIFY_INTERVAL for each of its shards
+STARTUP_GRACE = float(os.getenv('SHARD_STARTUP_GRACE', '120'))
+IDENTIFY_INTERVAL = 5  # Discord allows one IDENTIFY per 5 seconds per bucket
+SHUTDOWN_TIMEOUT = 30  # a worker closes its client and saves state on SIGTERM
+
+
+def recommended_shard_count(token):
+    response = requests.get(
+        'https://discord.com/api/v10/gateway/bot',
+        headers={'Authorization': f'Bot {token}'},
+        timeout=10,
+    )
+    response.raise_for_status()
+    return response.json()['shards']
+
+
+def run_worker(worker_id, worker_count, shard_ids, shard_count, health_queue):
+    # The bot reads its shard assignment from the environment at import time
+    os.environ['SHARD_IDS'] = format_shard_ids(shard_ids)
+    os.environ['SHARD_COUNT'] = str(shard_count)
+    os.environ['SHARD_WORKER_ID'] = str(worker_id)
+    os.environ['SHARD_WORKERS'] = str(worker_count)
+    import asyncio
+    import bot
+    asyncio.run(bot.main(health_queue))
+
+
+class Worker:
+    def __init__(self, worker_id, worker_count, shard_ids, shard_count, health_queue, context):
+        self.worker_id = worker_id
+        self.worker_count = worker_count
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.health_queue = health_queue
+        self.context = context
+        self.process = None
+        self.started_at = 0.0
+        self.last_report = None
+        self.ready = False
+        self.restarts = 0
+
+    @property
+    def startup_grace(self):
+        # discord.py identifies the shards of a process one after another
+        return STARTUP_GRACE + IDENTIFY_INTERVAL * len(self.shard_ids)
+
+    def start(self):
+        self.process = self.context.Process(
+            target=run_worker,
+            args=(self.worker_id, self.worker_count, self.shard_ids, self.shard_count, self.health_queue),
+            name=f'shards-{format_shard_ids(self.shard_ids)}',
+        )
+        self.process.start()
+        self.started_at = time.monotonic()
+        self.last_report = None
+        self.ready = False
+        print(f'Started worker {self.worker_id} (pid {self.process.pid}) for shards {format_shard_ids(self.shard_ids)}')
+
+    def terminate(self):
+        if self.process.is_alive():
+            self.process.terminate()
+
+    def join(self):
+        self.process.join(SHUTDOWN_TIMEOUT)
+        if self.process.is_alive():
+            print(f'Worker {self.worker_id} did not stop within {SHUTDOWN_TIMEOUT}s, killing it')
+            self.process.kill()
+            self.process.join()
+
+    def restart(self, reason):
+        print(f'Restarting worker {self.worker_id}: {reason}')
+        self.terminate()
+        self.join()
+        self.restarts += 1
+        self.start()
+
+    def report(self, report, now):
+        self.last_report = now
+        self.ready = report['ready']
+
+    def check(self, now):
+        if self.process.exitcode is not None:
+            self.restart(f'exited with code {self.process.exitcode}')
+        elif not self.ready and now - self.started_at > self.startup_grace:
+            self.restart(f'not ready {now - self.started_at:.0f}s after start')
+        elif self.last_report is not None and now - self.last_report > STALE_AFTER:
+            self.restart(f'no health report for {now - self.last_report:.0f}s')
+
+
+def print_health(report):
+    if not report['ready']:
+        print(f"[worker {report['worker_id']}] starting, {len(report['shards'])} shard(s) connected")
+        return
+    for shard in report['shards']:
+        state = 'closed' if shard['closed'] else 'ok'
+        latency = f"{shard['latency_ms']:.0f}ms" if shard['latency_ms'] is not None else 'n/a'
+        print(f"[worker {report['worker_id']}] shard {shard['shard_id']}: {state}, {latency}, {shard['guilds']} guild(s)")
+
+
+def main():
+    load_dotenv()
+    token = os.getenv('DISCORD_TOKEN')
+    shard_count = int(os.getenv('SHARD_COUNT') or recommended_shard_count(token))
+    processes = int(os.getenv('SHARD_PROCESSES') or os.cpu_count() or 1)
+    groups = split_shards(shard_count, processes)
+    print(f'Running {shard_count} shard(s) in {len(groups)} process(es)')
+
+    context = multiprocessing.get_context('spawn')
+    health_queue = context.Queue()
+    workers = [Worker(worker_id, len(groups), shard_ids, shard_count, health_queue, context)
+               for worker_id, shard_ids in enumerate(groups)]
+    for worker in workers:
+        worker.start()
+        # A process identifies its shards one after another; let it finish before the next one starts
+        time.sleep(IDENTIFY_INTERVAL * len(worker.shard_ids))
+
+    try:
+        while True:
+            try:
+                report = health_queue.get(timeout=HEALTH_INTERVAL)
+            except queue.Empty:
+                report = None
+            if report is not None:
+                workers[report['worker_id']].report(report, time.monotonic())
+                print_health(report)
+            now = time.monotonic()
+            for worker in workers:
+                worker.check(now)
+    except KeyboardInterrupt:
+        print('Stopping workers')
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Batched delivery of log-channel embeds.
+
+Event handlers post() embeds instead of sending them. Each channel gets a
+buffer that is flushed every `interval` seconds as messages of up to 10
+embeds, and at most `max_messages` messages per flush, so a raid or a busy
+voice evening costs a few requests per channel instead of one per event.
+
+Bursts are bounded in two ways:
+- merge: an embed posted with a `merge_key` that is already waiting
+  replaces the earlier one, which is counted in its footer (e.g. one
+  member hopping between voice channels);
+- drop: a channel buffer holds at most `max_pending` embeds; the oldest
+  are dropped first and the next message says how many were lost.
+"""
+import asyncio
+from collections import OrderedDict
+
+EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS = 6000  # Discord's limit for all embeds of one message together
+
+
+class _ChannelBuffer:
+    __slots__ = ('channel', 'entries', 'dropped', 'task', 'next_key')
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.entries = OrderedDict()  # key -> [embed, merged count]
+        self.dropped = 0
+        self.task = None
+        self.next_key = 0
+
+
+class LogDispatcher:
+    def __init__(self, interval=2.0, max_pending=100, max_messages=2):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_messages = max_messages
+        self.sent_messages = 0
+        self.merged = 0
+        self.dropped = 0
+        self._buffers = {}
+
+    def pending(self, channel_id):
+        buffer = self._buffers.get(channel_id)
+        return 0 if buffer is None else len(buffer.entries)
+
+    def post(self, channel, embed, merge_key=None):
+        """Queue `embed` for `channel`; returns at once."""
+        buffer = self._buffers.get(channel.id)
+        if buffer is None:
+            buffer = self._buffers[channel.id] = _ChannelBuffer(channel)
+        if merge_key is not None and merge_key in buffer.entries:
+            count = buffer.entries.pop(merge_key)[1]
+            buffer.entries[merge_key] = [embed, count + 1]
+            self.merged += 1
+        else:
+            if merge_key is None:
+                merge_key = ('event', buffer.next_key)
+                buffer.next_key += 1
+            buffer.entries[merge_key] = [embed, 1]
+            while len(buffer.entries) > self.max_pending:
+                buffer.entries.popitem(last=False)
+                buffer.dropped += 1
+                self.dropped += 1
+        if buffer.task is None or buffer.task.done():
+            buffer.task = asyncio.create_task(self._flush_later(channel.id))
+
+    async def _flush_later(self, channel_id):
+        await asyncio.sleep(self.interval)
+        buffer = self._buffers[channel_id]
+        await self._flush(buffer, self.max_messages)
+        if buffer.entries or buffer.dropped:
+            # Still backed up: keep draining at the same pace
+            buffer.task = asyncio.create_task(self._flush_later(channel_id))
+        else:
+            del self._buffers[channel_id]
+
+    async def _flush(self, buffer, max_messages=None):
+        sent = 0
+        while (buffer.entries or buffer.dropped) and (max_messages is None or sent < max_messages):
+            embeds = self._take_message(buffer)
+            content = None
+            if buffer.dropped:
+                content = f'{buffer.dropped} log event(s) were dropped because too many happened at once.'
+                buffer.dropped = 0
+            try:
+                await buffer.channel.send(content=content, embeds=embeds)
+                self.sent_messages += 1
+            except Exception as e:
+                print(f'Error sending log messages to channel {buffer.channel.id}: {e}')
+            sent += 1
+
+    @staticmethod
+    def _take_message(buffer):
+        embeds = []
+        size = 0
+        while buffer.entries and len(embeds) < EMBEDS_PER_MESSAGE:
+            key, (embed, count) = next(iter(buffer.entries.items()))
+            if embeds and size + len(embed) > MAX_EMBED_CHARS:
+                break
+            del buffer.entries[key]
+            if count > 1:
+                embed.set_footer(text=f'Latest of {count} events')
+            embeds.append(embed)
+            size += len(embed)
+        return embeds
+
+    async def close(self):
+        """Send everything still buffered, without waiting for the interval."""
+        for buffer in list(self._buffers.values()):
+            if buffer.task is not None:
+                buffer.task.cancel()
+            await self._flush(buffer)
+        self._buffers.clear()
@@ -0,0 +1,16 @@
+"""
+Splitting long result lists into Discord message pages.
+
+A message can carry at most 10 embeds, so results are grouped into pages
+of that size and shown one page at a time instead of one message each.
+"""
+
+EMBEDS_PER_MESSAGE = 10
+
+
+def paginate(items, per_page=EMBEDS_PER_MESSAGE, limit=None):
+    """Split `items` into lists of at most `per_page`, keeping only the first `limit` items."""
+    if per_page < 1:
+        raise ValueError('per_page must be at least 1')
+    items = list(items if limit is None else items[:limit])
+    return [items[start:start + per_page] for start in range(0, len(items), per_page)]
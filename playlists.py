@@ -0,0 +1,121 @@
+"""
+Bulk enqueue for YouTube and Spotify playlists.
+
+iter_playlist() is an async generator yielding chunks of unresolved Track
+entries: a YouTube playlist is flat-extracted (titles and page URLs only),
+a Spotify playlist/album is paged through the Web API and every entry
+becomes a YouTube search. Nothing is resolved to a stream URL here; the
+caller starts playing after the first chunk and the prefetcher resolves
+the rest as they come up.
+"""
+import os
+from urllib.parse import parse_qs, urlparse
+
+from guild_queue import Track
+
+
+class PlaylistError(Exception):
+    """Raised when a playlist URL cannot be listed."""
+
+
+def playlist_kind(url):
+    """Return 'youtube' or 'spotify' for URLs that should be bulk-enqueued, else None."""
+    if url.startswith('spotify:'):
+        parts = url.split(':')
+        return 'spotify' if len(parts) == 3 and parts[1] in ('playlist', 'album', 'track') else None
+    parsed = urlparse(url)
+    host = parsed.netloc.lower().removeprefix('www.').removeprefix('m.').removeprefix('music.')
+    if host == 'youtube.com' and parsed.path == '/playlist' and parse_qs(parsed.query).get('list'):
+        return 'youtube'
+    if host == 'open.spotify.com' and _spotify_path(parsed.path) is not None:
+        return 'spotify'
+    return None
+
+
+def _spotify_path(path):
+    # /playlist/<id>, /album/<id>, /track/<id>, optionally behind an /intl-xx/ prefix
+    parts = [part for part in path.split('/') if part and not part.startswith('intl-')]
+    if len(parts) >= 2 and parts[0] in ('playlist', 'album', 'track'):
+        return parts[0], parts[1]
+    return None
+
+
+async def iter_playlist(extractor, url, chunk_size=50):
+    kind = playlist_kind(url)
+    if kind == 'youtube':
+        generator = _iter_youtube(extractor, url, chunk_size)
+    elif kind == 'spotify':
+        generator = _iter_spotify(extractor, url)
+    else:
+        raise PlaylistError(f'{url} is not a playlist URL')
+    async for tracks in generator:
+        yield tracks
+
+
+async def _iter_youtube(extractor, url, chunk_size):
+    info = await extractor.extract('youtube_playlist', url)
+    if not info or not info.get('entries'):
+        raise PlaylistError('The playlist is empty or private.')
+    chunk = []
+    for entry in info['entries']:
+        if not entry or not entry.get('id'):
+            continue  # deleted/private videos show up as empty entries
+        page_url = entry.get('url') or f'https://www.youtube.com/watch?v={entry["id"]}'
+        if not page_url.startswith('http'):
+            page_url = f'https://www.youtube.com/watch?v={entry["id"]}'
+        chunk.append(Track(None, entry.get('title') or 'Unknown Title', webpage_url=page_url))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+_spotify = None
+
+
+def _spotify_client():
+    global _spotify
+    if _spotify is None:
+        if not (os.getenv('SPOTIPY_CLIENT_ID') and os.getenv('SPOTIPY_CLIENT_SECRET')):
+            raise PlaylistError('Spotify links need SPOTIPY_CLIENT_ID and SPOTIPY_CLIENT_SECRET to be set.')
+        import spotipy
+        from spotipy.oauth2 import SpotifyClientCredentials
+        _spotify = spotipy.Spotify(auth_manager=SpotifyClientCredentials(), requests_timeout=10)
+    return _spotify
+
+
+def _spotify_track(item):
+    if not item or item.get('is_local') or not item.get('name'):
+        return None
+    artists = ', '.join(artist['name'] for artist in item.get('artists') or [] if artist.get('name'))
+    title = f'{artists} - {item["name"]}' if artists else item['name']
+    return Track(None, title, search=title)
+
+
+async def _iter_spotify(extractor, url):
+    if url.startswith('spotify:'):
+        _, kind, spotify_id = url.split(':')
+    else:
+        kind, spotify_id = _spotify_path(urlparse(url).path)
+    # spotipy is synchronous, so its HTTP calls run in the extraction pool
+    client = await extractor.run(_spotify_client)
+    if kind == 'track':
+        track = _spotify_track(await extractor.run(client.track, spotify_id))
+        if track is not None:
+            yield [track]
+        return
+    if kind == 'album':
+        page = await extractor.run(client.album_tracks, spotify_id, 50)
+    else:
+        page = await extractor.run(
+            client.playlist_items, spotify_id,
+            'items(track(name,artists(name),is_local)),next', 100,
+        )
+    while page:
+        # Playlist items wrap the track object, album items are the track object
+        items = page['items'] if kind == 'album' else [item.get('track') for item in page['items']]
+        tracks = [track for track in map(_spotify_track, items) if track is not None]
+        if tracks:
+            yield tracks
+        page = await extractor.run(client.next, page) if page.get('next') else None
@@ -0,0 +1,72 @@
+"""
+Lookahead for the music queue.
+
+While a song plays, the Prefetcher walks the next few queued tracks in the
+background: tracks without a stream URL, or whose URL is about to expire,
+are re-resolved, and every URL is checked to still be served. The track
+that plays next also gets its audio source (the FFmpeg process) started
+ahead of time, so the transition does not wait on process startup and the
+first network round trip.
+"""
+import asyncio
+import time
+from itertools import islice
+
+from track_cache import EXPIRY_MARGIN, stream_expiry
+
+
+def needs_refresh(track, now=None):
+    """True if the track has no stream URL yet, or a re-resolvable one that is about to expire."""
+    if track.url is None:
+        return True
+    if track.webpage_url is None:
+        return False
+    now = time.time() if now is None else now
+    return stream_expiry(track.url, now) - EXPIRY_MARGIN <= now
+
+
+class Prefetcher:
+    def __init__(self, resolve, validate, make_source, lookahead=3, is_local=None):
+        self.resolve = resolve  # async (track) -> bool, fills in track.url
+        self.validate = validate  # async (url) -> bool
+        self.make_source = make_source  # async (url, codec) -> AudioSource, codec None if unknown
+        self.lookahead = lookahead
+        self.is_local = is_local  # (track) -> bool, True if it plays from a local file
+        self.warmed = 0
+        self._tasks = {}
+
+    def schedule(self, guild_id, guild_queue):
+        """Start a lookahead pass for a guild unless one is already running."""
+        task = self._tasks.get(guild_id)
+        if task is not None and not task.done():
+            return
+        self._tasks[guild_id] = asyncio.create_task(self._run(guild_id, guild_queue))
+
+    def cancel(self, guild_id):
+        task = self._tasks.pop(guild_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def _run(self, guild_id, guild_queue):
+        for position, track in enumerate(list(islice(guild_queue, self.lookahead))):
+            if track.source is not None or (self.is_local is not None and self.is_local(track)):
+                continue  # Already warm, or played from disk without any network round trip
+            try:
+                if needs_refresh(track) and not await self.resolve(track):
+                    continue
+                if not await self.validate(track.url):
+                    if track.webpage_url is None or not await self.resolve(track):
+                        continue
+                # Only the next track is warmed, and only if it is still next in line
+                if position == 0 and guild_queue and guild_queue[0] is track and track.source is None:
+                    source = await self.make_source(track.url, track.codec)
+                    # The track may have started playing (or left the queue) while the source was built
+                    if guild_queue and guild_queue[0] is track and track.source is None:
+                        track.source = source
+                        self.warmed += 1
+                    else:
+                        source.cleanup()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Prefetch failed for {track.title} in guild {guild_id}: {e}")
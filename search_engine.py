@@ -0,0 +1,181 @@
+"""
+Local fuzzy ranking for short names (skins, cached /play queries).
+
+Text is folded to a search key (accents, case and punctuation removed) so
+near-identical spellings compare equal. Documents are indexed by token;
+each query token is matched against the token vocabulary, not against
+every document: exact and prefix matches come from a sorted vocabulary,
+typo candidates from a trigram index over tokens and are then checked
+with a bounded edit distance (a swap of two neighbouring letters counts as
+one edit). A document's score is the average of its
+best per-query-token similarities, so one typo costs a fraction of a
+point and the ranking needs no network round trip.
+"""
+import bisect
+import re
+import unicodedata
+from collections import namedtuple
+
+Match = namedtuple('Match', 'doc_id score complete')
+
+PREFIX_SIMILARITY = 0.9
+
+
+def search_key(text):
+    """Fold text so case, accents, punctuation and spacing do not matter."""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'\w+', text))
+
+
+def token_trigrams(token):
+    padded = f' {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(token):
+    # Numbers never get typo tolerance: "part 2" must not match "part 3"
+    if len(token) < 3 or any(char.isdigit() for char in token):
+        return 0
+    return 1 if len(token) < 6 else 2
+
+
+def edit_distance(a, b, limit=None):
+    """Edit distance counting transpositions as one edit (optimal string alignment).
+
+    Returns limit + 1 as soon as the distance is certain to exceed `limit`.
+    """
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before_previous = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            distance = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                distance = min(distance, before_previous[j - 2] + 1)
+            current.append(distance)
+        # A transposition reaches back two rows, so only stop once both exceed the limit
+        if limit is not None and min(current) > limit and (before_previous is None or min(previous) > limit):
+            return limit + 1
+        before_previous, previous = previous, current
+    return previous[-1]
+
+
+class FuzzyIndex:
+    def __init__(self):
+        self._docs = {}  # doc_id -> (key, tokens)
+        self._token_docs = {}  # token -> doc ids
+        self._token_grams = {}  # trigram -> tokens
+        self._vocabulary = []  # sorted tokens, for prefix lookups
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._docs
+
+    def add(self, doc_id, text):
+        self.discard(doc_id)
+        key = search_key(text)
+        tokens = tuple(dict.fromkeys(key.split()))
+        self._docs[doc_id] = (key, tokens)
+        for token in tokens:
+            docs = self._token_docs.get(token)
+            if docs is None:
+                docs = self._token_docs[token] = set()
+                bisect.insort(self._vocabulary, token)
+                for gram in token_trigrams(token):
+                    self._token_grams.setdefault(gram, set()).add(token)
+            docs.add(doc_id)
+
+    def discard(self, doc_id):
+        entry = self._docs.pop(doc_id, None)
+        if entry is None:
+            return
+        for token in entry[1]:
+            docs = self._token_docs[token]
+            docs.discard(doc_id)
+            if not docs:
+                del self._token_docs[token]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+                for gram in token_trigrams(token):
+                    tokens = self._token_grams[gram]
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._token_grams[gram]
+
+    def _similar_tokens(self, query_token):
+        """Vocabulary tokens close to `query_token` with their similarity in (0, 1],
+        and the set of those that are only longer words starting with it."""
+        similar = {}
+        prefixes = set()
+        start = bisect.bisect_left(self._vocabulary, query_token)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(query_token):
+                break
+            if token == query_token:
+                similar[token] = 1.0
+            else:
+                similar[token] = PREFIX_SIMILARITY
+                prefixes.add(token)
+        limit = max_edits(query_token)
+        if limit:
+            candidates = set()
+            for gram in token_trigrams(query_token):
+                candidates |= self._token_grams.get(gram, set())
+            for token in candidates - similar.keys():
+                # One word extending the other ("believers", "believer") is another word, not a typo
+                if max_edits(token) == 0 or query_token.startswith(token):
+                    continue
+                distance = edit_distance(query_token, token, limit)
+                if distance <= limit:
+                    similar[token] = 1 - distance / max(len(query_token), len(token))
+        return similar, prefixes
+
+    def search(self, query, limit=None, min_score=0.5):
+        """Documents ranked by similarity to `query`, best first, as Match tuples.
+
+        `complete` is true when every query token and every document token
+        found a counterpart that is the same word or within the typo limit. A
+        query word that is only the start of a document word ("love" for
+        "lovely") makes the match incomplete: it ranks, but is a different word.
+        """
+        query_tokens = list(dict.fromkeys(search_key(query).split()))
+        if not query_tokens:
+            return []
+        per_token = [self._similar_tokens(token) for token in query_tokens]
+        candidates = set()
+        for similar, _ in per_token:
+            for token in similar:
+                candidates |= self._token_docs[token]
+
+        matches = []
+        for doc_id in candidates:
+            key, tokens = self._docs[doc_id]
+            matched_doc_tokens = set()
+            total = 0.0
+            for similar, _ in per_token:
+                best_token, best = None, 0.0
+                for token in tokens:
+                    if similar.get(token, 0.0) > best:
+                        best_token, best = token, similar[token]
+                if best_token is not None:
+                    matched_doc_tokens.add(best_token)
+                total += best
+            coverage = len(matched_doc_tokens) / len(tokens)
+            # Extra words in the document cost a little, so "prime vandal" ranks "Prime Vandal" first
+            score = total / len(per_token) * (0.9 + 0.1 * coverage)
+            if score >= min_score:
+                complete = coverage == 1 and all((similar.keys() - prefixes) & set(tokens) for similar, prefixes in per_token)
+                matches.append(Match(doc_id, score, complete))
+        matches.sort(key=lambda match: (-match.score, match.doc_id))
+        return matches if limit is None else matches[:limit]
+
+    def best(self, query, min_score=0.85):
+        """The closest document that differs from `query` only by small typos, or None."""
+        for match in self.search(query, min_score=min_score):
+            if match.complete:
+                return match.doc_id
+        return None
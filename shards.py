@@ -0,0 +1,82 @@
+"""
+Shard bookkeeping shared by the bot and the launcher.
+
+Discord assigns a guild to shard `(guild_id >> 22) % shard_count`. A bot
+process started with SHARD_IDS/SHARD_COUNT only receives events for its
+own shards, so it only loads settings and queues for the guilds those
+shards own. Without them, one AutoShardedClient runs every shard (with the
+count Discord recommends) and owns every guild.
+"""
+import os
+
+
+def shard_for(guild_id, shard_count):
+    return (guild_id >> 22) % shard_count
+
+
+def parse_shard_ids(text):
+    """Parse '0,1,4-7' into [0, 1, 4, 5, 6, 7]."""
+    shard_ids = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            shard_ids.extend(range(int(first), int(last) + 1))
+        else:
+            shard_ids.append(int(part))
+    return sorted(set(shard_ids))
+
+
+def format_shard_ids(shard_ids):
+    return ','.join(str(shard_id) for shard_id in shard_ids)
+
+
+def split_shards(shard_count, processes):
+    """Split shards 0..shard_count-1 into at most `processes` contiguous, evenly sized groups."""
+    processes = max(1, min(processes, shard_count))
+    base, extra = divmod(shard_count, processes)
+    groups = []
+    start = 0
+    for index in range(processes):
+        size = base + (1 if index < extra else 0)
+        groups.append(list(range(start, start + size)))
+        start += size
+    return groups
+
+
+class ShardConfig:
+    def __init__(self, shard_ids=None, shard_count=None):
+        if shard_ids is not None and shard_count is None:
+            raise ValueError('SHARD_IDS needs SHARD_COUNT to be set as well.')
+        if shard_ids is not None and any(not 0 <= shard_id < shard_count for shard_id in shard_ids):
+            raise ValueError(f'SHARD_IDS must be between 0 and {shard_count - 1}.')
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self._owned = None if shard_ids is None else frozenset(shard_ids)
+
+    @classmethod
+    def from_env(cls):
+        shard_ids = os.getenv('SHARD_IDS')
+        shard_count = os.getenv('SHARD_COUNT')
+        return cls(
+            parse_shard_ids(shard_ids) if shard_ids else None,
+            int(shard_count) if shard_count else None,
+        )
+
+    def owns(self, guild_id):
+        """Whether this process handles `guild_id`."""
+        if self._owned is None:
+            return True
+        return shard_for(guild_id, self.shard_count) in self._owned
+
+    @property
+    def runs_first_shard(self):
+        # Process-wide one-off work (e.g. syncing slash commands) happens where shard 0 lives
+        return self._owned is None or 0 in self._owned
+
+    def __repr__(self):
+        if self.shard_ids is None:
+            return 'ShardConfig(all shards)'
+        return f'ShardConfig(shards {format_shard_ids(self.shard_ids)} of {self.shard_count})'
@@ -0,0 +1,239 @@
+"""
+Bot state that has to outlive the process: guild settings, music queues
+and the track each guild is playing.
+
+MemoryState keeps queues in process memory and settings in the local
+SQLite file, which is enough for a single process. RedisState keeps all of
+it in Redis (STATE_REDIS_URL), so several bot processes can share the
+same data and a restarted process picks its queues back up. A guild's
+queue is written by the one process that is connected to its voice
+channel, so whole-queue snapshots (last writer wins) are safe. On its
+first start against an empty Redis, RedisState imports the guild settings
+of the local SQLite file.
+
+StateWriter batches queue and now-playing changes and writes them after a
+short delay, so queueing a 500-track playlist is a handful of writes
+rather than one per track.
+"""
+import asyncio
+import json
+import os
+
+from storage import SettingsStorage
+
+REDIS_URL = os.getenv('STATE_REDIS_URL')
+SNAPSHOT_DELAY = float(os.getenv('STATE_SNAPSHOT_DELAY', '1.0'))
+
+
+class MemoryState:
+    def __init__(self, settings_path='settings.db'):
+        self.settings = SettingsStorage(settings_path)
+        self._queues = {}
+        self._now_playing = {}
+
+    async def load_queues(self):
+        return {guild_id: list(entries) for guild_id, entries in self._queues.items()}
+
+    async def save_queue(self, guild_id, entries):
+        if entries:
+            self._queues[guild_id] = list(entries)
+        else:
+            self._queues.pop(guild_id, None)
+
+    async def load_now_playing(self):
+        return dict(self._now_playing)
+
+    async def set_now_playing(self, guild_id, entry):
+        if entry is None:
+            self._now_playing.pop(guild_id, None)
+        else:
+            self._now_playing[guild_id] = entry
+
+    async def close(self):
+        await self.settings.close()
+
+
+class RedisSettings:
+    """Same interface as storage.SettingsStorage, with one Redis hash per guild."""
+
+    COLUMNS = SettingsStorage.COLUMNS
+
+    def __init__(self, client, prefix, seed_path=None):
+        self.client = client
+        self.prefix = prefix
+        self.seed_path = seed_path  # SQLite settings to import into an empty Redis
+        try:
+            import redis.exceptions
+        except ImportError:
+            self.errors = (OSError,)
+        else:
+            # Connection failures and timeouts are RedisError subclasses; OSError covers the socket itself
+            self.errors = (redis.exceptions.RedisError, OSError)
+
+    def _key(self, guild_id):
+        return f'{self.prefix}settings:{guild_id}'
+
+    @classmethod
+    def _decode(cls, fields):
+        return {column: int(fields[column]) if fields.get(column) else None for column in cls.COLUMNS}
+
+    async def start(self):
+        if self.seed_path is None or not os.path.exists(self.seed_path):
+            return
+        if await self.client.exists(f'{self.prefix}settings'):
+            return  # already seeded, or in use since
+        # First start on Redis: bring along the channels configured while the bot ran on SQLite
+        storage = SettingsStorage(self.seed_path)
+        await storage.start()
+        try:
+            rows = await storage.load_all()
+        finally:
+            await storage.close()
+        for guild_id, fields in rows.items():
+            await self.update_settings(guild_id, **fields)
+        print(f'Imported settings of {len(rows)} guild(s) from {self.seed_path} into Redis')
+
+    async def close(self):
+        pass
+
+    async def get_settings(self, guild_id):
+        fields = await self.client.hgetall(self._key(guild_id))
+        return self._decode(fields) if fields else None
+
+    async def load_all(self):
+        guild_ids = [int(guild_id) for guild_id in await self.client.smembers(f'{self.prefix}settings')]
+        async with self.client.pipeline(transaction=False) as pipe:
+            for guild_id in guild_ids:
+                pipe.hgetall(self._key(guild_id))
+            rows = await pipe.execute()
+        return {guild_id: self._decode(fields) for guild_id, fields in zip(guild_ids, rows) if fields}
+
+    async def update_settings(self, guild_id, **fields):
+        """Set the given columns for a guild; other columns are left untouched."""
+        unknown = set(fields) - set(self.COLUMNS)
+        if unknown:
+            raise ValueError(f'Unknown settings column(s): {", ".join(sorted(unknown))}')
+        if not fields:
+            return
+        key = self._key(guild_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            for column, value in fields.items():
+                # A hash field cannot hold None, so an unset column is simply absent
+                if value is None:
+                    pipe.hdel(key, column)
+                else:
+                    pipe.hset(key, column, value)
+            pipe.sadd(f'{self.prefix}settings', guild_id)
+            await pipe.execute()
+
+
+class RedisState:
+    def __init__(self, url, prefix='discord_bot:', client=None, seed_path=None):
+        if client is None:
+            import redis.asyncio
+            client = redis.asyncio.from_url(url, decode_responses=True)
+        self.client = client
+        self.prefix = prefix
+        self.settings = RedisSettings(self.client, prefix, seed_path)
+
+    async def load_queues(self):
+        guild_ids = [int(guild_id) for guild_id in await self.client.smembers(f'{self.prefix}queues')]
+        async with self.client.pipeline(transaction=False) as pipe:
+            for guild_id in guild_ids:
+                pipe.get(f'{self.prefix}queue:{guild_id}')
+            rows = await pipe.execute()
+        return {guild_id: json.loads(raw) for guild_id, raw in zip(guild_ids, rows) if raw}
+
+    async def save_queue(self, guild_id, entries):
+        async with self.client.pipeline(transaction=True) as pipe:
+            if entries:
+                pipe.set(f'{self.prefix}queue:{guild_id}', json.dumps(entries))
+                pipe.sadd(f'{self.prefix}queues', guild_id)
+            else:
+                pipe.delete(f'{self.prefix}queue:{guild_id}')
+                pipe.srem(f'{self.prefix}queues', guild_id)
+            await pipe.execute()
+
+    async def load_now_playing(self):
+        playing = await self.client.hgetall(f'{self.prefix}now_playing')
+        return {int(guild_id): json.loads(raw) for guild_id, raw in playing.items()}
+
+    async def set_now_playing(self, guild_id, entry):
+        if entry is None:
+            await self.client.hdel(f'{self.prefix}now_playing', guild_id)
+        else:
+            await self.client.hset(f'{self.prefix}now_playing', guild_id, json.dumps(entry))
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_state(settings_path='settings.db'):
+    """RedisState if STATE_REDIS_URL is set, otherwise MemoryState with SQLite settings."""
+    if REDIS_URL:
+        # settings_path seeds an empty Redis, so switching backends keeps every guild's channels
+        return RedisState(REDIS_URL, seed_path=settings_path)
+    return MemoryState(settings_path)
+
+
+class StateWriter:
+    def __init__(self, state, delay=SNAPSHOT_DELAY):
+        self.state = state
+        self.delay = delay
+        self.writes = 0
+        self._queues = {}  # guild_id -> GuildQueue changed since the last flush
+        self._now_playing = {}  # guild_id -> track dict, or None once nothing is playing
+        self._task = None
+        self._flushing = None  # the flush in progress, which close() lets finish
+
+    def queue_changed(self, guild_id, queue):
+        self._queues[guild_id] = queue
+        self._schedule()
+
+    def now_playing_changed(self, guild_id, track):
+        self._now_playing[guild_id] = None if track is None else track.to_dict()
+        self._schedule()
+
+    @property
+    def pending(self):
+        return bool(self._queues or self._now_playing)
+
+    def _schedule(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        # Also picks up changes made during a flush and retries writes that failed
+        while True:
+            await asyncio.sleep(self.delay)
+            self._flushing = asyncio.ensure_future(self.flush())
+            await asyncio.shield(self._flushing)
+            if not self.pending:
+                return
+
+    async def flush(self):
+        queues, self._queues = self._queues, {}
+        now_playing, self._now_playing = self._now_playing, {}
+        try:
+            for guild_id in list(queues):
+                await self.state.save_queue(guild_id, queues[guild_id].snapshot())
+                del queues[guild_id]
+                self.writes += 1
+            for guild_id in list(now_playing):
+                await self.state.set_now_playing(guild_id, now_playing[guild_id])
+                del now_playing[guild_id]
+                self.writes += 1
+        except Exception as e:
+            print(f'Error saving bot state: {e}')
+            # Kept for the next flush, unless a newer change for the guild came in meanwhile
+            for guild_id, queue in queues.items():
+                self._queues.setdefault(guild_id, queue)
+            for guild_id, entry in now_playing.items():
+                self._now_playing.setdefault(guild_id, entry)
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        if self._flushing is not None:
+            await self._flushing
+        await self.flush()
@@ -0,0 +1,181 @@
+"""
+Async front-end for the guild settings database.
+
+All SQLite work happens on one dedicated worker thread that owns the
+connection. Coroutines submit jobs and await the result, so queries and
+fsyncs never run on the gateway event loop. Writes that arrive while the
+worker is busy are applied together and committed once (group commit).
+"""
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+
+_STOP = object()
+
+
+class SettingsStorage:
+    """Guild settings table served from a background SQLite thread."""
+
+    COLUMNS = ('welcome_channel_id', 'log_channel_id')
+    errors = (sqlite3.Error,)  # what a failed read or write raises, for callers to catch
+
+    def __init__(self, path='settings.db', commit_delay=0.02, max_batch=200):
+        self.path = path
+        self.commit_delay = commit_delay  # how long a write waits for company before committing
+        self.max_batch = max_batch
+        self.commits = 0
+        self.writes = 0
+        self._jobs = queue.Queue()
+        self._thread = None
+
+    async def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='settings-db', daemon=True)
+        self._thread.start()
+        # The first job only completes once the connection is open and migrated
+        await self._submit(False, lambda conn: None)
+
+    async def close(self):
+        if self._thread is None:
+            return
+        self._jobs.put(_STOP)
+        await asyncio.to_thread(self._thread.join)
+        self._thread = None
+
+    async def get_settings(self, guild_id):
+        """Return {column: value} for a guild, or None if it has no row."""
+        return await self._submit(False, self._select_one, guild_id)
+
+    async def load_all(self):
+        """Return {guild_id: {column: value}} for every stored guild."""
+        return await self._submit(False, self._select_all)
+
+    async def update_settings(self, guild_id, **fields):
+        """Upsert the given columns for a guild; other columns are left untouched."""
+        unknown = set(fields) - set(self.COLUMNS)
+        if unknown:
+            raise ValueError(f'Unknown settings column(s): {", ".join(sorted(unknown))}')
+        if not fields:
+            return
+        await self._submit(True, self._upsert, guild_id, fields)
+
+    def _submit(self, is_write, fn, *args):
+        if self._thread is None:
+            raise RuntimeError('SettingsStorage.start() must be awaited first')
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._jobs.put((is_write, fn, args, future, loop))
+        return future
+
+    # Everything below runs on the worker thread
+
+    def _run(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._migrate(conn)
+            while True:
+                batch = self._next_batch()
+                stop = _STOP in batch
+                self._run_batch(conn, [job for job in batch if job is not _STOP])
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _next_batch(self):
+        batch = [self._jobs.get()]
+        deadline = None
+        while len(batch) < self.max_batch and batch[-1] is not _STOP:
+            try:
+                batch.append(self._jobs.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            if not any(job[0] for job in batch if job is not _STOP):
+                break
+            if deadline is None:
+                deadline = time.monotonic() + self.commit_delay
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._jobs.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_batch(self, conn, batch):
+        results = []
+        wrote = False
+        for is_write, fn, args, future, loop in batch:
+            try:
+                results.append((future, loop, fn(conn, *args), None))
+                wrote = wrote or is_write
+            except Exception as e:
+                results.append((future, loop, None, e))
+        if wrote:
+            try:
+                conn.commit()
+                self.commits += 1
+                self.writes += sum(1 for job in batch if job[0])
+            except sqlite3.Error as e:
+                conn.rollback()
+                # Nothing in this batch is durable, so fail every write in it
+                results = [
+                    (future, loop, None, e) if job[0] else (future, loop, result, error)
+                    for job, (future, loop, result, error) in zip(batch, results)
+                ]
+        for future, loop, result, error in results:
+            loop.call_soon_threadsafe(_resolve, future, result, error)
+
+    @staticmethod
+    def _migrate(conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS settings (
+                guild_id INTEGER PRIMARY KEY,
+                welcome_channel_id INTEGER
+            )
+        ''')
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(settings)')}
+        if 'log_channel_id' not in columns:
+            conn.execute('ALTER TABLE settings ADD COLUMN log_channel_id INTEGER')
+            print('Log channel column added successfully')
+        conn.commit()
+
+    def _select_one(self, conn, guild_id):
+        row = conn.execute(
+            f'SELECT {", ".join(self.COLUMNS)} FROM settings WHERE guild_id = ?',
+            (guild_id,),
+        ).fetchone()
+        return dict(zip(self.COLUMNS, row)) if row else None
+
+    def _select_all(self, conn):
+        rows = conn.execute(f'SELECT guild_id, {", ".join(self.COLUMNS)} FROM settings')
+        return {row[0]: dict(zip(self.COLUMNS, row[1:])) for row in rows}
+
+    @staticmethod
+    def _upsert(conn, guild_id, fields):
+        columns = list(fields)
+        conn.execute(
+            f'''
+            INSERT INTO settings (guild_id, {", ".join(columns)})
+            VALUES (?, {", ".join("?" for _ in columns)})
+            ON CONFLICT(guild_id) DO UPDATE SET
+                {", ".join(f"{column} = excluded.{column}" for column in columns)}
+            ''',
+            (guild_id, *fields.values()),
+        )
+
+
+def _resolve(future, result, error):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
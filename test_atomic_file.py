@@ -0,0 +1,51 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from atomic_file import replace_file
+
+
+class TestReplaceFile(unittest.TestCase):
+    """Test suite for atomic JSON file replacement"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'cache.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_concurrent_writers_never_mix(self):
+        """Test that writers saving the same file at once leave one complete version"""
+        payloads = [json.dumps({'writer': writer, 'data': 'x' * 100_000}) for writer in range(8)]
+
+        def write(payload):
+            for _ in range(20):
+                replace_file(self.path, payload)
+
+        threads = [threading.Thread(target=write, args=(payload,)) for payload in payloads]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with open(self.path, encoding='utf-8') as f:
+            self.assertIn(f.read(), payloads)
+        self.assertEqual(os.listdir(self.tmpdir.name), ['cache.json'])
+
+    def test_failed_write_keeps_old_file(self):
+        """Test that a write that fails leaves the previous file and no temporary file"""
+        replace_file(self.path, 'old')
+
+        with self.assertRaises(TypeError):
+            replace_file(self.path, None)
+
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), 'old')
+        self.assertEqual(os.listdir(self.tmpdir.name), ['cache.json'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
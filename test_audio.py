@@ -0,0 +1,103 @@
+import asyncio
+import unittest
+
+from audio import AudioSourceFactory, before_options, probe_key
+
+
+def googlevideo_url(itag, video='abc'):
+    return f'https://rr1---sn.googlevideo.com/videoplayback?expire=1&id={video}&itag={itag}'
+
+
+class TestAudioSourceFactory(unittest.TestCase):
+    """Test suite for choosing between Opus passthrough and PCM transcoding"""
+
+    def make_factory(self, codecs=None, fail=False):
+        probed = []
+
+        async def probe(url):
+            probed.append(url)
+            if fail:
+                raise OSError('ffprobe not found')
+            return codecs.get(url), 128
+
+        factory = AudioSourceFactory(
+            lambda url, **kwargs: ('opus', url, kwargs),
+            lambda url, **kwargs: ('pcm', url, kwargs),
+            probe,
+        )
+        return factory, probed
+
+    def test_probe_key(self):
+        """Test that googlevideo URLs are keyed by itag and others by host and path"""
+        self.assertEqual(probe_key(googlevideo_url(251)), 'itag:251')
+        self.assertEqual(probe_key('https://cdn.example.com/a.mp3?token=1'), 'cdn.example.com/a.mp3')
+
+    def test_hls_options(self):
+        """Test that HLS playlists get the protocol whitelist"""
+        self.assertIn('-protocol_whitelist', before_options('https://cf-hls.example.com/playlist.m3u8'))
+        self.assertNotIn('-protocol_whitelist', before_options(googlevideo_url(251)))
+        self.assertNotIn('-analyzeduration', before_options('https://cf-hls.example.com/playlist.m3u8'))
+
+    def test_progressive_streams_probe_briefly(self):
+        """Test that plain HTTP streams start with the short probe"""
+        self.assertIn('-analyzeduration 0', before_options(googlevideo_url(251)))
+
+    def test_local_files_get_no_network_options(self):
+        """Test that local files are opened without the reconnect options"""
+        self.assertNotIn('-reconnect', before_options('/var/cache/bot/audio/0123.ogg'))
+
+    def test_known_codec_skips_the_lookup(self):
+        """Test that a codec passed by the caller is used without probing"""
+        factory, probed = self.make_factory()
+
+        self.assertEqual(asyncio.run(factory.create('/var/cache/bot/audio/0123.ogg', codec='opus'))[0], 'opus')
+        self.assertEqual(probed, [])
+
+    def test_opus_itag_is_passed_through_without_probing(self):
+        """Test that YouTube's Opus formats use codec copy straight away"""
+        factory, probed = self.make_factory()
+
+        kind, url, kwargs = asyncio.run(factory.create(googlevideo_url(251)))
+
+        self.assertEqual(kind, 'opus')
+        self.assertEqual(kwargs['codec'], 'opus')
+        self.assertEqual(probed, [])
+        self.assertEqual(factory.passthrough, 1)
+
+    def test_probe_result_is_cached_per_format(self):
+        """Test that a non-Opus format is probed once and then transcoded"""
+        first, second = googlevideo_url(140, 'a'), googlevideo_url(140, 'b')
+        factory, probed = self.make_factory({first: 'aac'})
+
+        async def runner():
+            return [await factory.create(first), await factory.create(second)]
+
+        sources = asyncio.run(runner())
+
+        self.assertEqual([source[0] for source in sources], ['pcm', 'pcm'])
+        self.assertEqual(probed, [first])
+        self.assertEqual(factory.transcoded, 2)
+
+    def test_probed_opus_is_passed_through(self):
+        """Test that an Opus stream found by probing is passed through"""
+        url = 'https://cdn.example.com/track.opus'
+        factory, _ = self.make_factory({url: 'opus'})
+
+        self.assertEqual(asyncio.run(factory.create(url))[0], 'opus')
+
+    def test_failed_probe_falls_back_to_pcm(self):
+        """Test that a failed probe transcodes and is retried next time"""
+        url = 'https://cdn.example.com/track.ogg'
+        factory, probed = self.make_factory(fail=True)
+
+        async def runner():
+            return [await factory.create(url), await factory.create(url)]
+
+        sources = asyncio.run(runner())
+
+        self.assertEqual([source[0] for source in sources], ['pcm', 'pcm'])
+        self.assertEqual(len(probed), 2)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
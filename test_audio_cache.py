@@ -0,0 +1,142 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from audio_cache import AudioCache
+
+PAGE = 'https://www.youtube.com/watch?v=abc'
+STREAM = 'https://rr1.googlevideo.com/videoplayback?itag=251&expire=1'
+
+
+class TestAudioCache(unittest.TestCase):
+    """Test suite for the on-disk Opus cache"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stored = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_cache(self, size=100, fail=False, **kwargs):
+        async def store(url, path):
+            self.stored.append(url)
+            if fail:
+                raise RuntimeError('stream went away')
+            with open(path, 'wb') as f:
+                f.write(b'x' * size)
+
+        cache = AudioCache(self.directory, store=store, **kwargs)
+        cache.load()
+        return cache
+
+    def play(self, cache, *pages):
+        async def runner():
+            for page in pages:
+                cache.record_play(page, STREAM)
+                await asyncio.gather(*cache._tasks.values())
+        asyncio.run(runner())
+
+    def test_stored_after_min_plays(self):
+        """Test that a track is stored once played often enough and then served locally"""
+        cache = self.make_cache(min_plays=2)
+
+        self.play(cache, PAGE)
+        self.assertIsNone(cache.path_for(PAGE))
+        self.play(cache, PAGE)
+
+        path = cache.path_for('https://youtu.be/abc')  # same video, other URL form
+        self.assertTrue(os.path.exists(path))
+        self.assertIn(PAGE, cache)
+        self.assertEqual(self.stored, [STREAM])
+
+    def test_lru_eviction_by_size(self):
+        """Test that the least recently played file is evicted when over the size limit"""
+        cache = self.make_cache(size=100, min_plays=1, max_bytes=250)
+        first, second, third = (f'https://www.youtube.com/watch?v={video}' for video in ('a', 'b', 'c'))
+
+        self.play(cache, first, second)
+        cache.path_for(first)
+        self.play(cache, third)
+
+        self.assertIsNotNone(cache.path_for(first))
+        self.assertIsNone(cache.path_for(second))
+        self.assertIsNotNone(cache.path_for(third))
+        self.assertEqual(cache.evicted, 1)
+        self.assertEqual(len([name for name in os.listdir(self.directory) if name.endswith('.ogg')]), 2)
+
+    def test_failed_store_leaves_nothing_behind(self):
+        """Test that a failed store keeps no partial file and restarts the play count"""
+        cache = self.make_cache(min_plays=1, fail=True)
+
+        self.play(cache, PAGE)
+
+        self.assertIsNone(cache.path_for(PAGE))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_index_survives_restart(self):
+        """Test that stored files and pending play counts are loaded back"""
+        cache = self.make_cache(min_plays=2)
+        other = 'https://www.youtube.com/watch?v=other'
+        self.play(cache, PAGE, PAGE, other)
+        cache.save()
+        with open(os.path.join(self.directory, 'orphan.ogg.part'), 'wb'):
+            pass
+
+        restored = self.make_cache(min_plays=2)
+        self.play(restored, other)
+
+        self.assertIsNotNone(restored.path_for(PAGE))
+        self.assertIsNotNone(restored.path_for(other))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'orphan.ogg.part')))
+
+    def test_disabled_without_directory(self):
+        """Test that the cache does nothing when no directory is configured"""
+        cache = AudioCache(None)
+        cache.load()
+        cache.record_play(PAGE, STREAM)
+        self.assertIsNone(cache.path_for(PAGE))
+        self.assertEqual(cache._tasks, {})
+
+    def test_launcher_workers_get_their_own_directory_and_share(self):
+        """Test that worker processes never share an index and split the size budget"""
+        env = {'AUDIO_CACHE_DIR': self.directory, 'AUDIO_CACHE_MAX_MB': '300', 'SHARD_WORKERS': '3'}
+        with mock.patch.dict(os.environ, dict(env, SHARD_WORKER_ID='0')):
+            first = AudioCache.from_env()
+        with mock.patch.dict(os.environ, dict(env, SHARD_WORKER_ID='1')):
+            second = AudioCache.from_env()
+
+        self.assertNotEqual(first.directory, second.directory)
+        self.assertEqual(first.max_bytes, 100 * 1024 * 1024)
+
+        async def store(url, path):
+            with open(path, 'wb') as f:
+                f.write(b'x')
+
+        first.store = second.store = store
+        first.min_plays = second.min_plays = 1
+        first.load()
+        second.load()
+        self.play(first, PAGE)
+        self.play(second, 'https://www.youtube.com/watch?v=other')
+        first.save()
+        second.save()
+
+        restarted = AudioCache(first.directory)
+        restarted.load()
+        self.assertIsNotNone(restarted.path_for(PAGE))
+
+    def test_single_process_uses_the_directory_as_is(self):
+        """Test that without the launcher the whole directory and budget belong to the bot"""
+        with mock.patch.dict(os.environ, {'AUDIO_CACHE_DIR': self.directory, 'AUDIO_CACHE_MAX_MB': '300'}):
+            os.environ.pop('SHARD_WORKER_ID', None)
+            cache = AudioCache.from_env()
+        self.assertEqual(cache.directory, self.directory)
+        self.assertEqual(cache.max_bytes, 300 * 1024 * 1024)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,187 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import caching
+from caching import CachedFailure, FileBackend, Fresh, MemoryBackend, SingleFlight, cache_stats, cached
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test suite for request coalescing"""
+
+    def test_concurrent_calls_share_one_upstream_request(self):
+        """Test that ten concurrent callers trigger a single call and all get its result"""
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'apod-url'
+
+        async def runner():
+            return await asyncio.gather(*(flight.do('2024-05-01', fetch) for _ in range(10)))
+
+        self.assertEqual(asyncio.run(runner()), ['apod-url'] * 10)
+        self.assertEqual(len(calls), 1)
+
+    def test_failures_are_shared_and_not_remembered(self):
+        """Test that every waiter sees the error and the next call retries"""
+        flight = SingleFlight()
+        attempts = []
+
+        async def fetch():
+            attempts.append(1)
+            await asyncio.sleep(0.01)
+            if len(attempts) == 1:
+                raise ConnectionError('down')
+            return 'ok'
+
+        async def runner():
+            results = await asyncio.gather(flight.do('k', fetch), flight.do('k', fetch), return_exceptions=True)
+            return results, await flight.do('k', fetch)
+
+        results, retry = asyncio.run(runner())
+        self.assertTrue(all(isinstance(result, ConnectionError) for result in results))
+        self.assertEqual(retry, 'ok')
+        self.assertEqual(len(attempts), 2)
+
+
+class TestCached(unittest.TestCase):
+    """Test suite for the @cached decorator"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.calls = []
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_hit_after_first_call(self):
+        """Test that a second call with an equivalent key does not call upstream"""
+        @cached('test-hit', ttl=60, key=str.lower)
+        async def fetch(query):
+            self.calls.append(query)
+            return f'result for {query}'
+
+        async def runner():
+            return await fetch('Moon'), await fetch('moon')
+
+        self.assertEqual(asyncio.run(runner()), ('result for Moon', 'result for Moon'))
+        self.assertEqual(self.calls, ['Moon'])
+        self.assertEqual(cache_stats()['test-hit']['hits'], 1)
+        self.assertEqual(cache_stats()['test-hit']['misses'], 1)
+
+    def test_stale_value_is_served_while_refreshing(self):
+        """Test stale-while-revalidate: the old value comes back at once and is refreshed behind it"""
+        @cached('test-stale', ttl=0.05, stale_ttl=60)
+        async def fetch():
+            self.calls.append(1)
+            await asyncio.sleep(0.01)
+            return len(self.calls)
+
+        async def runner():
+            first = await fetch()
+            await asyncio.sleep(0.06)
+            stale = await fetch()
+            await asyncio.sleep(0.05)
+            return first, stale, await fetch()
+
+        self.assertEqual(asyncio.run(runner()), (1, 1, 2))
+        self.assertEqual(fetch.stats['stale_hits'], 1)
+
+    def test_failures_are_negatively_cached(self):
+        """Test that an error is remembered for negative_ttl instead of retried every call"""
+        @cached('test-negative', ttl=60, negative_ttl=60)
+        async def fetch():
+            self.calls.append(1)
+            raise ConnectionError('upstream down')
+
+        async def runner():
+            with self.assertRaises(ConnectionError):
+                await fetch()
+            with self.assertRaises(CachedFailure):
+                await fetch()
+
+        asyncio.run(runner())
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(fetch.stats['negative_hits'], 1)
+
+    def test_failed_refresh_keeps_serving_stale_value(self):
+        """Test that a failing revalidation neither replaces the stale value nor retries at once"""
+        @cached('test-stale-failure', ttl=0.05, stale_ttl=60, negative_ttl=60)
+        async def fetch():
+            self.calls.append(1)
+            if len(self.calls) > 1:
+                raise ConnectionError('upstream down')
+            return 'images'
+
+        async def runner():
+            first = await fetch()
+            await asyncio.sleep(0.06)
+            stale = await fetch()  # starts a refresh that fails
+            await asyncio.sleep(0.01)
+            return first, stale, await fetch(), await fetch()
+
+        self.assertEqual(asyncio.run(runner()), ('images',) * 4)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(fetch.stats['negative_hits'], 0)
+
+    def test_fresh_overrides_ttl(self):
+        """Test that a value returned as Fresh(value, ttl) expires on its own schedule"""
+        @cached('test-fresh', ttl=3600)
+        async def fetch():
+            self.calls.append(1)
+            return Fresh('provisional', 0.01)
+
+        async def runner():
+            await fetch()
+            await asyncio.sleep(0.02)
+            return await fetch()
+
+        self.assertEqual(asyncio.run(runner()), 'provisional')
+        self.assertEqual(len(self.calls), 2)
+
+    def test_file_backend_survives_restart(self):
+        """Test that values in a FileBackend are served by a new process"""
+        path = os.path.join(self.tmpdir.name, 'cache.json')
+
+        def make():
+            @cached('test-file', ttl=60, backend=FileBackend(path), key=str)
+            async def fetch(day):
+                self.calls.append(day)
+                return f'apod {day}'
+            return fetch
+
+        asyncio.run(make()('2024-05-01'))
+        self.assertEqual(asyncio.run(make()('2024-05-01')), 'apod 2024-05-01')
+        self.assertEqual(self.calls, ['2024-05-01'])
+
+    def test_memory_backend_evicts_least_recently_used(self):
+        """Test that the in-process backend stays within maxsize"""
+        backend = MemoryBackend(maxsize=2)
+        record = {'value': 1, 'error': None, 'fresh_until': time.time() + 60, 'stale_until': time.time() + 60}
+
+        async def runner():
+            await backend.set('a', record)
+            await backend.set('b', record)
+            await backend.get('a')
+            await backend.set('c', record)
+            return await backend.get('a'), await backend.get('b')
+
+        self.assertEqual(asyncio.run(runner()), (record, None))
+
+
+    def test_default_backend_is_size_bounded(self):
+        """Test that default_backend passes its size bound to the memory and file backends"""
+        with mock.patch.object(caching, 'REDIS_URL', None):
+            memory = caching.default_backend(maxsize=3)
+            file_backend = caching.default_backend(os.path.join(self.tmpdir.name, 'cache.json'), maxsize=4)
+        self.assertEqual((type(memory), memory.maxsize), (MemoryBackend, 3))
+        self.assertEqual((type(file_backend), file_backend.maxsize), (FileBackend, 4))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,84 @@
+import asyncio
+import itertools
+import unittest
+
+from content_pool import ContentPool
+
+
+class TestContentPool(unittest.TestCase):
+    """Test suite for the prefetched random-content pools"""
+
+    def make_pool(self, **kwargs):
+        counter = itertools.count()
+        self.calls = 0
+
+        async def fetch():
+            self.calls += 1
+            return [f'item-{next(counter)}']
+
+        return ContentPool('test', fetch, **kwargs)
+
+    def test_take_is_served_from_buffer_after_warmup(self):
+        """Test that a warmed pool answers without calling upstream"""
+        pool = self.make_pool(size=5, low_water=1)
+
+        async def runner():
+            pool.start()
+            await pool._refill_task
+            calls_before = self.calls
+            item = await pool.take(1)
+            return calls_before, item
+
+        calls_before, item = asyncio.run(runner())
+        self.assertEqual(calls_before, 5)
+        self.assertEqual(item, 'item-0')
+        self.assertEqual(pool.buffered, 1)
+        self.assertEqual(pool.fetched_inline, 0)
+
+    def test_refill_starts_below_low_water(self):
+        """Test that draining the buffer triggers a single background refill"""
+        pool = self.make_pool(size=4, low_water=2)
+
+        async def runner():
+            pool.start()
+            await pool._refill_task
+            for _ in range(3):
+                await pool.take(1)
+            task = pool._refill_task
+            await task
+            return len(pool)
+
+        self.assertEqual(asyncio.run(runner()), 4)
+
+    def test_recently_served_items_are_skipped_per_guild(self):
+        """Test that a guild does not get the same item twice while other guilds can"""
+        async def fetch():
+            return ['same joke']
+
+        pool = ContentPool('test', fetch, size=3, low_water=0, fallback='nothing new')
+
+        async def runner():
+            first = await pool.take(1)
+            repeat = await pool.take(1)
+            other_guild = await pool.take(2)
+            return first, repeat, other_guild
+
+        self.assertEqual(asyncio.run(runner()), ('same joke', 'nothing new', 'same joke'))
+
+    def test_upstream_failure_returns_fallback(self):
+        """Test that an API error gives the fallback message instead of raising"""
+        async def fetch():
+            raise ConnectionError('down')
+
+        pool = ContentPool('test', fetch, fallback='Error: Could not retrieve insult.')
+
+        async def runner():
+            item = await pool.take(1)
+            await pool.close()
+            return item
+
+        self.assertEqual(asyncio.run(runner()), 'Error: Could not retrieve insult.')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
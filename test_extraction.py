@@ -0,0 +1,202 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import yt_dlp
+
+from extraction import ExtractionService, ExtractionTimeout, YoutubeDLPool
+
+
+class FakeYoutubeDL:
+    def __init__(self, options):
+        self.options = options
+        self.closed = False
+
+    def extract_info(self, query, download=False):
+        return {'query': query, 'instance': self}
+
+    def close(self):
+        self.closed = True
+
+
+class TestYoutubeDLPool(unittest.TestCase):
+    """Test suite for the pooled YoutubeDL instances"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cookies = os.path.join(self.tmpdir.name, 'cookies.txt')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_pool(self, size=1, factory=FakeYoutubeDL):
+        strategies = {
+            'youtube': {'cookiefile': self.cookies, 'quiet': True},
+            'youtube_stream': {'cookiefile': self.cookies, 'quiet': True},
+            'jamendo': {'quiet': True},
+        }
+        return YoutubeDLPool(strategies, size=size, factory=factory)
+
+    def test_instances_are_reused(self):
+        """Test that warmed instances serve extractions and are counted as reuse"""
+        pool = self.make_pool()
+        pool.warm()
+
+        first = pool.extract('youtube', 'a')['instance']
+        second = pool.extract('youtube', 'b')['instance']
+
+        self.assertIs(first, second)
+        self.assertEqual(pool.stats()['youtube']['created'], 1)
+        self.assertEqual(pool.stats()['youtube']['reused'], 2)
+
+    def test_reset_drops_instances_without_closing(self):
+        """Test that reset neither closes idle instances nor takes back ones in use"""
+        pool = self.make_pool()
+        pool.warm()
+        idle = pool._idle['youtube'].queue[0]
+
+        in_use = {}
+
+        def extract_during_reset(options):
+            instance = FakeYoutubeDL(options)
+            instance.extract_info = lambda query, download=False: pool.reset('youtube') or in_use.setdefault('ydl', instance)
+            return instance
+
+        pool.reset('youtube')
+        pool.factory = extract_during_reset
+        pool.extract('youtube', 'a')
+
+        self.assertFalse(idle.closed)
+        self.assertTrue(pool._idle['youtube'].empty())
+        self.assertFalse(in_use['ydl'].closed)
+
+    def test_reset_cookie_file_resets_every_strategy_using_it(self):
+        """Test that all strategies sharing the cookie file are reset, and only those"""
+        pool = self.make_pool()
+        pool.warm()
+
+        self.assertEqual(sorted(pool.reset_cookie_file(self.cookies)), ['youtube', 'youtube_stream'])
+        self.assertTrue(pool._idle['youtube'].empty())
+        self.assertTrue(pool._idle['youtube_stream'].empty())
+        self.assertFalse(pool._idle['jamendo'].empty())
+
+    def test_reset_keeps_fresh_cookie_file(self):
+        """Test that resetting real YoutubeDL instances does not overwrite new cookies"""
+        with open(self.cookies, 'w', encoding='utf-8') as f:
+            f.write('# Netscape HTTP Cookie File\n')
+        pool = self.make_pool(factory=yt_dlp.YoutubeDL)
+        pool.warm()
+        for name in ('youtube', 'youtube_stream'):
+            pool._idle[name].queue[0].cookiejar  # a used instance has loaded the old cookies
+        fresh = '# Netscape HTTP Cookie File\n.youtube.com\tTRUE\t/\tTRUE\t0\tSID\tfresh\n'
+        with open(self.cookies, 'w', encoding='utf-8') as f:
+            f.write(fresh)
+
+        pool.reset_cookie_file(self.cookies)
+
+        with open(self.cookies, encoding='utf-8') as f:
+            self.assertEqual(f.read(), fresh)
+
+    def test_close_closes_idle_instances(self):
+        """Test that shutdown closes what is left in the pool"""
+        pool = self.make_pool()
+        pool.warm()
+        idle = pool._idle['jamendo'].queue[0]
+
+        pool.close()
+
+        self.assertTrue(idle.closed)
+        self.assertTrue(pool._idle['jamendo'].empty())
+
+
+class TestExtractionService(unittest.TestCase):
+    """Test suite for the bounded extraction worker pool"""
+
+    def make_service(self, workers=2, timeout=5.0):
+        service = ExtractionService({}, max_workers=workers, timeout=timeout, pool_size=1)
+        self.addCleanup(service._executor.shutdown, wait=True)
+        return service
+
+    def test_pool_has_an_instance_per_worker(self):
+        """Test that the YoutubeDL pool defaults to one instance per worker thread"""
+        with mock.patch.dict(os.environ):
+            os.environ.pop('YTDL_POOL_SIZE', None)
+            service = ExtractionService({'youtube': {}}, max_workers=8)
+        self.addCleanup(service._executor.shutdown, wait=True)
+        self.assertEqual(service.pool.size, 8)
+
+    def test_concurrency_cap(self):
+        """Test that no more than max_concurrent jobs run at the same time"""
+        service = ExtractionService({}, max_workers=4, max_concurrent=2, pool_size=1)
+        self.addCleanup(service._executor.shutdown, wait=True)
+        lock = threading.Lock()
+        running = [0, 0]  # now, peak
+
+        def job():
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return 'done'
+
+        async def runner():
+            return await asyncio.gather(*(service.run(job) for _ in range(6)))
+
+        self.assertEqual(asyncio.run(runner()), ['done'] * 6)
+        self.assertEqual(running[1], 2)
+
+    def test_timeout(self):
+        """Test that a slow job raises ExtractionTimeout and is counted"""
+        service = self.make_service(timeout=0.05)
+
+        with self.assertRaises(ExtractionTimeout):
+            asyncio.run(service.run(time.sleep, 0.3))
+        self.assertEqual(service.timeouts, 1)
+
+    def test_abandoned_jobs_keep_their_slot(self):
+        """Test that jobs after timed-out ones wait for a free thread instead of timing out"""
+        service = self.make_service(workers=2, timeout=0.3)
+
+        async def runner():
+            slow = [asyncio.ensure_future(service.run(time.sleep, 0.6)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            fast = [asyncio.ensure_future(service.run(lambda: time.sleep(0.05) or 'fast')) for _ in range(2)]
+            slow_results = await asyncio.gather(*slow, return_exceptions=True)
+            busy_after_timeout = service.running
+            return slow_results, busy_after_timeout, await asyncio.gather(*fast)
+
+        slow_results, busy_after_timeout, fast_results = asyncio.run(runner())
+
+        self.assertTrue(all(isinstance(result, ExtractionTimeout) for result in slow_results))
+        self.assertEqual(busy_after_timeout, 2)
+        self.assertEqual(fast_results, ['fast', 'fast'])
+
+    def test_cancelled_request_frees_its_slot(self):
+        """Test that cancelling a waiting request drops its job, and a running one frees its slot when done"""
+        service = self.make_service(workers=1)
+        started = []
+
+        async def runner():
+            running = asyncio.ensure_future(service.run(time.sleep, 0.1))
+            await asyncio.sleep(0.01)
+            waiting = asyncio.ensure_future(service.run(started.append, 'waiting'))
+            await asyncio.sleep(0.01)
+            waiting.cancel()
+            running.cancel()
+            await asyncio.gather(running, waiting, return_exceptions=True)
+            self.assertEqual(service.running, 1)  # the sleeping thread still holds its slot
+            return await service.run(lambda: 'next')
+
+        self.assertEqual(asyncio.run(runner()), 'next')
+        self.assertEqual(started, [])
+        self.assertEqual(service.running, 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,118 @@
+import asyncio
+import unittest
+
+try:
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    import fetcher
+except ImportError:
+    web = None
+
+
+def make_app():
+    async def data(request):
+        if request.headers.get('If-None-Match') == '"v1"':
+            return web.Response(status=304)
+        # text/html on purpose, like several of the real APIs
+        return web.Response(text='{"items": [1, 2]}', content_type='text/html', headers={'ETag': '"v1"'})
+
+    async def client_port(request):
+        return web.json_response({'port': request.transport.get_extra_info('peername')[1]})
+
+    async def no_head(request):
+        if request.method == 'HEAD':
+            return web.Response(status=405)
+        return web.Response(text='ok')
+
+    async def moved(request):
+        raise web.HTTPFound('/data')
+
+    app = web.Application()
+    app.router.add_get('/data', data)
+    app.router.add_get('/port', client_port)
+    app.router.add_route('*', '/no-head', no_head)
+    app.router.add_get('/moved', moved)
+    return app
+
+
+@unittest.skipIf(web is None, 'aiohttp is not installed')
+class TestFetcher(unittest.TestCase):
+    """Test suite for the shared HTTP layer, against a local aiohttp server"""
+
+    def run_with_server(self, body):
+        async def runner():
+            server = TestServer(make_app())
+            await server.start_server()
+            try:
+                return await body(lambda path: str(server.make_url(path)))
+            finally:
+                await fetcher.close_session()
+                await server.close()
+        return asyncio.run(runner())
+
+    def test_session_is_pooled(self):
+        """Test that calls share one session and reuse its kept-alive connection"""
+        async def body(url):
+            session = fetcher.get_session()
+            first = await fetcher.get_json(url('/port'))
+            second = await fetcher.get_json(url('/port'))
+            return session is fetcher.get_session(), first['port'], second['port']
+
+        same_session, first_port, second_port = self.run_with_server(body)
+        self.assertTrue(same_session)
+        self.assertEqual(first_port, second_port)
+
+    def test_closed_session_is_replaced(self):
+        """Test that a new session is created after close_session()"""
+        async def body(url):
+            session = fetcher.get_session()
+            await fetcher.close_session()
+            return session.closed, fetcher.get_session() is session
+
+        closed, same_session = self.run_with_server(body)
+        self.assertTrue(closed)
+        self.assertFalse(same_session)
+
+    def test_get_json_if_changed(self):
+        """Test that the ETag is returned and a 304 answers None with the same ETag"""
+        async def body(url):
+            changed = await fetcher.get_json_if_changed(url('/data'))
+            unchanged = await fetcher.get_json_if_changed(url('/data'), changed[1])
+            return changed, unchanged
+
+        changed, unchanged = self.run_with_server(body)
+        self.assertEqual(changed, ({'items': [1, 2]}, '"v1"'))
+        self.assertEqual(unchanged, (None, '"v1"'))
+
+    def test_get_json_raises_http_error(self):
+        """Test that a 4xx answer raises fetcher.HTTPError"""
+        async def body(url):
+            await fetcher.get_json(url('/missing'))
+
+        with self.assertRaises(fetcher.HTTPError):
+            self.run_with_server(body)
+
+    def test_is_reachable(self):
+        """Test that redirects are followed, 405 on HEAD counts as served and 404 does not"""
+        async def body(url):
+            return [await fetcher.is_reachable(url(path)) for path in ('/moved', '/no-head', '/missing')]
+
+        self.assertEqual(self.run_with_server(body), [True, True, False])
+
+    def test_unreachable_host(self):
+        """Test that a refused connection is reported as unreachable instead of raising"""
+        async def runner():
+            server = TestServer(make_app())
+            await server.start_server()
+            url = str(server.make_url('/data'))
+            await server.close()
+            try:
+                return await fetcher.is_reachable(url)
+            finally:
+                await fetcher.close_session()
+
+        self.assertFalse(asyncio.run(runner()))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -24,10 +24,9 @@ class TestFlaw3DuplicateCode(unittest.TestCase):
         
         # Count similar patterns between the functions
         similar_patterns = [
-            'INSERT OR REPLACE INTO settings',
-            'VALUES (?, ?)',
-            'conn.commit()',
-            'except Exception as e:',
+            'await settings_storage.update_settings(guild_id,',
+            '_cached_settings(guild_id)[',
+            'except settings_storage.errors as e:',
             'print(f\'Setting',
             'successfully\')'
         ]
@@ -47,18 +46,16 @@ class TestFlaw3DuplicateCode(unittest.TestCase):
         self.assertTrue(get_welcome_found and get_log_found, 
                        "Both get functions should exist and be nearly identical")
         
-        # Count similar patterns between the functions
+        # Count similar patterns between the functions (both read the settings cache)
         similar_patterns = [
-            'SELECT',
-            'FROM settings',
-            'WHERE guild_id = ?',
-            'c.fetchone()',
-            'return result[0] if result else None'
+            'settings = settings_cache.get(guild_id)',
+            'if settings else None',
+            'channel_id\'] if settings'
         ]
         
         pattern_count = sum(1 for pattern in similar_patterns if self.bot_content.count(pattern) >= 2)
         
-        self.assertGreaterEqual(pattern_count, 4, 
+        self.assertGreaterEqual(pattern_count, 3, 
                                f"Found {pattern_count} duplicated patterns between get functions - indicates code duplication")
         print(f"Found {pattern_count} duplicated patterns between get_welcome_channel and get_log_channel")
 
@@ -66,14 +63,13 @@ class TestFlaw3DuplicateCode(unittest.TestCase):
         """Test that database operation patterns are repeated across functions"""
         # Common database patterns to look for
         patterns = {
-            'insert_or_replace': 'INSERT OR REPLACE INTO',
-            'commit_pattern': 'conn.commit()',
-            'execute_pattern': 'c.execute(',
+            'update_settings': 'settings_storage.update_settings(',
+            'cache_write': '_cached_settings(guild_id)[',
+            'cache_read': 'settings_cache.get(guild_id)',
+            'storage_error': 'except settings_storage.errors as e:',
             'try_except': 'try:',
             'print_setting': 'print(f\'Setting',
-            'print_success': 'successfully\')',
-            'where_guild_id': 'WHERE guild_id = ?',
-            'values_placeholder': 'VALUES (?, ?)'
+            'print_success': 'successfully\')'
         }
         
         duplicated_patterns = []
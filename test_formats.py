@@ -0,0 +1,68 @@
+import unittest
+
+from formats import audio_codec, bitrate_cap, format_cost, is_flat, select_audio
+
+
+def fmt(format_id, abr, acodec='opus', protocol='https', vcodec='none', tbr=None):
+    return {'format_id': format_id, 'url': f'https://media.example.com/{format_id}', 'abr': abr,
+            'acodec': acodec, 'protocol': protocol, 'vcodec': vcodec, 'tbr': tbr}
+
+
+# What YouTube typically offers, worst first as yt-dlp lists them
+YOUTUBE_FORMATS = [
+    fmt('249', 50),
+    fmt('250', 70),
+    fmt('140', 129, acodec='mp4a.40.2'),
+    fmt('251', 135),
+    fmt('18', None, acodec='mp4a.40.2', vcodec='avc1.42001E', tbr=500),
+    fmt('233', None, acodec='mp4a.40.2', protocol='m3u8_native'),
+    {'format_id': 'sb0', 'url': 'https://i.ytimg.com/sb/0', 'acodec': 'none', 'vcodec': 'none', 'protocol': 'mhtml'},
+]
+
+
+class TestSelectAudio(unittest.TestCase):
+    """Test suite for the format cost model"""
+
+    def test_prefers_opus_near_the_cap(self):
+        """Test that Opus at the channel bitrate wins over higher or transcoded formats"""
+        self.assertEqual(select_audio({'formats': YOUTUBE_FORMATS}, 128)['format_id'], '251')
+        self.assertEqual(select_audio({'formats': YOUTUBE_FORMATS}, 64)['format_id'], '250')
+
+    def test_progressive_beats_hls(self):
+        """Test that an HLS stream is only chosen over a comparable progressive one if it is much better"""
+        formats = [fmt('http_mp3_128', 128, acodec='mp3'), fmt('hls_opus_64', 64, protocol='hls')]
+        self.assertEqual(select_audio({'formats': formats})['format_id'], 'http_mp3_128')
+        self.assertEqual(select_audio({'formats': formats[1:]})['format_id'], 'hls_opus_64')
+
+    def test_unplayable_formats_are_skipped(self):
+        """Test that formats without audio or URL are never chosen"""
+        self.assertIsNone(format_cost(YOUTUBE_FORMATS[-1]))
+        self.assertIsNone(select_audio({'formats': [YOUTUBE_FORMATS[-1]]}))
+        self.assertIsNone(select_audio({'formats': []}))
+
+    def test_flat_entries(self):
+        """Test that flat entries are recognised and single-format results are used as they are"""
+        flat = {'_type': 'url', 'url': 'https://www.youtube.com/watch?v=abc', 'title': 'Song'}
+        single = {'url': 'https://cdn.example.com/song.mp3', 'title': 'Song', 'ext': 'mp3'}
+        self.assertTrue(is_flat(flat))
+        self.assertIsNone(select_audio(flat))
+        self.assertFalse(is_flat(single))
+        self.assertIs(select_audio(single), single)
+
+    def test_audio_codec(self):
+        """Test that codec profiles are stripped and unknown codecs are None"""
+        self.assertEqual(audio_codec(YOUTUBE_FORMATS[3]), 'opus')
+        self.assertEqual(audio_codec(YOUTUBE_FORMATS[2]), 'mp4a')
+        self.assertIsNone(audio_codec(YOUTUBE_FORMATS[-1]))
+        self.assertIsNone(audio_codec({'url': 'https://cdn.example.com/song.mp3'}))
+
+    def test_bitrate_cap(self):
+        """Test that channel bitrates are clamped to what Discord plays"""
+        self.assertEqual(bitrate_cap(None), 128)
+        self.assertEqual(bitrate_cap(64000), 64)
+        self.assertEqual(bitrate_cap(8000), 64)
+        self.assertEqual(bitrate_cap(384000), 128)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
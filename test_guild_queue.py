@@ -0,0 +1,100 @@
+import unittest
+
+from guild_queue import GuildQueue, QueueFull, Track
+
+
+def make_queue(count, maxlen=500):
+    guild_queue = GuildQueue(maxlen)
+    for i in range(count):
+        guild_queue.append(Track(f'https://example.com/{i}', f'Song {i}'))
+    return guild_queue
+
+
+class TestGuildQueue(unittest.TestCase):
+    """Test suite for the deque-backed guild music queue"""
+
+    def test_fifo_order(self):
+        """Test that tracks are played in the order they were queued"""
+        guild_queue = make_queue(3)
+        self.assertEqual([guild_queue.popleft().title for _ in range(3)], ['Song 0', 'Song 1', 'Song 2'])
+        self.assertFalse(guild_queue)
+
+    def test_length_is_bounded(self):
+        """Test that appending past maxlen raises instead of dropping tracks"""
+        guild_queue = make_queue(2, maxlen=2)
+        with self.assertRaises(QueueFull):
+            guild_queue.append(Track('https://example.com/x', 'Overflow'))
+        self.assertEqual(len(guild_queue), 2)
+
+    def test_remove_by_index(self):
+        """Test that a track can be removed from the middle of the queue"""
+        guild_queue = make_queue(3)
+        self.assertEqual(guild_queue.remove(1).title, 'Song 1')
+        self.assertEqual([track.title for track in guild_queue], ['Song 0', 'Song 2'])
+
+    def test_move(self):
+        """Test that a track can be moved to another position"""
+        guild_queue = make_queue(4)
+        guild_queue.move(3, 0)
+        self.assertEqual([track.title for track in guild_queue], ['Song 3', 'Song 0', 'Song 1', 'Song 2'])
+
+    def test_move_releases_the_old_head_source(self):
+        """Test that a pre-started source is stopped once its track is no longer next"""
+        class Source:
+            cleaned_up = False
+
+            def cleanup(self):
+                self.cleaned_up = True
+
+        for source_index, destination in ((0, 2), (2, 0)):
+            guild_queue = make_queue(3)
+            head, source = guild_queue[0], Source()
+            head.source = source
+            guild_queue.move(source_index, destination)
+            self.assertIsNone(head.source)
+            self.assertTrue(source.cleaned_up)
+
+        guild_queue = make_queue(3)
+        guild_queue[0].source = source = Source()
+        guild_queue.move(2, 1)
+        self.assertIs(guild_queue[0].source, source)
+
+    def test_pagination(self):
+        """Test that pages are numbered from the queue position and clamped"""
+        guild_queue = make_queue(25)
+        self.assertEqual(guild_queue.pages(), 3)
+        self.assertEqual(guild_queue.page(1)[0], '1. Song 0')
+        self.assertEqual(guild_queue.page(3), ['21. Song 20', '22. Song 21', '23. Song 22', '24. Song 23', '25. Song 24'])
+        self.assertEqual(guild_queue.page(99), guild_queue.page(3))
+        self.assertEqual(GuildQueue().page(1), [])
+
+    def test_snapshot_round_trip(self):
+        """Test that a snapshot restores the same tracks into a new queue"""
+        guild_queue = make_queue(3)
+        guild_queue[1].search = 'artist - song'
+        guild_queue[1].codec = 'opus'
+        restored = GuildQueue(2)
+        restored.restore(guild_queue.snapshot())
+        self.assertEqual([track.title for track in restored], ['Song 0', 'Song 1'])
+        self.assertEqual(restored[1].search, 'artist - song')
+        self.assertEqual(restored[1].codec, 'opus')
+
+    def test_changes_call_on_change(self):
+        """Test that every mutation reports the queue to its on_change hook"""
+        changes = []
+        guild_queue = GuildQueue(on_change=changes.append)
+        guild_queue.append(Track(None, 'a'))
+        guild_queue.append(Track(None, 'b'))
+        guild_queue.move(1, 0)
+        guild_queue.popleft()
+        guild_queue.clear()
+        self.assertEqual(len(changes), 5)
+        self.assertTrue(all(change is guild_queue for change in changes))
+
+    def test_tracks_use_slots(self):
+        """Test that queue entries do not carry a per-instance __dict__"""
+        self.assertFalse(hasattr(Track('u', 't'), '__dict__'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import unittest
+
+from json_stream import iter_array_items
+
+
+def chunked(data, size):
+    sent = []
+
+    async def chunks():
+        for start in range(0, len(data), size):
+            sent.append(start)
+            yield data[start:start + size]
+
+    return chunks(), sent
+
+
+def collect(data, path, size=7, limit=None):
+    async def runner():
+        chunks, sent = chunked(data, size)
+        items = []
+        async for item in iter_array_items(chunks, path):
+            items.append(item)
+            if limit is not None and len(items) == limit:
+                break
+        return items, len(sent)
+
+    return asyncio.run(runner())
+
+
+class TestIterArrayItems(unittest.TestCase):
+    """Test suite for incremental JSON array parsing"""
+
+    def setUp(self):
+        self.document = {
+            'collection': {
+                'version': 1.0,
+                'href': 'https://images-api.nasa.gov/search?q=moon',
+                'items': [{'data': [{'media_type': 'image', 'title': f'Moon {i} – “é”'}], 'links': [{'href': f'https://img/{i}.jpg'}]} for i in range(50)],
+                'metadata': {'total_hits': 50},
+            }
+        }
+        self.data = json.dumps(self.document, ensure_ascii=False, indent=1).encode('utf-8')
+
+    def test_items_match_full_parse_across_chunk_boundaries(self):
+        """Test that tiny chunks, split numbers and split multi-byte characters parse correctly"""
+        for size in (1, 3, 7, 4096):
+            items, _ = collect(self.data, ('collection', 'items'), size)
+            self.assertEqual(items, self.document['collection']['items'], size)
+
+    def test_stopping_early_does_not_read_the_rest(self):
+        """Test that breaking after 5 items leaves most of the body unread"""
+        items, chunks_read = collect(self.data, ('collection', 'items'), size=64, limit=5)
+        self.assertEqual(len(items), 5)
+        self.assertLess(chunks_read, len(self.data) // 64 // 2)
+
+    def test_missing_or_empty_array(self):
+        """Test that a missing key or an empty array yields nothing"""
+        self.assertEqual(collect(b'{"collection": {"items": []}}', ('collection', 'items'))[0], [])
+        self.assertEqual(collect(b'{"collection": {"version": 12345}}', ('collection', 'items'))[0], [])
+        self.assertEqual(collect(b'{}', ('collection', 'items'))[0], [])
+
+    def test_truncated_document_raises(self):
+        """Test that a body cut off mid-item is an error, not a silent short result"""
+        with self.assertRaises(ValueError):
+            collect(self.data[:len(self.data) // 2], ('collection', 'items'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
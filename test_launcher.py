@@ -0,0 +1,42 @@
+import unittest
+from unittest import mock
+
+import launcher
+
+
+class TestWorkerHealth(unittest.TestCase):
+    """Test suite for the launcher's restart decisions"""
+
+    def make_worker(self, shard_ids):
+        worker = launcher.Worker(0, 1, shard_ids, 16, health_queue=None, context=None)
+        worker.process = mock.Mock(exitcode=None)
+        worker.started_at = 1000.0
+        worker.restart = mock.Mock()
+        return worker
+
+    def test_grace_scales_with_shards(self):
+        """Test that each shard of a worker adds one identify interval to its start-up grace"""
+        one, eight = self.make_worker([0]), self.make_worker(list(range(8)))
+        self.assertEqual(eight.startup_grace - one.startup_grace, 7 * launcher.IDENTIFY_INTERVAL)
+
+    def test_starting_worker_is_not_restarted_within_grace(self):
+        """Test that a worker still starting up is left alone until its grace period ends"""
+        worker = self.make_worker(list(range(8)))
+        worker.report({'ready': False}, 1000.0 + launcher.STARTUP_GRACE)
+        worker.check(1000.0 + launcher.STARTUP_GRACE + 1)
+        worker.restart.assert_not_called()
+        worker.check(1000.0 + worker.startup_grace + 1)
+        worker.restart.assert_called_once()
+
+    def test_ready_worker_is_restarted_when_reports_stop(self):
+        """Test that a ready worker is only restarted once its reports go stale"""
+        worker = self.make_worker([0])
+        worker.report({'ready': True}, 1010.0)
+        worker.check(1010.0 + launcher.STALE_AFTER)
+        worker.restart.assert_not_called()
+        worker.check(1011.0 + launcher.STALE_AFTER)
+        worker.restart.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,110 @@
+import asyncio
+import unittest
+
+from log_dispatcher import LogDispatcher
+
+
+class FakeEmbed:
+    def __init__(self, title, size=50):
+        self.title = title
+        self.footer = None
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def set_footer(self, text):
+        self.footer = text
+
+
+class FakeChannel:
+    def __init__(self, channel_id=1):
+        self.id = channel_id
+        self.messages = []
+
+    async def send(self, content=None, embeds=None):
+        self.messages.append((content, embeds))
+
+
+class TestLogDispatcher(unittest.TestCase):
+    """Test suite for batched log-channel delivery"""
+
+    def test_burst_is_batched_ten_per_message(self):
+        """Test that 25 events in one interval become 3 messages instead of 25"""
+        channel = FakeChannel()
+
+        async def runner():
+            dispatcher = LogDispatcher(interval=0.01, max_messages=5)
+            for i in range(25):
+                dispatcher.post(channel, FakeEmbed(f'event {i}'))
+            await asyncio.sleep(0.05)
+            return dispatcher
+
+        dispatcher = asyncio.run(runner())
+        self.assertEqual([len(embeds) for _, embeds in channel.messages], [10, 10, 5])
+        self.assertEqual(channel.messages[0][1][0].title, 'event 0')
+        self.assertEqual(dispatcher.pending(channel.id), 0)
+
+    def test_messages_per_flush_are_capped(self):
+        """Test that a backlog drains at max_messages per interval"""
+        channel = FakeChannel()
+
+        async def runner():
+            dispatcher = LogDispatcher(interval=0.05, max_messages=1)
+            for i in range(30):
+                dispatcher.post(channel, FakeEmbed(f'event {i}'))
+            await asyncio.sleep(0.07)
+            first_interval = len(channel.messages)
+            await dispatcher.close()
+            return first_interval
+
+        self.assertEqual(asyncio.run(runner()), 1)
+        self.assertEqual(sum(len(embeds) for _, embeds in channel.messages), 30)
+
+    def test_same_merge_key_keeps_latest(self):
+        """Test that repeated events for one member collapse into the newest, with a count"""
+        channel = FakeChannel()
+
+        async def runner():
+            dispatcher = LogDispatcher(interval=0.01)
+            dispatcher.post(channel, FakeEmbed('joined A'), merge_key=('voice', 7))
+            dispatcher.post(channel, FakeEmbed('member 8 joined'), merge_key=('voice', 8))
+            dispatcher.post(channel, FakeEmbed('moved A to B'), merge_key=('voice', 7))
+            await asyncio.sleep(0.03)
+
+        asyncio.run(runner())
+        embeds = channel.messages[0][1]
+        self.assertEqual([embed.title for embed in embeds], ['member 8 joined', 'moved A to B'])
+        self.assertEqual(embeds[1].footer, 'Latest of 2 events')
+
+    def test_overflow_drops_oldest_and_reports_it(self):
+        """Test backpressure: past max_pending the oldest events are dropped and counted"""
+        channel = FakeChannel()
+
+        async def runner():
+            dispatcher = LogDispatcher(interval=0.01, max_pending=5)
+            for i in range(8):
+                dispatcher.post(channel, FakeEmbed(f'event {i}'))
+            await asyncio.sleep(0.03)
+
+        asyncio.run(runner())
+        content, embeds = channel.messages[0]
+        self.assertIn('3 log event(s) were dropped', content)
+        self.assertEqual([embed.title for embed in embeds], [f'event {i}' for i in range(3, 8)])
+
+    def test_large_embeds_respect_message_size(self):
+        """Test that embeds are split so one message stays under 6000 characters"""
+        channel = FakeChannel()
+
+        async def runner():
+            dispatcher = LogDispatcher(interval=0.01, max_messages=5)
+            for i in range(4):
+                dispatcher.post(channel, FakeEmbed(f'event {i}', size=2500))
+            await asyncio.sleep(0.03)
+
+        asyncio.run(runner())
+        self.assertEqual([len(embeds) for _, embeds in channel.messages], [2, 2])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
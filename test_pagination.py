@@ -0,0 +1,29 @@
+import unittest
+
+from pagination import EMBEDS_PER_MESSAGE, paginate
+
+
+class TestPaginate(unittest.TestCase):
+    """Test suite for splitting results into message pages"""
+
+    def test_pages_hold_at_most_one_message_of_embeds(self):
+        """Test that 23 results become pages of 10, 10 and 3"""
+        pages = paginate(list(range(23)))
+        self.assertEqual([len(page) for page in pages], [EMBEDS_PER_MESSAGE, EMBEDS_PER_MESSAGE, 3])
+        self.assertEqual([item for page in pages for item in page], list(range(23)))
+
+    def test_limit_caps_total_results(self):
+        """Test that results beyond the limit are dropped"""
+        pages = paginate(list(range(100)), per_page=10, limit=25)
+        self.assertEqual(sum(len(page) for page in pages), 25)
+        self.assertEqual(len(pages), 3)
+
+    def test_empty_and_invalid_input(self):
+        """Test that no results give no pages and a zero page size is rejected"""
+        self.assertEqual(paginate([]), [])
+        with self.assertRaises(ValueError):
+            paginate([1], per_page=0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,33 @@
+import unittest
+
+from playlists import _spotify_track, playlist_kind
+
+
+class TestPlaylists(unittest.TestCase):
+    """Test suite for playlist detection and Spotify entry mapping"""
+
+    def test_youtube_playlist_urls(self):
+        """Test that only /playlist links are bulk-enqueued, not videos inside a playlist"""
+        self.assertEqual(playlist_kind('https://www.youtube.com/playlist?list=PL123'), 'youtube')
+        self.assertEqual(playlist_kind('https://music.youtube.com/playlist?list=PL123'), 'youtube')
+        self.assertIsNone(playlist_kind('https://www.youtube.com/watch?v=abc&list=PL123'))
+        self.assertIsNone(playlist_kind('never gonna give you up'))
+
+    def test_spotify_urls(self):
+        """Test Spotify playlist, album and track links and URIs"""
+        self.assertEqual(playlist_kind('https://open.spotify.com/playlist/37i9dQZF1DXcBWIGoYBM5M?si=x'), 'spotify')
+        self.assertEqual(playlist_kind('https://open.spotify.com/intl-de/album/4aawyAB9vmqN3uQ7FjRGTy'), 'spotify')
+        self.assertEqual(playlist_kind('spotify:track:4uLU6hMCjMI75M1A2tKUQC'), 'spotify')
+        self.assertIsNone(playlist_kind('https://open.spotify.com/artist/0OdUWJ0sBjDrqHygGUXeCF'))
+
+    def test_spotify_track_becomes_search(self):
+        """Test that a Spotify track maps to an unresolved 'artists - name' search"""
+        track = _spotify_track({'name': 'Numb', 'artists': [{'name': 'Linkin Park'}], 'is_local': False})
+        self.assertIsNone(track.url)
+        self.assertEqual(track.search, 'Linkin Park - Numb')
+        self.assertIsNone(_spotify_track({'name': 'Demo', 'artists': [], 'is_local': True}))
+        self.assertIsNone(_spotify_track(None))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
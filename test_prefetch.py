@@ -0,0 +1,128 @@
+import asyncio
+import time
+import unittest
+
+from guild_queue import GuildQueue, Track
+from prefetch import Prefetcher, needs_refresh
+
+
+class FakeSource:
+    def __init__(self, url, codec=None):
+        self.url = url
+        self.codec = codec
+        self.cleaned_up = False
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+async def make_source(url, codec=None):
+    return FakeSource(url, codec)
+
+
+def googlevideo_url(expire):
+    return f'https://rr1.googlevideo.com/videoplayback?itag=251&expire={int(expire)}'
+
+
+class TestPrefetcher(unittest.TestCase):
+    """Test suite for the queue lookahead"""
+
+    def run_prefetch(self, guild_queue, resolve=None, reachable=True):
+        resolved = []
+
+        async def default_resolve(track):
+            resolved.append(track.title)
+            track.url = googlevideo_url(time.time() + 3600)
+            return True
+
+        async def validate(url):
+            return reachable
+
+        async def runner():
+            prefetcher = Prefetcher(resolve or default_resolve, validate, make_source, lookahead=2)
+            prefetcher.schedule(1, guild_queue)
+            await prefetcher._tasks[1]
+            return prefetcher
+
+        return asyncio.run(runner()), resolved
+
+    def test_needs_refresh(self):
+        """Test which tracks have to be re-resolved before playing"""
+        page = 'https://www.youtube.com/watch?v=abc'
+        self.assertTrue(needs_refresh(Track(None, 'unresolved', page)))
+        self.assertTrue(needs_refresh(Track(googlevideo_url(time.time() - 5), 'expired', page)))
+        self.assertFalse(needs_refresh(Track(googlevideo_url(time.time() + 3600), 'fresh', page)))
+        self.assertFalse(needs_refresh(Track('https://example.com/a.mp3', 'direct')))
+
+    def test_resolves_lookahead_and_warms_next_track(self):
+        """Test that only the next N tracks are resolved and only the first is warmed"""
+        guild_queue = GuildQueue()
+        for title in ('one', 'two', 'three'):
+            guild_queue.append(Track(None, title, f'https://www.youtube.com/watch?v={title}'))
+
+        prefetcher, resolved = self.run_prefetch(guild_queue)
+
+        self.assertEqual(resolved, ['one', 'two'])
+        self.assertIsInstance(guild_queue[0].source, FakeSource)
+        self.assertIsNone(guild_queue[1].source)
+        self.assertIsNone(guild_queue[2].url)
+        self.assertEqual(prefetcher.warmed, 1)
+
+    def test_known_codec_is_passed_to_the_source(self):
+        """Test that the codec yt-dlp reported is handed over, so the source needs no probe"""
+        guild_queue = GuildQueue()
+        guild_queue.append(Track('https://cf-media.sndcdn.com/a.mp3', 'next', codec='mp3'))
+
+        self.run_prefetch(guild_queue)
+
+        self.assertEqual(guild_queue[0].source.codec, 'mp3')
+
+    def test_unreachable_stream_is_not_warmed(self):
+        """Test that a URL failing validation without a page URL is left alone"""
+        guild_queue = GuildQueue()
+        guild_queue.append(Track('https://example.com/gone.mp3', 'gone'))
+
+        self.run_prefetch(guild_queue, reachable=False)
+
+        self.assertIsNone(guild_queue[0].source)
+
+    def test_clear_releases_warmed_sources(self):
+        """Test that clearing the queue stops pre-started sources"""
+        guild_queue = GuildQueue()
+        guild_queue.append(Track(googlevideo_url(time.time() + 3600), 'next', 'https://www.youtube.com/watch?v=n'))
+        self.run_prefetch(guild_queue)
+        source = guild_queue[0].source
+
+        guild_queue.clear()
+
+        self.assertTrue(source.cleaned_up)
+
+    def test_source_built_after_track_left_is_released(self):
+        """Test that a source finished after its track started playing is cleaned up"""
+        guild_queue = GuildQueue()
+        guild_queue.append(Track(googlevideo_url(time.time() + 3600), 'next', 'https://www.youtube.com/watch?v=n'))
+        built = []
+
+        async def slow_make_source(url, codec=None):
+            # The player takes the track while the source is being started
+            guild_queue.popleft()
+            built.append(FakeSource(url))
+            return built[-1]
+
+        async def validate(url):
+            return True
+
+        async def runner():
+            prefetcher = Prefetcher(None, validate, slow_make_source)
+            prefetcher.schedule(1, guild_queue)
+            await prefetcher._tasks[1]
+            return prefetcher
+
+        prefetcher = asyncio.run(runner())
+
+        self.assertTrue(built[0].cleaned_up)
+        self.assertEqual(prefetcher.warmed, 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
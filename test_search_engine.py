@@ -0,0 +1,53 @@
+import unittest
+
+from search_engine import FuzzyIndex, edit_distance, search_key
+
+
+class TestSearchEngine(unittest.TestCase):
+    """Test suite for the local fuzzy ranking engine"""
+
+    def setUp(self):
+        self.index = FuzzyIndex()
+        for doc_id, name in enumerate(['Prime Vandal', 'Prime 2.0 Vandal', 'Reaver Operator', 'Prime Phantom']):
+            self.index.add(doc_id, name)
+
+    def test_search_key_folds_spelling_variants(self):
+        """Test that case, accents, punctuation and spacing are ignored"""
+        self.assertEqual(search_key('  Beyoncé -  HALO!! '), 'beyonce halo')
+
+    def test_edit_distance_with_limit(self):
+        """Test exact distances and the early exit past the limit"""
+        self.assertEqual(edit_distance('vandal', 'vandl'), 1)
+        self.assertEqual(edit_distance('kitten', 'sitting'), 3)
+        self.assertEqual(edit_distance('operator', 'phantom', limit=2), 3)
+        self.assertEqual(edit_distance('beleiver', 'believer'), 1)  # swapped neighbours are one edit
+
+    def test_ranking_prefers_closest_name(self):
+        """Test that typos and prefixes rank the intended document first"""
+        self.assertEqual(self.index.search('prime vandl')[0].doc_id, 0)
+        self.assertEqual(self.index.search('reav op')[0].doc_id, 2)
+        self.assertEqual(self.index.search('vandal', limit=2)[0].doc_id, 0)
+
+    def test_numbers_need_exact_match(self):
+        """Test that '2.1' does not fuzzily match '2.0'"""
+        self.assertNotIn(1, [match.doc_id for match in self.index.search('prime 2 1 vandal') if match.complete])
+
+    def test_best_requires_complete_match(self):
+        """Test that best() ignores documents with extra or missing words"""
+        self.assertEqual(self.index.best('prime phantm'), 3)
+        self.assertIsNone(self.index.best('prime'))
+
+    def test_best_ignores_prefix_matches(self):
+        """Test that a word that only starts another word is not a complete match"""
+        self.assertIsNone(self.index.best('prime phan'))
+        self.assertEqual(self.index.search('prime phan')[0].doc_id, 3)
+
+    def test_discard_removes_document(self):
+        """Test that discarded documents and their tokens disappear from results"""
+        self.index.discard(2)
+        self.assertEqual(self.index.search('reaver'), [])
+        self.assertEqual(len(self.index), 3)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
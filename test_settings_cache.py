@@ -0,0 +1,61 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from storage import SettingsStorage
+
+try:
+    import bot
+except ImportError:  # discord.py or discord-ext-menus is not installed
+    bot = None
+
+
+@unittest.skipIf(bot is None, 'the bot dependencies are not installed')
+class TestSettingsCache(unittest.TestCase):
+    """Test suite for the bot's in-memory copy of the guild settings"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.db_path = os.path.join(self.tmpdir.name, 'settings.db')
+        self.storage = SettingsStorage(self.db_path)
+        for patcher in (mock.patch.object(bot, 'settings_storage', self.storage),
+                        mock.patch.dict(bot.settings_cache, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_getters_answer_from_the_cache(self):
+        """Test that loaded settings are served without another query once the database is closed"""
+        async def runner():
+            await self.storage.start()
+            await self.storage.update_settings(42, welcome_channel_id=7, log_channel_id=8)
+            await bot.load_settings_cache()
+            await self.storage.close()
+            with mock.patch.object(self.storage, '_submit', side_effect=AssertionError('SQLite was queried')):
+                return bot.get_welcome_channel(42), bot.get_log_channel(42), bot.get_welcome_channel(99)
+
+        self.assertEqual(asyncio.run(runner()), (7, 8, None))
+
+    def test_cache_changes_only_after_a_successful_write(self):
+        """Test that a failed write leaves the cached channels as they were"""
+        async def runner():
+            await self.storage.start()
+            try:
+                await bot.set_welcome_channel(42, 7)
+                written = bot.get_welcome_channel(42)
+                with sqlite3.connect(self.db_path) as conn:
+                    conn.execute('DROP TABLE settings')
+                await bot.set_welcome_channel(42, 9)
+                await bot.set_log_channel(42, 8)
+                return written, bot.get_welcome_channel(42), bot.get_log_channel(42)
+            finally:
+                await self.storage.close()
+
+        self.assertEqual(asyncio.run(runner()), (7, 7, None))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,51 @@
+import os
+import unittest
+from unittest import mock
+
+from shards import ShardConfig, parse_shard_ids, shard_for, split_shards
+
+
+class TestShards(unittest.TestCase):
+    """Test suite for shard assignment and partitioning"""
+
+    def test_shard_for_matches_discord_formula(self):
+        """Test the (guild_id >> 22) % shard_count assignment"""
+        guild_id = 81384788765712384
+        self.assertEqual(shard_for(guild_id, 1), 0)
+        self.assertEqual(shard_for(guild_id, 16), (guild_id >> 22) % 16)
+
+    def test_parse_shard_ids(self):
+        """Test lists, ranges and duplicates in SHARD_IDS"""
+        self.assertEqual(parse_shard_ids('0, 1,4-6,5'), [0, 1, 4, 5, 6])
+
+    def test_split_shards_is_even_and_complete(self):
+        """Test that every shard is assigned exactly once in balanced groups"""
+        groups = split_shards(10, 4)
+        self.assertEqual([len(group) for group in groups], [3, 3, 2, 2])
+        self.assertEqual([shard for group in groups for shard in group], list(range(10)))
+        self.assertEqual(split_shards(2, 8), [[0], [1]])
+
+    def test_owned_guilds_are_partitioned(self):
+        """Test that each guild is owned by exactly one process"""
+        configs = [ShardConfig(group, 4) for group in split_shards(4, 2)]
+        for guild_id in range(0, 50 << 22, 1 << 22):
+            self.assertEqual(sum(config.owns(guild_id) for config in configs), 1)
+        self.assertTrue(configs[0].runs_first_shard)
+        self.assertFalse(configs[1].runs_first_shard)
+
+    def test_from_env(self):
+        """Test that no shard settings means one process owning everything"""
+        with mock.patch.dict(os.environ, {}, clear=True):
+            config = ShardConfig.from_env()
+        self.assertIsNone(config.shard_ids)
+        self.assertTrue(config.owns(12345))
+        with mock.patch.dict(os.environ, {'SHARD_IDS': '2-3', 'SHARD_COUNT': '4'}):
+            self.assertEqual(ShardConfig.from_env().shard_ids, [2, 3])
+        with self.assertRaises(ValueError):
+            ShardConfig([0])
+        with self.assertRaises(ValueError):
+            ShardConfig([4], 4)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from guild_queue import GuildQueue, Track
+from state import MemoryState, RedisSettings, RedisState, StateWriter
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class FlakyState(MemoryState):
+    """MemoryState whose queue saves can be made to fail or to wait"""
+
+    def __init__(self, settings_path, failures=0, delay=0):
+        super().__init__(settings_path)
+        self.failures = failures
+        self.delay = delay
+
+    async def save_queue(self, guild_id, entries):
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('state backend unavailable')
+        await super().save_queue(guild_id, entries)
+
+
+class TestStateWriter(unittest.TestCase):
+    """Test suite for debounced state snapshots"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.state = MemoryState(os.path.join(self.tmpdir.name, 'settings.db'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_burst_of_changes_is_one_write(self):
+        """Test that queueing many tracks quickly saves the queue once, with every track"""
+        writer = StateWriter(self.state, delay=0.05)
+
+        async def runner():
+            guild_queue = GuildQueue(on_change=lambda queue: writer.queue_changed(1, queue))
+            for i in range(100):
+                guild_queue.append(Track(None, f'Song {i}'))
+            await asyncio.sleep(0.1)
+            return await self.state.load_queues()
+
+        saved = asyncio.run(runner())
+        self.assertEqual(len(saved[1]), 100)
+        self.assertEqual(writer.writes, 1)
+
+    def test_now_playing_and_empty_queue(self):
+        """Test that now-playing is saved and cleared, and an emptied queue is deleted"""
+        writer = StateWriter(self.state, delay=10)
+
+        async def runner():
+            guild_queue = GuildQueue(on_change=lambda queue: writer.queue_changed(1, queue))
+            guild_queue.append(Track('https://a', 'Song A', 'https://youtube.com/watch?v=a'))
+            writer.now_playing_changed(1, guild_queue.popleft())
+            await writer.close()
+            playing, queues = await self.state.load_now_playing(), await self.state.load_queues()
+            writer.now_playing_changed(1, None)
+            await writer.close()
+            return playing, queues, await self.state.load_now_playing()
+
+        playing, queues, cleared = asyncio.run(runner())
+        self.assertEqual(playing[1]['title'], 'Song A')
+        self.assertEqual(queues, {})
+        self.assertEqual(cleared, {})
+
+
+    def test_failed_save_is_retried(self):
+        """Test that a failed write keeps the unsaved queues and a later flush saves all of them"""
+        state = FlakyState(os.path.join(self.tmpdir.name, 'flaky.db'), failures=1)
+        writer = StateWriter(state, delay=0.01)
+
+        async def runner():
+            for guild_id in (1, 2, 3):
+                guild_queue = GuildQueue(on_change=lambda queue, guild_id=guild_id: writer.queue_changed(guild_id, queue))
+                guild_queue.append(Track(None, f'Song {guild_id}'))
+            await asyncio.sleep(0.1)
+            return writer.pending, await state.load_queues()
+
+        pending, saved = asyncio.run(runner())
+        self.assertFalse(pending)
+        self.assertEqual(sorted(saved), [1, 2, 3])
+
+    def test_close_waits_for_running_flush(self):
+        """Test that closing during a flush lets it finish instead of dropping its changes"""
+        state = FlakyState(os.path.join(self.tmpdir.name, 'slow.db'), delay=0.05)
+        writer = StateWriter(state, delay=0)
+
+        async def runner():
+            for guild_id in (1, 2):
+                guild_queue = GuildQueue(on_change=lambda queue, guild_id=guild_id: writer.queue_changed(guild_id, queue))
+                guild_queue.append(Track(None, f'Song {guild_id}'))
+            await asyncio.sleep(0.02)  # the flush is now waiting on the first save
+            await writer.close()
+            return await state.load_queues()
+
+        self.assertEqual(sorted(asyncio.run(runner())), [1, 2])
+
+class _UnreachableRedis:
+    def pipeline(self, transaction=True):
+        raise ConnectionRefusedError('redis is down')
+
+
+class TestRedisSettings(unittest.TestCase):
+    """Test suite for the errors the Redis settings backend advertises"""
+
+    def test_errors_cover_connection_failures(self):
+        """Test that a write to an unreachable server raises one of settings.errors"""
+        settings = RedisSettings(_UnreachableRedis(), 'test:')
+
+        with self.assertRaises(settings.errors):
+            asyncio.run(settings.update_settings(1, welcome_channel_id=7))
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class TestRedisState(unittest.TestCase):
+    """Test suite for the Redis state backend, against fakeredis"""
+
+    def test_round_trip(self):
+        """Test that settings, queues and now-playing survive a new RedisState on the same server"""
+        async def runner():
+            server = fakeredis.FakeServer()
+            first = RedisState(None, client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+            await first.settings.update_settings(42, welcome_channel_id=7)
+            await first.settings.update_settings(42, log_channel_id=8)
+            await first.save_queue(42, [Track(None, 'Song', search='artist - song').to_dict()])
+            await first.set_now_playing(42, Track('https://a', 'Playing').to_dict())
+            second = RedisState(None, client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+            return await second.settings.load_all(), await second.load_queues(), await second.load_now_playing()
+
+        settings, queues, playing = asyncio.run(runner())
+        self.assertEqual(settings, {42: {'welcome_channel_id': 7, 'log_channel_id': 8}})
+        self.assertEqual(queues[42][0]['search'], 'artist - song')
+        self.assertEqual(playing[42]['title'], 'Playing')
+
+
+    def test_empty_redis_is_seeded_from_sqlite(self):
+        """Test that the first start imports SQLite settings and later starts leave Redis alone"""
+        async def runner(db_path):
+            local = MemoryState(db_path)
+            await local.settings.start()
+            await local.settings.update_settings(42, welcome_channel_id=7, log_channel_id=8)
+            await local.settings.update_settings(43, log_channel_id=9)
+            await local.close()
+            server = fakeredis.FakeServer()
+            first = RedisState(None, client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True),
+                               seed_path=db_path)
+            await first.settings.start()
+            await first.settings.update_settings(43, log_channel_id=10)
+            second = RedisState(None, client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True),
+                                seed_path=db_path)
+            await second.settings.start()
+            return await second.settings.load_all()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            settings = asyncio.run(runner(os.path.join(tmpdir, 'settings.db')))
+        self.assertEqual(settings, {
+            42: {'welcome_channel_id': 7, 'log_channel_id': 8},
+            43: {'welcome_channel_id': None, 'log_channel_id': 10},
+        })
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,110 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from storage import SettingsStorage
+
+
+class TestSettingsStorage(unittest.TestCase):
+    """Test suite for the async SQLite settings backend"""
+
+    def setUp(self):
+        """Create a throwaway database path for each test"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, 'settings.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_with_storage(self, body):
+        async def runner():
+            storage = SettingsStorage(self.db_path)
+            await storage.start()
+            try:
+                return await body(storage)
+            finally:
+                await storage.close()
+        return asyncio.run(runner())
+
+    def test_update_keeps_other_columns(self):
+        """Test that setting one channel does not wipe the other"""
+        async def body(storage):
+            await storage.update_settings(1, welcome_channel_id=10)
+            await storage.update_settings(1, log_channel_id=20)
+            return await storage.get_settings(1)
+
+        settings = self.run_with_storage(body)
+        self.assertEqual(settings, {'welcome_channel_id': 10, 'log_channel_id': 20})
+
+    def test_missing_guild_returns_none(self):
+        """Test that an unknown guild has no settings row"""
+        async def body(storage):
+            return await storage.get_settings(12345)
+
+        self.assertIsNone(self.run_with_storage(body))
+
+    def test_load_all_returns_every_guild(self):
+        """Test that load_all returns one entry per stored guild"""
+        async def body(storage):
+            await storage.update_settings(1, log_channel_id=5)
+            await storage.update_settings(2, welcome_channel_id=6)
+            return await storage.load_all()
+
+        self.assertEqual(self.run_with_storage(body), {
+            1: {'welcome_channel_id': None, 'log_channel_id': 5},
+            2: {'welcome_channel_id': 6, 'log_channel_id': None},
+        })
+
+    def test_concurrent_writes_share_commits(self):
+        """Test that a burst of writes is committed in fewer transactions"""
+        async def body(storage):
+            await asyncio.gather(*(
+                storage.update_settings(guild_id, log_channel_id=guild_id)
+                for guild_id in range(50)
+            ))
+            return storage.commits, storage.writes, len(await storage.load_all())
+
+        commits, writes, stored = self.run_with_storage(body)
+        self.assertEqual(writes, 50)
+        self.assertEqual(stored, 50)
+        self.assertLess(commits, writes)
+
+    def test_unknown_column_rejected(self):
+        """Test that only known settings columns can be written"""
+        async def body(storage):
+            await storage.update_settings(1, prefix='!')
+
+        with self.assertRaises(ValueError):
+            self.run_with_storage(body)
+
+    def test_errors_cover_database_failures(self):
+        """Test that a failed write raises one of the errors the storage advertises"""
+        async def body(storage):
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute('DROP TABLE settings')
+            await storage.update_settings(1, welcome_channel_id=7)
+
+        with self.assertRaises(SettingsStorage.errors):
+            self.run_with_storage(body)
+
+    def test_database_uses_wal_and_migrates_old_schema(self):
+        """Test that an old single-column table gains log_channel_id and WAL is enabled"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('CREATE TABLE settings (guild_id INTEGER PRIMARY KEY, welcome_channel_id INTEGER)')
+        conn.execute('INSERT INTO settings VALUES (1, 99)')
+        conn.commit()
+        conn.close()
+
+        async def body(storage):
+            return await storage.get_settings(1)
+
+        self.assertEqual(self.run_with_storage(body), {'welcome_channel_id': 99, 'log_channel_id': None})
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,97 @@
+import asyncio
+import unittest
+
+from timeline import PlayTimeline, TimelineStats
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeSource:
+    def __init__(self):
+        self.reads = 0
+
+    def read(self):
+        self.reads += 1
+        return b'frame'
+
+
+class TestPlayTimeline(unittest.TestCase):
+    """Test suite for time-to-first-audio timelines"""
+
+    def test_phases_are_recorded_relative_to_start(self):
+        """Test that phases keep their window, including overlapping ones"""
+        clock = FakeClock()
+        timeline = PlayTimeline('play', 1, clock=clock)
+
+        clock.now += 0.2
+        with timeline.phase('extract'):
+            clock.now += 1.0
+        timeline.phases.append(('connect', 0.2, 0.9))  # ran alongside the extraction
+
+        self.assertEqual([name for name, _, _ in timeline.phases], ['extract', 'connect'])
+        self.assertAlmostEqual(timeline.phases[0][1], 0.2)
+        self.assertAlmostEqual(timeline.durations()['extract'], 1.0)
+        self.assertIn('no audio', str(timeline))
+
+    def test_measure_times_concurrent_work(self):
+        """Test that measure records an awaited phase even when it runs in a task"""
+        timeline = PlayTimeline('play', 1)
+
+        async def runner():
+            connecting = asyncio.create_task(timeline.measure('connect', asyncio.sleep(0.01, result='vc')))
+            with timeline.phase('extract'):
+                await asyncio.sleep(0.02)
+            return await connecting
+
+        self.assertEqual(asyncio.run(runner()), 'vc')
+        connect = next(phase for phase in timeline.phases if phase[0] == 'connect')
+        extract = next(phase for phase in timeline.phases if phase[0] == 'extract')
+        self.assertLess(connect[2], extract[2])
+
+    def test_first_frame_ends_the_timeline(self):
+        """Test that the first read is recorded once and reported on the loop"""
+        timeline = PlayTimeline('play', 1)
+        source = FakeSource()
+        finished = []
+
+        async def runner():
+            timeline.watch_first_frame(source, asyncio.get_running_loop(), finished.append)
+            # The player thread reads frames
+            await asyncio.to_thread(lambda: [source.read() for _ in range(3)])
+            await asyncio.sleep(0)
+
+        asyncio.run(runner())
+
+        self.assertEqual(finished, [timeline])
+        self.assertEqual(source.reads, 3)
+        self.assertIsNotNone(timeline.first_audio)
+        self.assertIn('to first audio', str(timeline))
+
+
+class TestTimelineStats(unittest.TestCase):
+    """Test suite for aggregated play timings"""
+
+    def test_summary_percentiles(self):
+        """Test that totals and phases are summarized over recent plays"""
+        stats = TimelineStats(keep=3)
+        for index in range(5):
+            timeline = PlayTimeline('play', 1)
+            timeline.phases.append(('extract', 0.0, float(index)))
+            timeline.first_audio = float(index) + 0.5
+            stats.record(timeline)
+
+        summary = stats.summary()
+
+        self.assertEqual(len(stats), 3)
+        self.assertEqual(summary['first_audio'], (3.5, 4.5))
+        self.assertEqual(summary['extract'], (3.0, 4.0))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from track_cache import TrackCache, normalize_query, stream_expiry
+
+
+def make_entry(title, expire=None):
+    stream_url = 'https://rr1.googlevideo.com/videoplayback?itag=251'
+    if expire is not None:
+        stream_url += f'&expire={expire}'
+    return {'title': title, 'webpage_url': f'https://www.youtube.com/watch?v={title}', 'stream_url': stream_url}
+
+
+class TestTrackCache(unittest.TestCase):
+    """Test suite for the /play track-resolution cache"""
+
+    def setUp(self):
+        """Create a throwaway cache file for each test"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'track_cache.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_normalize_query_collapses_case_and_spacing(self):
+        """Test that search text differing only in case/spacing shares a key"""
+        self.assertEqual(normalize_query('  Never  Gonna Give You Up '), normalize_query('never gonna give you up'))
+
+    def test_normalize_query_ignores_punctuation_and_accents(self):
+        """Test that near-identical spellings of a search share a key"""
+        self.assertEqual(normalize_query('Beyoncé - Halo!'), normalize_query('beyonce halo'))
+
+    def test_fuzzy_lookup_tolerates_typos(self):
+        """Test that a misspelled text query is served from the cache only when asked to"""
+        cache = TrackCache(self.path)
+        cache.put('never gonna give you up', make_entry('rickroll'))
+        cache.put('https://youtu.be/dQw4w9WgXcQ', make_entry('rickroll'))
+        self.assertIsNone(cache.get('nevr gona give you up'))
+        self.assertEqual(cache.get('nevr gona give you up', fuzzy=True)['title'], 'rickroll')
+        # A different song that only shares words must not match
+        self.assertIsNone(cache.get('never gonna give you up remix', fuzzy=True))
+        self.assertIsNone(cache.get('https://youtu.be/dQw4w9WgXcR', fuzzy=True))
+
+    def test_fuzzy_lookup_never_swaps_in_a_longer_word(self):
+        """Test that a query that is the start of a cached word is a different song"""
+        cache = TrackCache(self.path)
+        for title in ('lovely', 'heathens', 'believer'):
+            cache.put(title, make_entry(title))
+        self.assertIsNone(cache.get('love', fuzzy=True))
+        self.assertIsNone(cache.get('heat', fuzzy=True))
+        self.assertIsNone(cache.get('believe', fuzzy=True))
+        self.assertIsNone(cache.get('believers', fuzzy=True))
+
+    def test_fuzzy_lookup_tolerates_transpositions(self):
+        """Test that swapped neighbouring letters still hit the cache"""
+        cache = TrackCache(self.path)
+        cache.put('believer', make_entry('believer'))
+        cache.put('imagine dragons thunder', make_entry('thunder'))
+        self.assertEqual(cache.get('beleiver', fuzzy=True)['title'], 'believer')
+        self.assertEqual(cache.get('imagien dragons thunder', fuzzy=True)['title'], 'thunder')
+
+    def test_normalize_query_youtube_urls(self):
+        """Test that the different YouTube URL shapes map to the video id"""
+        keys = {
+            normalize_query('https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=42'),
+            normalize_query('https://youtu.be/dQw4w9WgXcQ'),
+            normalize_query('https://music.youtube.com/watch?v=dQw4w9WgXcQ'),
+        }
+        self.assertEqual(keys, {'youtube:dQw4w9WgXcQ'})
+
+    def test_stream_expiry_reads_expire_parameter(self):
+        """Test that googlevideo expire= is used as the expiry time"""
+        self.assertEqual(stream_expiry('https://x.googlevideo.com/videoplayback?expire=1700000000'), 1700000000)
+        self.assertAlmostEqual(stream_expiry('https://example.com/a.mp3', now=1000), 1000 + 6 * 3600)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first"""
+        cache = TrackCache(self.path, maxsize=2)
+        cache.put('a', make_entry('a'))
+        cache.put('b', make_entry('b'))
+        cache.get('a')
+        cache.put('c', make_entry('c'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_expired_stream_is_detected_and_refreshable(self):
+        """Test that expired entries are flagged and update_stream renews them"""
+        cache = TrackCache(self.path)
+        entry = cache.put('song', make_entry('song', expire=int(time.time()) - 10))
+        self.assertTrue(TrackCache.stream_expired(entry))
+
+        fresh_url = f'https://rr2.googlevideo.com/videoplayback?expire={int(time.time()) + 3600}'
+        refreshed = cache.update_stream('song', fresh_url, '251')
+        self.assertFalse(TrackCache.stream_expired(refreshed))
+        self.assertEqual(cache.get('song')['stream_url'], fresh_url)
+
+    def test_entries_survive_restart(self):
+        """Test that saved entries are loaded back in LRU order"""
+        cache = TrackCache(self.path, maxsize=2)
+        cache.put('first', make_entry('first'))
+        cache.put('second', make_entry('second'))
+        cache.save()
+
+        restored = TrackCache(self.path, maxsize=2)
+        restored.load()
+        self.assertEqual(restored.get('second')['title'], 'second')
+        restored.put('third', make_entry('third'))
+        self.assertIsNone(restored.get('first'))
+
+
+    def test_burst_of_changes_is_one_save(self):
+        """Test that many scheduled saves in a row write the file once, with every entry"""
+        cache = TrackCache(self.path)
+
+        async def runner():
+            with mock.patch.object(cache, 'save', wraps=cache.save) as save:
+                for i in range(50):
+                    cache.put(f'song {i}', make_entry(f'song{i}'))
+                    cache.schedule_save(delay=0.02)
+                await asyncio.sleep(0.1)
+                return save.call_count
+
+        self.assertEqual(asyncio.run(runner()), 1)
+        restored = TrackCache(self.path)
+        restored.load()
+        self.assertEqual(len(restored), 50)
+
+    def test_close_saves_pending_changes(self):
+        """Test that closing writes changes whose delayed save has not run yet"""
+        cache = TrackCache(self.path)
+
+        async def runner():
+            cache.put('song', make_entry('song'))
+            cache.schedule_save(delay=60)
+            await cache.close()
+
+        asyncio.run(runner())
+        restored = TrackCache(self.path)
+        restored.load()
+        self.assertIsNotNone(restored.get('song'))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
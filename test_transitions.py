@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from transitions import TransitionScheduler
+
+
+class TestTransitionScheduler(unittest.TestCase):
+    """Test suite for the voice track transition scheduler"""
+
+    def test_request_does_not_block_calling_thread(self):
+        """Test that the player thread returns before the transition coroutine finishes"""
+        scheduler = TransitionScheduler()
+
+        async def runner():
+            loop = asyncio.get_running_loop()
+            done = asyncio.Event()
+
+            async def advance():
+                await asyncio.sleep(0.2)
+                scheduler.playback_started(1)
+                done.set()
+
+            returned_after = []
+
+            def player_thread():
+                start = time.perf_counter()
+                scheduler.request(loop, 1, advance)
+                returned_after.append(time.perf_counter() - start)
+
+            thread = threading.Thread(target=player_thread)
+            thread.start()
+            await asyncio.to_thread(thread.join)
+            await asyncio.wait_for(done.wait(), 2)
+            return returned_after[0]
+
+        returned_after = asyncio.run(runner())
+        self.assertLess(returned_after, 0.1)
+        self.assertEqual(scheduler.stats()['transitions'], 1)
+        self.assertGreaterEqual(scheduler.stats()['max_ms'], 200)
+
+    def test_transitions_for_one_guild_are_serialized(self):
+        """Test that two transitions for the same guild never overlap"""
+        scheduler = TransitionScheduler()
+        active = []
+        overlaps = []
+
+        async def runner():
+            loop = asyncio.get_running_loop()
+
+            async def advance():
+                async with scheduler.lock(1):
+                    if active:
+                        overlaps.append(True)
+                    active.append(True)
+                    await asyncio.sleep(0.05)
+                    active.pop()
+
+            scheduler.request(loop, 1, advance)
+            scheduler.request(loop, 1, advance)
+            await asyncio.sleep(0.3)
+
+        asyncio.run(runner())
+        self.assertEqual(overlaps, [])
+
+    def test_failures_are_counted_not_raised(self):
+        """Test that an exception in a transition is contained"""
+        scheduler = TransitionScheduler()
+
+        async def runner():
+            async def advance():
+                raise RuntimeError('voice client gone')
+
+            scheduler.request(asyncio.get_running_loop(), 1, advance)
+            await asyncio.sleep(0.05)
+
+        asyncio.run(runner())
+        self.assertEqual(scheduler.stats()['failures'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
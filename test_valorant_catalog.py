@@ -0,0 +1,105 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from valorant_catalog import SkinCatalog, SkinIndex, compact_skins
+
+PAYLOAD = {'data': [
+    {'uuid': '1', 'displayName': 'Elderflame Vandal', 'displayIcon': 'https://img/1.png'},
+    {'uuid': '2', 'displayName': 'Prime Vandal', 'displayIcon': None,
+     'levels': [{'displayIcon': 'https://img/2-level.png'}]},
+    {'uuid': '3', 'displayName': 'Prime Phantom', 'displayIcon': 'https://img/3.png'},
+    {'uuid': '4', 'displayName': 'Melee', 'displayIcon': 'https://img/4.png'},
+]}
+
+
+class TestSkinIndex(unittest.TestCase):
+    """Test suite for the in-memory skin name index"""
+
+    def setUp(self):
+        self.index = SkinIndex(compact_skins(PAYLOAD))
+
+    def names(self, query):
+        return [skin['displayName'] for skin in self.index.search(query)]
+
+    def test_substring_matches_match_linear_scan(self):
+        """Test that the n-gram index finds what a case-insensitive substring scan would"""
+        for query in ['vandal', 'PRIME', 'e', 'me', 'dal', 'flame van', 'lee', 'xyz', '']:
+            expected = [skin['displayName'] for skin in PAYLOAD['data']
+                        if query and query.lower() in skin['displayName'].lower()]
+            found = [self.index.skins[position]['displayName'] for position in self.index.substring_matches(query)]
+            self.assertEqual(found, expected, query)
+
+    def test_search_ranks_substring_matches_before_typos(self):
+        """Test that exact substring hits come first and misspellings still match"""
+        self.assertEqual(self.names('prime vandal')[0], 'Prime Vandal')
+        self.assertEqual(self.names('elderflam vandl')[0], 'Elderflame Vandal')
+        self.assertEqual(self.names('phantm'), ['Prime Phantom'])
+        self.assertEqual(self.names('xyz'), [])
+
+    def test_full_name_returns_only_that_skin(self):
+        """Test that a full skin name is answered from the name table without ranking"""
+        self.index.fuzzy.search = None  # would fail if the ranked search ran
+        self.assertEqual(self.names('  prime VANDAL '), ['Prime Vandal'])
+
+    def test_icon_falls_back_to_first_level(self):
+        """Test that skins without a top-level icon use their first level's icon"""
+        self.assertEqual(self.index.search('prime vandal')[0]['displayIcon'], 'https://img/2-level.png')
+
+
+class TestSkinCatalog(unittest.TestCase):
+    """Test suite for the disk-cached, ETag-refreshed skin catalog"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'skins.json')
+        self.calls = []
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    async def fetch(self, etag):
+        self.calls.append(etag)
+        if etag == 'v1':
+            return None, 'v1'
+        return PAYLOAD, 'v1'
+
+    def test_lookups_do_not_refetch(self):
+        """Test that the catalog is downloaded once and then served from memory"""
+        async def runner():
+            catalog = SkinCatalog(self.fetch, self.path)
+            await catalog.search('vandal')
+            return await catalog.search('phantom')
+
+        self.assertEqual(len(asyncio.run(runner())), 1)
+        self.assertEqual(self.calls, [None])
+
+    def test_fresh_disk_copy_skips_network(self):
+        """Test that a new process loads the saved catalog instead of downloading it"""
+        asyncio.run(SkinCatalog(self.fetch, self.path).ensure_loaded())
+        self.calls.clear()
+        results = asyncio.run(SkinCatalog(self.fetch, self.path).search('prime'))
+        self.assertEqual(len(results), 2)
+        self.assertEqual(self.calls, [])
+
+    def test_stale_copy_revalidates_with_etag(self):
+        """Test that an expired catalog is revalidated in the background with If-None-Match"""
+        asyncio.run(SkinCatalog(self.fetch, self.path).ensure_loaded())
+        self.calls.clear()
+
+        async def runner():
+            catalog = SkinCatalog(self.fetch, self.path, ttl=0)
+            results = await catalog.search('melee')
+            await catalog._refresh_task
+            return catalog, results
+
+        catalog, results = asyncio.run(runner())
+        self.assertEqual(len(results), 1)
+        self.assertEqual(self.calls, ['v1'])
+        self.assertAlmostEqual(catalog.fetched_at, time.time(), delta=5)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
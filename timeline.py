@@ -0,0 +1,98 @@
+"""
+Time-to-first-audio instrumentation for the play commands.
+
+A PlayTimeline is started when a play command arrives and records every
+phase of the request (deferring the response, joining the voice channel,
+looking the track up, starting FFmpeg, ...) as a window relative to that
+start, so phases that overlap show as overlapping. The timeline ends when
+the player reads the first audio frame from the source, which is the
+closest the bot gets to "the user hears something".
+
+Finished timelines are printed as one line each and kept in a
+TimelineStats, which gives percentiles of the total and of every phase
+over the most recent requests.
+"""
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class PlayTimeline:
+    def __init__(self, command, guild_id, clock=time.perf_counter):
+        self.command = command
+        self.guild_id = guild_id
+        self.clock = clock
+        self.started = clock()
+        self.phases = []  # (name, start, end) in seconds since started
+        self.first_audio = None
+
+    def _now(self):
+        return self.clock() - self.started
+
+    @contextmanager
+    def phase(self, name):
+        start = self._now()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start, self._now()))
+
+    async def measure(self, name, awaitable):
+        """Await `awaitable` as phase `name`; usable inside a task to time concurrent work."""
+        with self.phase(name):
+            return await awaitable
+
+    def watch_first_frame(self, source, loop, done):
+        """Record the first frame the player reads from `source`, then call `done(self)` on `loop`."""
+        read = source.read
+
+        def first_read():
+            data = read()
+            # Runs on the player thread: restore the plain read before anything else
+            source.read = read
+            self.first_audio = self._now()
+            loop.call_soon_threadsafe(done, self)
+            return data
+
+        source.read = first_read
+
+    def durations(self):
+        totals = {}
+        for name, start, end in self.phases:
+            totals[name] = totals.get(name, 0.0) + end - start
+        return totals
+
+    def __str__(self):
+        total = 'no audio' if self.first_audio is None else f'{self.first_audio:.2f}s to first audio'
+        phases = ', '.join(f'{name} {end - start:.2f}s @{start:.2f}' for name, start, end in self.phases)
+        return f'/{self.command} in guild {self.guild_id}: {total} ({phases})'
+
+
+class TimelineStats:
+    def __init__(self, keep=200):
+        self._totals = deque(maxlen=keep)
+        self._phases = {}  # phase -> deque of durations
+        self.keep = keep
+
+    def __len__(self):
+        return len(self._totals)
+
+    def record(self, timeline):
+        if timeline.first_audio is not None:
+            self._totals.append(timeline.first_audio)
+        for name, duration in timeline.durations().items():
+            self._phases.setdefault(name, deque(maxlen=self.keep)).append(duration)
+
+    def summary(self):
+        """p50/p95 in seconds of time to first audio and of every phase, over recent plays."""
+        result = {'first_audio': (percentile(self._totals, 0.5), percentile(self._totals, 0.95))}
+        for name, durations in self._phases.items():
+            result[name] = (percentile(durations, 0.5), percentile(durations, 0.95))
+        return result
@@ -0,0 +1,179 @@
+"""
+Resolved-track cache for /play.
+
+Maps a normalized query or URL to the metadata yt-dlp resolved for it
+(title, video id, page URL, chosen format and its stream URL). Entries are
+kept in memory in LRU order and persisted to a JSON file so they survive
+restarts. Stream URLs expire (googlevideo URLs carry an `expire` parameter),
+so callers check stream_expired() and only re-resolve the stream URL from
+the stored page URL instead of repeating the whole search. Text queries
+can also be looked up fuzzily, so a typo in a query that was played
+before is still served from the cache.
+
+Changes are written with schedule_save(), which saves the whole file once,
+SAVE_DELAY seconds after the first change, so resolving a playlist track
+by track is a few writes rather than one per track.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+from atomic_file import replace_file
+from search_engine import FuzzyIndex, search_key
+
+DEFAULT_STREAM_TTL = 6 * 3600  # used when the stream URL does not say when it expires
+EXPIRY_MARGIN = 120  # re-resolve a bit early so playback never starts on a dying URL
+SAVE_DELAY = float(os.getenv('TRACK_CACHE_SAVE_DELAY', '5'))
+
+
+def is_url(query):
+    parsed = urlparse(query.strip())
+    return bool(parsed.scheme and parsed.netloc)
+
+
+def normalize_query(query):
+    """Return the cache key for a /play argument."""
+    query = query.strip()
+    parsed = urlparse(query)
+    if parsed.scheme and parsed.netloc:
+        host = parsed.netloc.lower().removeprefix('www.').removeprefix('m.').removeprefix('music.')
+        if host == 'youtu.be' and parsed.path.strip('/'):
+            return f'youtube:{parsed.path.strip("/")}'
+        if host == 'youtube.com':
+            video_id = parse_qs(parsed.query).get('v')
+            if video_id:
+                return f'youtube:{video_id[0]}'
+        return f'{host}{parsed.path.rstrip("/")}'
+    return search_key(query)
+
+
+def stream_expiry(stream_url, now=None):
+    """Best guess at the unix time a stream URL stops working."""
+    now = time.time() if now is None else now
+    expire = parse_qs(urlparse(stream_url).query).get('expire')
+    if expire and expire[0].isdigit():
+        return int(expire[0])
+    return int(now + DEFAULT_STREAM_TTL)
+
+
+class TrackCache:
+    def __init__(self, path='track_cache.json', maxsize=1000):
+        self.path = path
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._fuzzy = FuzzyIndex()  # text query keys only
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._save_task = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _find_key(self, query, fuzzy):
+        key = normalize_query(query)
+        if key in self._entries or not fuzzy or is_url(query):
+            return key
+        return self._fuzzy.best(key) or key
+
+    def get(self, query, fuzzy=False):
+        """Cached entry for `query`; with `fuzzy`, a near-identical text query also counts."""
+        with self._lock:
+            key = self._find_key(query, fuzzy)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry)
+
+    def put(self, query, entry):
+        """Store resolved metadata; `entry` needs at least title, webpage_url and stream_url."""
+        entry = dict(entry)
+        entry.setdefault('expires_at', stream_expiry(entry['stream_url']))
+        key = normalize_query(query)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._index_text_key(key)
+            self._evict()
+        return dict(entry)
+
+    def _index_text_key(self, key):
+        # URL keys ('youtube:<id>', 'host/path') never survive search_key() unchanged
+        if key and key == search_key(key):
+            self._fuzzy.add(key, key)
+
+    def _evict(self):
+        while len(self._entries) > self.maxsize:
+            key, _ = self._entries.popitem(last=False)
+            self._fuzzy.discard(key)
+
+    def update_stream(self, query, stream_url, format_id=None, fuzzy=False, codec=None):
+        """Swap in a freshly resolved stream URL for an existing entry."""
+        with self._lock:
+            entry = self._entries.get(self._find_key(query, fuzzy))
+            if entry is None:
+                return None
+            entry['stream_url'] = stream_url
+            entry['expires_at'] = stream_expiry(stream_url)
+            if format_id is not None:
+                entry['format_id'] = format_id
+            if codec is not None:
+                entry['codec'] = codec
+            return dict(entry)
+
+    @staticmethod
+    def stream_expired(entry, now=None):
+        now = time.time() if now is None else now
+        return entry.get('expires_at', 0) - EXPIRY_MARGIN <= now
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f'Could not read track cache {self.path}: {e}')
+            return
+        with self._lock:
+            # The file is written oldest-first, so replaying it restores LRU order
+            for key, entry in stored.items():
+                self._entries[key] = entry
+                self._index_text_key(key)
+            self._evict()
+        print(f'Loaded {len(self._entries)} cached track(s)')
+
+    def save(self):
+        with self._lock:
+            replace_file(self.path, json.dumps(self._entries))
+
+    def schedule_save(self, delay=SAVE_DELAY):
+        """Save in the background after `delay` seconds, together with any other change made meanwhile."""
+        self._dirty = True
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.create_task(self._save_later(delay))
+
+    async def _save_later(self, delay):
+        # Changes made while the file is written get another save
+        while self._dirty:
+            await asyncio.sleep(delay)
+            self._dirty = False
+            try:
+                await asyncio.to_thread(self.save)
+            except OSError as e:
+                print(f'Could not write track cache {self.path}: {e}')
+
+    async def close(self):
+        """Stop the pending background save and write the cache once more."""
+        if self._save_task is not None and not self._save_task.done():
+            self._save_task.cancel()
+        self._dirty = False
+        await asyncio.to_thread(self.save)
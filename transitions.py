@@ -0,0 +1,68 @@
+"""
+Track transitions for voice playback.
+
+discord.py calls the `after` callback of VoiceClient.play() on the voice
+player thread. Blocking there (e.g. waiting on a coroutine's result) holds
+up that thread, so the callback only hands the transition to the event
+loop and returns. Transitions for one guild run one at a time under a
+per-guild lock, and the time from "song ended" to "next song playing" is
+recorded for each one.
+"""
+import asyncio
+import statistics
+import time
+from collections import deque
+
+
+class TransitionScheduler:
+    def __init__(self, history=200):
+        self.latencies = deque(maxlen=history)
+        self.failures = 0
+        self._locks = {}
+        self._requested_at = {}
+        self._tasks = set()
+
+    def lock(self, guild_id):
+        """Lock held while a guild changes track, whoever started the change."""
+        lock = self._locks.get(guild_id)
+        if lock is None:
+            lock = self._locks[guild_id] = asyncio.Lock()
+        return lock
+
+    def request(self, loop, guild_id, advance):
+        """Thread-safe: schedule `advance()` (a coroutine function) on `loop` and return at once."""
+        requested_at = time.perf_counter()
+        loop.call_soon_threadsafe(self._spawn, guild_id, advance, requested_at)
+
+    def _spawn(self, guild_id, advance, requested_at):
+        self._requested_at[guild_id] = requested_at
+        task = asyncio.create_task(self._run(guild_id, advance))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, guild_id, advance):
+        try:
+            await advance()
+        except Exception as e:
+            self.failures += 1
+            print(f"Error moving to the next song in guild {guild_id}: {e}")
+        finally:
+            self._requested_at.pop(guild_id, None)
+
+    def playback_started(self, guild_id):
+        """Record the latency of the pending transition for a guild, if there is one."""
+        requested_at = self._requested_at.pop(guild_id, None)
+        if requested_at is not None:
+            self.latencies.append(time.perf_counter() - requested_at)
+
+    def stats(self):
+        if not self.latencies:
+            return {'transitions': 0, 'failures': self.failures}
+        ordered = sorted(self.latencies)
+        return {
+            'transitions': len(ordered),
+            'failures': self.failures,
+            'p50_ms': statistics.median(ordered) * 1000,
+            'p95_ms': ordered[int(0.95 * (len(ordered) - 1))] * 1000,
+            'max_ms': ordered[-1] * 1000,
+        }
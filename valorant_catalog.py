@@ -0,0 +1,146 @@
+"""
+Local copy of the Valorant weapon skin catalog for /valskin.
+
+The full skins payload from valorant-api.com is several MB, so it is
+fetched once, reduced to the fields the bot uses and kept on disk. It is
+refreshed with a conditional request (ETag) once the TTL runs out, while
+lookups keep being served from the copy already loaded. A full skin name
+is answered from a dictionary; other lookups go through an in-memory
+n-gram index instead of scanning every name, and are ranked by
+search_engine so typos still find the skin.
+"""
+import asyncio
+import json
+import time
+
+from atomic_file import replace_file
+from search_engine import FuzzyIndex
+
+MAX_GRAM = 3
+
+
+def _grams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def compact_skins(payload):
+    """Keep only what /valskin needs from the valorant-api.com response."""
+    skins = []
+    for skin in payload.get('data', []):
+        icon = skin.get('displayIcon')
+        if not icon:
+            # Some skins only carry an icon on their first level
+            icon = next((level.get('displayIcon') for level in skin.get('levels') or [] if level.get('displayIcon')), None)
+        skins.append({'uuid': skin.get('uuid'), 'displayName': skin['displayName'], 'displayIcon': icon})
+    return skins
+
+
+class SkinIndex:
+    """Skin name search: exact names, exact substrings via 1- to 3-gram postings, plus fuzzy matches."""
+
+    def __init__(self, skins):
+        self.skins = skins
+        self.names = [skin['displayName'].lower() for skin in skins]
+        self.by_name = {}
+        self.postings = {}
+        self.fuzzy = FuzzyIndex()
+        for position, name in enumerate(self.names):
+            self.by_name.setdefault(name, []).append(skins[position])
+            self.fuzzy.add(position, name)
+            for size in range(1, MAX_GRAM + 1):
+                for gram in _grams(name, size):
+                    self.postings.setdefault(gram, set()).add(position)
+
+    def __len__(self):
+        return len(self.skins)
+
+    def search(self, query):
+        """Skins ranked by relevance: names containing `query` first, then close misspellings.
+
+        A query that is a skin's full name returns just the skin(s) of that name.
+        """
+        exact = self.by_name.get(query.lower().strip())
+        if exact:
+            return list(exact)
+        substring = set(self.substring_matches(query))
+        scores = {match.doc_id: match.score for match in self.fuzzy.search(query)}
+        for position in substring:
+            scores[position] = scores.get(position, 0.0) + 1.0
+        return [self.skins[position] for position in sorted(scores, key=lambda position: (-scores[position], position))]
+
+    def substring_matches(self, query):
+        """Positions of skins whose name contains `query` (case-insensitive), in catalog order."""
+        query = query.lower().strip()
+        if not query:
+            return []
+        size = min(len(query), MAX_GRAM)
+        candidates = None
+        # Intersect the rarest postings first so the candidate set shrinks quickly
+        for gram in sorted(_grams(query, size), key=lambda gram: len(self.postings.get(gram, ()))):
+            posting = self.postings.get(gram)
+            if not posting:
+                return []
+            candidates = set(posting) if candidates is None else candidates & posting
+            if not candidates:
+                return []
+        return [position for position in sorted(candidates) if query in self.names[position]]
+
+
+class SkinCatalog:
+    def __init__(self, fetch, path='valorant_skins.json', ttl=24 * 3600):
+        self.fetch = fetch  # async (etag) -> (payload or None if unchanged, etag)
+        self.path = path
+        self.ttl = ttl
+        self.index = None
+        self.etag = None
+        self.fetched_at = 0
+        self._refresh_task = None
+
+    async def search(self, query):
+        await self.ensure_loaded()
+        return self.index.search(query)
+
+    async def ensure_loaded(self):
+        if self.index is None:
+            await asyncio.to_thread(self._load)
+        if self.index is None:
+            # Cold start with no copy on disk: this one lookup has to wait for the download
+            await self.refresh()
+        elif time.time() - self.fetched_at > self.ttl:
+            self.refresh_in_background()
+
+    def refresh_in_background(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_logged())
+
+    async def _refresh_logged(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            print(f'Could not refresh the Valorant skin catalog: {e}')
+
+    async def refresh(self):
+        payload, etag = await self.fetch(self.etag if self.index is not None else None)
+        self.fetched_at = time.time()
+        self.etag = etag
+        if payload is not None:
+            skins = compact_skins(payload)
+            self.index = await asyncio.to_thread(SkinIndex, skins)
+            print(f'Loaded {len(skins)} Valorant skins')
+        await asyncio.to_thread(self._save)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f'Could not read skin catalog {self.path}: {e}')
+            return
+        self.index = SkinIndex(stored['skins'])
+        self.etag = stored.get('etag')
+        self.fetched_at = stored.get('fetched_at', 0)
+
+    def _save(self):
+        replace_file(self.path, json.dumps({'fetched_at': self.fetched_at, 'etag': self.etag, 'skins': self.index.skins}))